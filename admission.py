@@ -0,0 +1,275 @@
+"""
+Admission control for /api/chat
+
+Every chat holds a slot for its whole duration (a streamed answer holds it
+until the stream ends), and at most `max_concurrent` slots are handed out.
+Requests beyond that wait in a priority queue: short and non-streaming chats
+(priority 0) are admitted before long streamed ones (priority 1), first come
+first served within a priority. Instead of letting the queue grow until
+everything times out together, a request is turned away early with 503 and a
+Retry-After when the queue is full or its expected wait (queue position times
+the recent average chat duration) passes `max_queue_delay`, and a queued
+request gives up with 503 once it has waited that long. Per-key token
+buckets reject callers over their rate with 429 before they reach the queue.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import metrics
+
+QUEUE_DEPTH = metrics.gauge("chatbot_admission_queue_depth", "Chats waiting for an admission slot")
+IN_FLIGHT = metrics.gauge("chatbot_admission_in_flight", "Chats holding an admission slot")
+QUEUE_WAIT = metrics.histogram(
+    "chatbot_admission_wait_seconds", "Time chats waited in the admission queue", ("priority",))
+REJECTED = metrics.counter("chatbot_admission_rejected_total", "Chats turned away by admission control", ("reason",))
+
+class AdmissionRejected(Exception):
+    """Raised instead of admitting a request; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token; returns 0 on success, else the seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Token bucket per caller key; the least recently seen keys are forgotten past `max_keys`"""
+
+    def __init__(self, rate, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def check(self, key):
+        """Raise AdmissionRejected (429) if `key` is over its rate"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+            if wait:
+                self.limited += 1
+        if wait:
+            REJECTED.inc(reason="rate_limited")
+            raise AdmissionRejected(429, "rate_limited", wait)
+
+    def stats(self):
+        with self._lock:
+            return {"rate_per_second": self.rate, "burst": self.burst, "keys": len(self._buckets),
+                    "limited": self.limited}
+
+class Ticket:
+    """An admission slot; release it (idempotent) when the chat is done"""
+
+    def __init__(self, controller, priority, waited):
+        self._controller = controller
+        self.priority = priority
+        self.waited = waited
+        self.admitted_at = controller.clock()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+class _Waiter:
+    def __init__(self, priority, enqueued_at, loop=None):
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.ticket = None
+        self.cancelled = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class AdmissionController:
+    """Bounded concurrency gate with a priority queue and early rejection"""
+
+    def __init__(self, max_concurrent=64, max_queue=128, max_queue_delay=2.0, rate_limiter=None,
+                 clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_delay = max_queue_delay
+        self.rate_limiter = rate_limiter
+        self.clock = clock
+
+        self._active = 0
+        self._queue = []  # heap of (priority, sequence, waiter)
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Running average of how long a chat holds its slot, used to estimate queueing delay
+        self._hold_seconds = None
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.peak_queued = 0
+
+    def _update_gauges(self):
+        QUEUE_DEPTH.set(self._queued)
+        IN_FLIGHT.set(self._active)
+
+    def expected_wait(self, position):
+        """Estimated seconds until the request at queue `position` (0-based) gets a slot"""
+        if self._hold_seconds is None:
+            return 0.0
+        return (position + 1) * self._hold_seconds / self.max_concurrent
+
+    def _reject(self, reason, retry_after):
+        """Count a rejection and raise it; the caller holds self._lock"""
+        self.rejected += 1
+        REJECTED.inc(reason=reason)
+        raise AdmissionRejected(503, reason, retry_after)
+
+    def _enter(self, key, priority, loop=None):
+        """Admit now (returns a Ticket), or queue (returns a _Waiter); raises AdmissionRejected"""
+        if self.rate_limiter is not None and key is not None:
+            self.rate_limiter.check(key)
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self.admitted += 1
+                self._update_gauges()
+                return Ticket(self, priority, 0.0)
+            if self._queued >= self.max_queue:
+                self._reject("queue_full", self.expected_wait(self._queued) or self.max_queue_delay)
+            expected = self.expected_wait(self._queued)
+            if expected > self.max_queue_delay:
+                self._reject("queue_delay", expected)
+
+            waiter = _Waiter(priority, self.clock(), loop)
+            heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+            self._queued += 1
+            self.queued_total += 1
+            self.peak_queued = max(self.peak_queued, self._queued)
+            self._update_gauges()
+            return waiter
+
+    def _timed_out(self, waiter):
+        """Give up on a queued request; returns its ticket if a slot arrived meanwhile"""
+        with self._lock:
+            if waiter.ticket is not None:
+                return waiter.ticket
+            waiter.cancelled = True
+            self._queued -= 1
+            self._update_gauges()
+        return None
+
+    def _reject_timeout(self):
+        with self._lock:
+            self._reject("queue_timeout", self.expected_wait(self._queued) or self.max_queue_delay)
+
+    def _admitted(self, waiter):
+        QUEUE_WAIT.observe(waiter.ticket.waited, priority=waiter.priority)
+        return waiter.ticket
+
+    def acquire(self, key=None, priority=1):
+        """Block until admitted; raises AdmissionRejected (429 or 503)"""
+        entry = self._enter(key, priority)
+        if isinstance(entry, Ticket):
+            QUEUE_WAIT.observe(0.0, priority=priority)
+            return entry
+        if not entry.event.wait(self.max_queue_delay) and self._timed_out(entry) is None:
+            self._reject_timeout()
+        return self._admitted(entry)
+
+    async def acquire_async(self, key=None, priority=1):
+        """Coroutine version of `acquire`"""
+        entry = self._enter(key, priority, asyncio.get_running_loop())
+        if isinstance(entry, Ticket):
+            QUEUE_WAIT.observe(0.0, priority=priority)
+            return entry
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.future), self.max_queue_delay)
+        except asyncio.TimeoutError:
+            if self._timed_out(entry) is None:
+                self._reject_timeout()
+        except asyncio.CancelledError:
+            # The client went away while queued; hand on a slot that was already granted
+            ticket = self._timed_out(entry)
+            if ticket is not None:
+                ticket.release()
+            raise
+        return self._admitted(entry)
+
+    def _release(self, ticket):
+        now = self.clock()
+        with self._lock:
+            held = now - ticket.admitted_at
+            self._hold_seconds = held if self._hold_seconds is None else 0.9 * self._hold_seconds + 0.1 * held
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter
+                self._queued -= 1
+                self.admitted += 1
+                waiter.ticket = Ticket(self, waiter.priority, now - waiter.enqueued_at)
+                self._update_gauges()
+                waiter.wake()
+                return
+            self._active -= 1
+            self._update_gauges()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_queue_delay": self.max_queue_delay,
+                "in_flight": self._active,
+                "queued": self._queued,
+                "peak_queued": self.peak_queued,
+                "admitted": self.admitted,
+                "queued_total": self.queued_total,
+                "rejected": self.rejected,
+                "avg_hold_seconds": round(self._hold_seconds, 3) if self._hold_seconds is not None else None,
+                "rate_limit": self.rate_limiter.stats() if self.rate_limiter else None
+            }
@@ -0,0 +1,366 @@
+"""
+Answer cache for repeat chat questions
+
+Stores the final text (and the tool calls that produced it) of completed
+chat answers, keyed by the normalized question, the ids of the retrieved
+chunks, the model, the temperature (bucketed to 0.1) and the corpus version,
+so a repeat question over an unchanged corpus is answered without calling
+Groq. Entries live in a size-bounded LRU in memory and, optionally, in a
+sqlite file that survives restarts. When the corpus version changes every
+entry is dropped.
+
+SemanticAnswerCache extends this to paraphrases: it embeds each question on
+the CPU (with the local index embedders) and serves the answer to the most
+similar recent question when the similarity clears a threshold and the two
+questions retrieved largely the same chunks.
+"""
+
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from search_cache import normalize_query
+from tracing import metrics
+
+ANSWER_CACHE_LOOKUPS = metrics.counter(
+    "chatbot_answer_cache_lookups_total", "Answer cache lookups by result", ("result",))
+
+def answer_key(message, chunk_ids, model, temperature, corpus_version=None):
+    """Digest identifying one answer; chunk order matters because it is the prompt order"""
+    payload = [normalize_query(message), [str(chunk_id) for chunk_id in chunk_ids], model,
+               round(float(temperature), 1), corpus_version]
+    return hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest()
+
+def replay_chunks(text, chunk_chars):
+    """Split text into pieces of about `chunk_chars`, breaking after whitespace; <= 0 keeps it whole"""
+    if chunk_chars <= 0 or len(text) <= chunk_chars:
+        return [text] if text else []
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+class AnswerCache:
+    """Thread-safe LRU of answers, optionally backed by a sqlite file"""
+
+    def __init__(self, max_entries=500, max_bytes=8 * 1024 * 1024, path=None, disk_max_entries=10000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+
+        self._entries = OrderedDict()  # key -> (size, entry)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.corpus_version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, entry TEXT, used_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_used_at ON answers (used_at)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'corpus_version'").fetchone()
+            self.corpus_version = row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Answer cache file {path} is unusable, caching in memory only: {e}")
+            self._db = None
+
+    def get(self, key):
+        """Return the cached entry ({"text", "tool_calls", "created_at"}) or None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                ANSWER_CACHE_LOOKUPS.inc(result="hit")
+                return item[1]
+            entry = self._disk_get(key)
+            if entry is None:
+                self.misses += 1
+                ANSWER_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.disk_hits += 1
+            ANSWER_CACHE_LOOKUPS.inc(result="disk_hit")
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key, text, tool_calls=None):
+        """Store a completed answer"""
+        if not text:
+            return
+        entry = {"text": text, "tool_calls": tool_calls or [], "created_at": time.time()}
+        with self._lock:
+            self.stores += 1
+            self._remember(key, entry)
+            self._disk_put(key, entry)
+
+    def _remember(self, key, entry):
+        size = len(entry["text"]) + len(json.dumps(entry["tool_calls"], default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[0]
+        self._entries[key] = (size, entry)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (oldest_size, _) = self._entries.popitem(last=False)
+            self._bytes -= oldest_size
+            self.evictions += 1
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT entry FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE answers SET used_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error reading the answer cache file: {e}")
+            return None
+
+    def _disk_put(self, key, entry):
+        if self._db is None:
+            return
+        try:
+            self._db.execute("INSERT OR REPLACE INTO answers (key, entry, used_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(entry, default=str), time.time()))
+            # Trim the least recently used rows once the file holds more than disk_max_entries
+            self._db.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,))
+        except sqlite3.Error as e:
+            print(f"Error writing the answer cache file: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM answers")
+            except sqlite3.Error as e:
+                print(f"Error clearing the answer cache file: {e}")
+
+    def set_corpus_version(self, version):
+        """Record the corpus version, dropping every answer if it changed"""
+        with self._lock:
+            if version is None or version == self.corpus_version:
+                return
+            if self.corpus_version is not None:
+                self._clear()
+                self.invalidations += 1
+            self.corpus_version = version
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('corpus_version', ?)",
+                                     (version,))
+                except sqlite3.Error as e:
+                    print(f"Error writing the answer cache file: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            disk_entries = None
+            if self._db is not None:
+                try:
+                    disk_entries = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "path": self.path,
+                "disk_entries": disk_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "corpus_version": self.corpus_version
+            }
+
+class SemanticAnswerCache:
+    """Answers to recent questions, looked up by embedding similarity
+
+    Question embeddings sit in a fixed-size ring of rows in a NumPy matrix,
+    so a lookup is one matrix-vector product over at most `max_entries`
+    rows. A hit needs cosine similarity >= `threshold`, retrieved chunks
+    whose overlap (Jaccard) with the cached answer's is >= `min_chunk_overlap`,
+    and the same model, temperature bucket and corpus version. Questions that
+    read alike but ask about a different year or region retrieve different
+    chunks, so the chunk check stops them sharing an answer. A
+    `sample_rate` fraction of hits is kept (question, matched question,
+    similarity) so false hits can be reviewed.
+    """
+
+    def __init__(self, embedder, threshold=0.9, max_entries=2000, sample_rate=0.0, max_samples=100,
+                 min_chunk_overlap=0.5):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.min_chunk_overlap = min_chunk_overlap
+        self.max_entries = max_entries
+        self.sample_rate = sample_rate
+
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        # Questions embedded by recent lookups, so storing their answers needs no second embedding
+        self._recent_vectors = OrderedDict()
+        self._random = random.Random()
+
+        self.corpus_version = None
+        self.lookups = 0
+        self.hits = 0
+        self.invalidations = 0
+        self._lookup_seconds = deque(maxlen=1000)
+        self.samples = deque(maxlen=max_samples)
+
+    def _embed(self, question):
+        with self._lock:
+            vector = self._recent_vectors.get(question)
+        if vector is None:
+            vector = self.embedder.embed([question])[0]
+            with self._lock:
+                self._recent_vectors[question] = vector
+                while len(self._recent_vectors) > 256:
+                    self._recent_vectors.popitem(last=False)
+        return vector
+
+    def _chunks_overlap(self, cached, chunk_ids):
+        if not cached or not chunk_ids:
+            return False
+        return len(cached & chunk_ids) / len(cached | chunk_ids) >= self.min_chunk_overlap
+
+    def lookup(self, question, model, temperature, chunk_ids=()):
+        """Return (entry, similarity) for the closest matching cached question, else None
+
+        `chunk_ids` are the ids of the chunks retrieved for `question`; without
+        any there is nothing to compare and the lookup misses.
+        """
+        import numpy as np
+
+        started = time.perf_counter()
+        chunk_ids = frozenset(str(chunk_id) for chunk_id in chunk_ids)
+        vector = self._embed(question) if chunk_ids else None
+        match = None
+        with self._lock:
+            self.lookups += 1
+            if self._count and chunk_ids:
+                scores = self._vectors[:self._count] @ vector
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for row in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                    entry = self._entries[row]
+                    if (entry["model"] == model and entry["temperature"] == round(float(temperature), 1)
+                            and entry["corpus_version"] == self.corpus_version
+                            and self._chunks_overlap(entry["chunk_ids"], chunk_ids)):
+                        match = (entry, float(scores[row]))
+                        break
+                if match is not None:
+                    entry, similarity = match
+                    self.hits += 1
+                    if self.sample_rate and self._random.random() < self.sample_rate:
+                        self.samples.append({"question": question, "matched": entry["question"],
+                                             "similarity": round(similarity, 4)})
+            self._lookup_seconds.append(time.perf_counter() - started)
+        ANSWER_CACHE_LOOKUPS.inc(result="semantic_hit" if match else "semantic_miss")
+        return match
+
+    def put(self, question, text, tool_calls, model, temperature, chunk_ids=()):
+        """Remember a completed answer and the ids of its context chunks, replacing the oldest one when full"""
+        chunk_ids = frozenset(str(chunk_id) for chunk_id in chunk_ids)
+        if not text or not chunk_ids or self.max_entries <= 0:
+            return
+        import numpy as np
+
+        vector = self._embed(question)
+        entry = {"question": question, "text": text, "tool_calls": tool_calls or [], "model": model,
+                 "chunk_ids": chunk_ids,
+                 "temperature": round(float(temperature), 1), "corpus_version": self.corpus_version,
+                 "created_at": time.time()}
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            row = self._next
+            self._vectors[row] = vector
+            self._entries[row] = entry
+            self._next = (row + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries = [None] * self.max_entries
+        self._count = 0
+        self._next = 0
+
+    def set_corpus_version(self, version):
+        """Record the corpus version, dropping every answer if it changed"""
+        with self._lock:
+            if version is None or version == self.corpus_version:
+                return
+            if self.corpus_version is not None:
+                self._clear()
+                self.invalidations += 1
+            self.corpus_version = version
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._lookup_seconds)
+            samples = list(self.samples)
+
+            def ms(pct):
+                return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 3) if latencies else None
+
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "model": self.embedder.name,
+                "threshold": self.threshold,
+                "min_chunk_overlap": self.min_chunk_overlap,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else None,
+                "lookup_ms_p50": ms(50),
+                "lookup_ms_p95": ms(95),
+                "invalidations": self.invalidations,
+                "corpus_version": self.corpus_version,
+                "sample_rate": self.sample_rate,
+                "samples": samples
+            }
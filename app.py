@@ -1,12 +1,36 @@
 from flask import Flask, request, jsonify, Response, stream_template
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
 import json
 import time
+import hashlib
 import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from admission import AdmissionController, AdmissionRejected, RateLimiter
+from answer_cache import AnswerCache, SemanticAnswerCache, answer_key, replay_chunks
+from context_builder import build_context, estimate_tokens, fit_tool_result
+from corpus_sync import CorpusSync
+from json_stream import STREAM_CHUNK_BYTES, JSONArrayParser
+from listings import CHUNK_FIELDS, DOCUMENT_FIELDS, Page, paginate, parse_listing_query
+from llm_client import LLMClientManager
+from model_router import ModelRouter, ModelTier, prime_stream
+from local_index import DEFAULT_MODEL, HashingEmbedder, LocalVectorIndex, load_embedder
+from prompts import PromptTemplates
+from resilience import DocMgrResilience, DocMgrUnavailable, deadline_scope
+from retrieval import BM25Index, HybridRetriever, chunk_key, load_reranker
+from sessions import SessionStore
+from search_cache import SearchCache, corpus_fingerprint
+from single_flight import SingleFlight, coalesced
+from sse import SSEWriter, encode_event
+from tool_calls import ToolCallAccumulator
+from tracing import REQUEST_DURATION, REQUESTS_TOTAL, TIME_TO_FIRST_TOKEN, RequestTrace, metrics, observe_upstream
 
 load_dotenv()
 
@@ -17,85 +41,574 @@ CORS(app)
 DOCMGR_BASE_URL = os.getenv('DOCMGR_BASE_URL', 'http://localhost:8000')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
+# DocMgr HTTP client tuning
+DOCMGR_POOL_SIZE = int(os.getenv('DOCMGR_POOL_SIZE', '20'))
+DOCMGR_POOL_BLOCK = os.getenv('DOCMGR_POOL_BLOCK', 'false').lower() in ('1', 'true', 'yes')
+DOCMGR_CONNECT_TIMEOUT = float(os.getenv('DOCMGR_CONNECT_TIMEOUT', '3.05'))
+DOCMGR_READ_TIMEOUT = float(os.getenv('DOCMGR_READ_TIMEOUT', '30'))
+DOCMGR_MAX_RETRIES = int(os.getenv('DOCMGR_MAX_RETRIES', '2'))
+DOCMGR_RETRY_BACKOFF = float(os.getenv('DOCMGR_RETRY_BACKOFF', '0.3'))
+
+# DocMgr resilience: per-operation circuit breakers, hedged searches and the chat deadline (0 disables each)
+DOCMGR_BREAKER_FAILURES = int(os.getenv('DOCMGR_BREAKER_FAILURES', '5'))
+DOCMGR_BREAKER_RESET = float(os.getenv('DOCMGR_BREAKER_RESET_MS', '10000')) / 1000
+DOCMGR_HEDGE_PERCENTILE = float(os.getenv('DOCMGR_HEDGE_PERCENTILE', '95'))
+DOCMGR_HEDGE_MIN_SAMPLES = int(os.getenv('DOCMGR_HEDGE_MIN_SAMPLES', '20'))
+CHAT_DEADLINE = float(os.getenv('CHAT_DEADLINE_MS', '20000')) / 1000
+
+# Groq client tuning
+GROQ_POOL_SIZE = int(os.getenv('GROQ_POOL_SIZE', '20'))
+GROQ_CONNECT_TIMEOUT = float(os.getenv('GROQ_CONNECT_TIMEOUT', '5'))
+GROQ_READ_TIMEOUT = float(os.getenv('GROQ_READ_TIMEOUT', '60'))
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '2'))
+GROQ_CHAT_MODEL = os.getenv('GROQ_CHAT_MODEL', 'llama3-8b-8192')
+GROQ_TEMPERATURE = float(os.getenv('GROQ_TEMPERATURE', '0.7'))
+
+# Model routing: GROQ_CHAT_MODEL is the fast tier, GROQ_LARGE_MODEL (optional) takes long prompts
+GROQ_LARGE_MODEL = os.getenv('GROQ_LARGE_MODEL', '')
+GROQ_FALLBACK_MODELS = [model.strip() for model in os.getenv('GROQ_FALLBACK_MODELS', '').split(',') if model.strip()]
+GROQ_FAST_MAX_TOKENS = int(os.getenv('GROQ_FAST_MAX_TOKENS', '1000'))
+GROQ_LARGE_MAX_TOKENS = int(os.getenv('GROQ_LARGE_MAX_TOKENS', '1000'))
+MODEL_ROUTER_LARGE_PROMPT_TOKENS = int(os.getenv('MODEL_ROUTER_LARGE_PROMPT_TOKENS', '1200'))
+MODEL_HEDGE_TTFT = float(os.getenv('MODEL_HEDGE_TTFT_MS', '2000')) / 1000
+MODEL_HEALTH_WINDOW = int(os.getenv('MODEL_HEALTH_WINDOW', '50'))
+MODEL_MAX_ERROR_RATE = float(os.getenv('MODEL_MAX_ERROR_RATE', '0.5'))
+
+# Prompt token budgets
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '2500'))
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv('TOOL_RESULT_TOKEN_BUDGET', '3000'))
+# Document and chunk listing tools return pages of TOOL_LISTING_DEFAULT_LIMIT items unless the model asks
+# for another `limit`, capped at TOOL_RESULT_MAX_ITEMS (0 = no cap); a page also stops at the token budget
+TOOL_LISTING_DEFAULT_LIMIT = int(os.getenv('TOOL_LISTING_DEFAULT_LIMIT', '20'))
+TOOL_RESULT_MAX_ITEMS = int(os.getenv('TOOL_RESULT_MAX_ITEMS', '100'))
+
+# SSE content coalescing (a window of 0 sends every token as its own event)
+SSE_COALESCE_WINDOW = float(os.getenv('SSE_COALESCE_WINDOW_MS', '30')) / 1000
+SSE_COALESCE_MAX_BYTES = int(os.getenv('SSE_COALESCE_MAX_BYTES', '2048'))
+
+# Concurrent tool execution
+TOOL_CALL_WORKERS = int(os.getenv('TOOL_CALL_WORKERS', '8'))
+
+# Admission control for /api/chat (0 disables the concurrency gate / the per-key rate limit)
+CHAT_MAX_CONCURRENT = int(os.getenv('CHAT_MAX_CONCURRENT', '64'))
+CHAT_MAX_QUEUE = int(os.getenv('CHAT_MAX_QUEUE', '128'))
+CHAT_MAX_QUEUE_DELAY = float(os.getenv('CHAT_MAX_QUEUE_DELAY_MS', '2000')) / 1000
+CHAT_SHORT_MESSAGE_CHARS = int(os.getenv('CHAT_SHORT_MESSAGE_CHARS', '200'))
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '0'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '10'))
+
+# Multi-turn conversation sessions (SESSION_MAX_ENTRIES=0 disables them)
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_HISTORY_TOKENS = int(os.getenv('SESSION_HISTORY_TOKENS', '1500'))
+SESSION_MAX_CHUNKS = int(os.getenv('SESSION_MAX_CHUNKS', '12'))
+SESSION_MAX_TOOL_RESULTS = int(os.getenv('SESSION_MAX_TOOL_RESULTS', '8'))
+# Tool calls scoped to one document, whose results a session reuses until the corpus changes
+SESSION_REUSABLE_TOOLS = ('get_document_by_id', 'get_document_chunks')
+
+# Search result cache
+SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '1000'))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+SEARCH_CACHE_STALE_TTL = float(os.getenv('SEARCH_CACHE_STALE_TTL', '3600'))
+
+# Identical concurrent DocMgr calls share one upstream request
+DOCMGR_SINGLE_FLIGHT = os.getenv('DOCMGR_SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes')
+CORPUS_CHECK_INTERVAL = float(os.getenv('CORPUS_CHECK_INTERVAL', '30'))
+
+# In-process embedding index (search without a DocMgr round-trip)
+LOCAL_INDEX_ENABLED = os.getenv('LOCAL_INDEX_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+LOCAL_INDEX_DIR = os.getenv('LOCAL_INDEX_DIR', 'local_index')
+LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', DEFAULT_MODEL)
+
+# Incremental corpus sync feeding the local index and the keyword index
+CORPUS_SYNC_INTERVAL = float(os.getenv('CORPUS_SYNC_INTERVAL', '300'))
+CORPUS_SYNC_WORKERS = int(os.getenv('CORPUS_SYNC_WORKERS', '4'))
+CORPUS_LISTING_MAX_AGE = float(os.getenv('CORPUS_LISTING_MAX_AGE', '60'))
+
+# Chat context retrieval (hybrid = vector + BM25 with rank fusion and optional reranking)
+CHAT_CONTEXT_RESULTS = int(os.getenv('CHAT_CONTEXT_RESULTS', '3'))
+HYBRID_RETRIEVAL_ENABLED = os.getenv('HYBRID_RETRIEVAL_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '20'))
+RETRIEVAL_RRF_K = int(os.getenv('RETRIEVAL_RRF_K', '60'))
+RETRIEVAL_VECTOR_BUDGET = float(os.getenv('RETRIEVAL_VECTOR_BUDGET_MS', '800')) / 1000
+RETRIEVAL_RERANK_MODEL = os.getenv('RETRIEVAL_RERANK_MODEL', '')
+RETRIEVAL_RERANK_BUDGET = float(os.getenv('RETRIEVAL_RERANK_BUDGET_MS', '150')) / 1000
+
+# Pipelined chat: retrieval runs in the background while the Groq client and connection are prepared
+CHAT_PIPELINE_DEFAULT = os.getenv('CHAT_PIPELINE_DEFAULT', 'false').lower() in ('1', 'true', 'yes')
+CHAT_PIPELINE_ACK_DELAY = float(os.getenv('CHAT_PIPELINE_ACK_DELAY_MS', '250')) / 1000
+CHAT_PIPELINE_WORKERS = int(os.getenv('CHAT_PIPELINE_WORKERS', '16'))
+
+# Answer cache for repeat questions (opt-in); a replay interval of 0 sends a cached answer as one event
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '500'))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv('ANSWER_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', '')
+ANSWER_CACHE_DISK_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_DISK_MAX_ENTRIES', '10000'))
+ANSWER_CACHE_REPLAY_CHARS = int(os.getenv('ANSWER_CACHE_REPLAY_CHARS', '40'))
+ANSWER_CACHE_REPLAY_INTERVAL = float(os.getenv('ANSWER_CACHE_REPLAY_INTERVAL_MS', '0')) / 1000
+# Seconds between DocMgr fingerprints for the answer caches when neither corpus sync nor the search cache runs
+ANSWER_CACHE_VERSION_INTERVAL = float(os.getenv('ANSWER_CACHE_VERSION_INTERVAL', '30'))
+
+# Semantic answer cache: serve the answer to a similar recent question (embedded with LOCAL_EMBEDDING_MODEL)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2000'))
+SEMANTIC_CACHE_SAMPLE_RATE = float(os.getenv('SEMANTIC_CACHE_SAMPLE_RATE', '0'))
+SEMANTIC_CACHE_MIN_CHUNK_OVERLAP = float(os.getenv('SEMANTIC_CACHE_MIN_CHUNK_OVERLAP', '0.5'))
+
+def docmgr_operation(method, path):
+    """Metric label for a DocMgr call, with document ids collapsed"""
+    parts = path.split("/")
+    if len(parts) > 3 and parts[1:3] == ["api", "documents"]:
+        parts[3] = "{id}"
+    return f"{method} {'/'.join(parts) or '/'}"
+
+SEARCH_OPERATION = docmgr_operation("POST", "/api/search")
+
+# Time left for a chat, sent by the caller and passed on to DocMgr
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+
 class ChatbotAPI:
-    def __init__(self, base_url):
+    def __init__(self, base_url, pool_size=DOCMGR_POOL_SIZE, connect_timeout=DOCMGR_CONNECT_TIMEOUT,
+                 read_timeout=DOCMGR_READ_TIMEOUT, max_retries=DOCMGR_MAX_RETRIES,
+                 backoff_factor=DOCMGR_RETRY_BACKOFF, pool_block=DOCMGR_POOL_BLOCK, search_cache=None,
+                 local_index=None, single_flight=None, resilience=None):
         self.base_url = base_url
+        self.search_cache = search_cache
+        self.local_index = local_index
+        self.single_flight = single_flight
+        self.resilience = resilience
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        
+        # Keep-alive session shared by every call so DocMgr connections are reused.
+        # Only GETs are retried; POST /api/search is left to the caller.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=pool_block
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+        
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._total_requests = 0
+        self._saturated_requests = 0
     
+    def _request(self, method, path, **kwargs):
+        """Send a request through the pooled session, tracking pool usage
+        
+        Raises DocMgrUnavailable, without sending anything, while the
+        operation's breaker is open or once the request's deadline has passed;
+        within a deadline the timeouts are cut to the time left.
+        """
+        operation = docmgr_operation(method, path)
+        timeout = kwargs.pop("timeout", self.timeout)
+        remaining = self.resilience.admit(operation) if self.resilience is not None else None
+        if remaining is not None:
+            timeout = tuple(min(part, remaining) for part in timeout)
+            kwargs["headers"] = {**kwargs.get("headers", {}), DEADLINE_HEADER: str(int(remaining * 1000))}
+        kwargs["timeout"] = timeout
+        with self._stats_lock:
+            self._in_flight += 1
+            self._total_requests += 1
+            if self._in_flight > self.pool_size:
+                self._saturated_requests += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        started = time.perf_counter()
+        status = "error"
+        ok = None
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            status = response.status_code
+            ok = status < 500
+            return response
+        except requests.exceptions.Timeout:
+            # A timeout cut short by the deadline says nothing about DocMgr's health
+            ok = None if remaining is not None and remaining < self.timeout[1] else False
+            raise
+        except requests.exceptions.RequestException:
+            ok = False
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            observe_upstream("docmgr", operation, status, duration)
+            if self.resilience is not None:
+                self.resilience.record(operation, duration, ok)
+            with self._stats_lock:
+                self._in_flight -= 1
+    
+    def pool_stats(self):
+        """Report connection pool usage so the pool can be sized"""
+        connections_opened = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+        
+        with self._stats_lock:
+            return {
+                "pool_size": self.pool_size,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "total_requests": self._total_requests,
+                "saturated_requests": self._saturated_requests,
+                "connections_opened": connections_opened,
+                "connect_timeout": self.timeout[0],
+                "read_timeout": self.timeout[1]
+            }
+    
+    def refresh_corpus_version(self):
+        """Fingerprint DocMgr's document set so cached results can be invalidated (None while it is unavailable)"""
+        try:
+            stats = self.get_vector_stats()
+            documents = None if stats else self.get_all_documents()
+        except DocMgrUnavailable as e:
+            print(f"Error fingerprinting the DocMgr corpus: {e}")
+            return None
+        return corpus_fingerprint(stats, documents)
+    
+    @coalesced(key=lambda query, n_results=5: SearchCache.make_key(query, n_results))
     def search_documents(self, query, n_results=5):
         """Search for relevant document chunks"""
+        cache = self.search_cache
+        generation = None
+        if cache is not None:
+            if cache.claim_version_check():
+                version = None
+                try:
+                    version = self.refresh_corpus_version()
+                finally:
+                    cache.set_corpus_version(version)
+            cached = cache.get(query, n_results)
+            if cached is not None:
+                return cached
+            generation = cache.generation
+        
+        local_index = self.local_index
+        if local_index is not None and local_index.ready:
+            started = time.perf_counter()
+            results = local_index.search(query, n_results)
+            observe_upstream("local_index", "search", "ok", time.perf_counter() - started)
+        else:
+            try:
+                if self.resilience is not None:
+                    # A search slower than DocMgr's recent p95 is raced against a duplicate
+                    results = self.resilience.hedged(SEARCH_OPERATION, lambda: self._post_search(query, n_results))
+                else:
+                    results = self._post_search(query, n_results)
+            except (requests.exceptions.RequestException, DocMgrUnavailable) as e:
+                print(f"Error searching documents: {e}")
+                # While DocMgr is down or slow, expired results beat none
+                stale = cache.get_stale(query, n_results) if cache is not None else None
+                return stale if stale is not None else []
+        
+        if cache is not None and results:
+            cache.put(query, n_results, results, generation)
+        return results
+    
+    def _get_items(self, path, listing=None, max_tokens=None):
+        """GET a JSON array, parsing each item as it arrives
+        
+        With a `listing` query (see listings.Page) only that page is returned:
+        reading stops, and the connection is closed, as soon as the page is
+        full or the next item would not fit in `max_tokens`.
+        """
+        response = self._request("GET", path, stream=True)
         try:
-            response = requests.post(
-                f"{self.base_url}/api/search",
-                json={"query": query, "n_results": n_results}
-            )
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error searching documents: {e}")
-            return []
+            parser = JSONArrayParser()
+            page = Page(listing, max_tokens) if listing is not None else None
+            items = []
+            for data in response.iter_content(STREAM_CHUNK_BYTES):
+                for item in parser.feed(data):
+                    if page is None:
+                        items.append(item)
+                    elif not page.add(item):
+                        return page.result()
+                if parser.done:
+                    break
+            value = parser.close()
+            if value is not None:
+                return value
+            return items if page is None else page.result()
+        except ValueError as e:
+            raise requests.exceptions.InvalidJSONError(f"Invalid JSON from DocMgr: {e}")
+        finally:
+            response.close()
+    
+    def _post_search(self, query, n_results):
+        response = self._request(
+            "POST",
+            "/api/search",
+            json={"query": query, "n_results": n_results}
+        )
+        response.raise_for_status()
+        return response.json()
     
-    def get_document_chunks(self, document_id):
-        """Get chunks for a specific document"""
+    @coalesced()
+    def get_document_chunks(self, document_id, listing=None, max_tokens=None):
+        """Get chunks for a specific document, or one page of them for a ListingQuery"""
         try:
-            response = requests.get(
-                f"{self.base_url}/api/documents/{document_id}/chunks"
-            )
-            response.raise_for_status()
-            return response.json()
+            return self._get_items(f"/api/documents/{document_id}/chunks", listing, max_tokens)
         except requests.exceptions.RequestException as e:
             print(f"Error getting document chunks: {e}")
             return []
     
-    def get_all_documents(self):
-        """Get all documents"""
+    @coalesced()
+    def get_all_documents(self, listing=None, max_tokens=None):
+        """Get all documents, or one filtered page of them for a ListingQuery"""
         try:
-            response = requests.get(f"{self.base_url}/api/documents")
-            response.raise_for_status()
-            return response.json()
+            return self._get_items("/api/documents", listing, max_tokens)
         except requests.exceptions.RequestException as e:
             print(f"Error getting all documents: {e}")
             return []
     
+    @coalesced()
     def get_document_by_id(self, document_id):
         """Get a specific document by ID"""
         try:
-            response = requests.get(f"{self.base_url}/api/documents/{document_id}")
+            response = self._request("GET", f"/api/documents/{document_id}")
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Error getting document {document_id}: {e}")
             return None
     
+    @coalesced()
     def get_vector_stats(self):
         """Get vector collection statistics"""
         try:
-            response = requests.get(f"{self.base_url}/api/vector/stats")
+            response = self._request("GET", "/api/vector/stats")
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Error getting vector stats: {e}")
             return None
     
+    @coalesced()
     def get_api_info(self):
         """Get API information and available endpoints"""
         try:
-            response = requests.get(f"{self.base_url}/")
+            response = self._request("GET", "/")
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Error getting API info: {e}")
             return None
 
-chatbot_api = ChatbotAPI(DOCMGR_BASE_URL)
+search_cache = SearchCache(
+    ttl=SEARCH_CACHE_TTL,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    max_bytes=SEARCH_CACHE_MAX_BYTES,
+    version_check_interval=CORPUS_CHECK_INTERVAL,
+    stale_ttl=SEARCH_CACHE_STALE_TTL
+) if SEARCH_CACHE_ENABLED else None
+
+embedder = load_embedder(LOCAL_EMBEDDING_MODEL) if LOCAL_INDEX_ENABLED or SEMANTIC_CACHE_ENABLED else None
+
+local_index = LocalVectorIndex(LOCAL_INDEX_DIR, embedder) if LOCAL_INDEX_ENABLED else None
+
+# Shared with the ASGI client so both serving modes see the same breakers
+docmgr_resilience = DocMgrResilience(
+    failure_threshold=DOCMGR_BREAKER_FAILURES,
+    reset_timeout=DOCMGR_BREAKER_RESET,
+    hedge_percentile=DOCMGR_HEDGE_PERCENTILE,
+    hedge_min_samples=DOCMGR_HEDGE_MIN_SAMPLES
+)
+
+chatbot_api = ChatbotAPI(DOCMGR_BASE_URL, search_cache=search_cache, local_index=local_index,
+                         single_flight=SingleFlight() if DOCMGR_SINGLE_FLIGHT else None,
+                         resilience=docmgr_resilience)
+
+keyword_index = BM25Index() if HYBRID_RETRIEVAL_ENABLED else None
+
+hybrid_retriever = HybridRetriever(
+    keyword_index,
+    chatbot_api.search_documents,
+    reranker=load_reranker(RETRIEVAL_RERANK_MODEL),
+    candidates=RETRIEVAL_CANDIDATES,
+    rrf_k=RETRIEVAL_RRF_K,
+    vector_budget=RETRIEVAL_VECTOR_BUDGET,
+    rerank_budget=RETRIEVAL_RERANK_BUDGET
+) if keyword_index is not None else None
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=ANSWER_CACHE_MAX_BYTES,
+    path=ANSWER_CACHE_PATH or None,
+    disk_max_entries=ANSWER_CACHE_DISK_MAX_ENTRIES
+) if ANSWER_CACHE_ENABLED else None
+
+semantic_cache = SemanticAnswerCache(
+    embedder,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    sample_rate=SEMANTIC_CACHE_SAMPLE_RATE,
+    min_chunk_overlap=SEMANTIC_CACHE_MIN_CHUNK_OVERLAP
+) if SEMANTIC_CACHE_ENABLED else None
+if semantic_cache is not None and isinstance(embedder, HashingEmbedder):
+    # Hashed word features score questions that differ only in a year or a name as near-identical
+    print("The semantic answer cache needs a sentence-transformers model, not the hashing embedder; disabling it")
+    semantic_cache = None
+
+sessions = SessionStore(
+    max_sessions=SESSION_MAX_ENTRIES,
+    ttl=SESSION_TTL,
+    history_tokens=SESSION_HISTORY_TOKENS,
+    max_chunks=SESSION_MAX_CHUNKS,
+    max_tool_results=SESSION_MAX_TOOL_RESULTS,
+    reusable_tools=SESSION_REUSABLE_TOOLS
+) if SESSION_MAX_ENTRIES > 0 else None
+
+def set_answer_corpus_version(version):
+    """Tell the answer caches which corpus version new lookups must match"""
+    for cache in (answer_cache, semantic_cache):
+        if cache is not None:
+            cache.set_corpus_version(version)
+
+def apply_corpus_changes(changed, removed, corpus_version):
+    """Hand one sync pass's changes to every local copy of the corpus"""
+    set_answer_corpus_version(corpus_version)
+    if local_index is not None:
+        local_index.apply_changes(changed, removed, corpus_version)
+    if keyword_index is not None:
+        keyword_index.apply_changes(changed, removed, corpus_version)
+
+corpus_sync = None
+if local_index is not None or keyword_index is not None:
+    # Only documents that changed since the last pass (or the last run) are fetched and indexed
+    corpus_sync = CorpusSync(
+        chatbot_api,
+        os.path.join(LOCAL_INDEX_DIR, 'sync_state.json'),
+        apply_corpus_changes,
+        workers=CORPUS_SYNC_WORKERS
+    )
+    # The keyword index lives in memory; rebuild it from the on-disk local index when there is one
+    restored = local_index is not None and local_index.load()
+    if restored and keyword_index is not None:
+        keyword_index.rebuild(local_index.all_chunks())
+    if not restored:
+        corpus_sync.reset()
+    set_answer_corpus_version(corpus_sync.corpus_version)
+    corpus_sync.start(CORPUS_SYNC_INTERVAL)
+
+def watch_corpus_version(interval):
+    """Fingerprint DocMgr for the answer caches now and then every `interval` seconds from a daemon thread"""
+    def run():
+        while True:
+            try:
+                set_answer_corpus_version(chatbot_api.refresh_corpus_version())
+            except Exception as e:
+                print(f"Error fingerprinting the DocMgr corpus: {e}")
+            time.sleep(max(interval, 1.0))
+
+    thread = threading.Thread(target=run, name="corpus-version", daemon=True)
+    thread.start()
+    return thread
+
+if (answer_cache is not None or semantic_cache is not None) and corpus_sync is None and search_cache is None:
+    # Nothing else tracks the corpus, so the answer caches fingerprint it on their own schedule
+    watch_corpus_version(ANSWER_CACHE_VERSION_INTERVAL)
+
+NO_DOCUMENTS_MESSAGE = "I don't have any relevant documents to answer your question. Please try rephrasing or ask about something else."
+PIPELINE_ACK_MESSAGE = "Searching your documents..."
+DOCMGR_UNAVAILABLE_MESSAGE = "Document search is unavailable right now, so this answer does not draw on your documents."
+# Tool result while DocMgr's breaker is open or the chat's deadline has passed, so the model
+# reports an outage instead of an empty corpus
+DOCMGR_UNAVAILABLE_TOOL_RESULT = {"error": "Document service temporarily unavailable"}
+
+llm_clients = LLMClientManager(
+    GROQ_API_KEY,
+    pool_size=GROQ_POOL_SIZE,
+    connect_timeout=GROQ_CONNECT_TIMEOUT,
+    read_timeout=GROQ_READ_TIMEOUT,
+    max_retries=GROQ_MAX_RETRIES,
+    observer=observe_upstream
+)
+
+model_router = ModelRouter(
+    fast=ModelTier("fast", GROQ_CHAT_MODEL, GROQ_FAST_MAX_TOKENS, GROQ_FAST_MAX_TOKENS // 2),
+    large=ModelTier("large", GROQ_LARGE_MODEL, GROQ_LARGE_MAX_TOKENS, GROQ_LARGE_MAX_TOKENS // 2) if GROQ_LARGE_MODEL else None,
+    fallback_models=GROQ_FALLBACK_MODELS,
+    large_prompt_tokens=MODEL_ROUTER_LARGE_PROMPT_TOKENS,
+    hedge_after=MODEL_HEDGE_TTFT,
+    window=MODEL_HEALTH_WINDOW,
+    max_error_rate=MODEL_MAX_ERROR_RATE
+)
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST) if RATE_LIMIT_PER_MINUTE > 0 else None
+
+admission = AdmissionController(
+    max_concurrent=CHAT_MAX_CONCURRENT,
+    max_queue=CHAT_MAX_QUEUE,
+    max_queue_delay=CHAT_MAX_QUEUE_DELAY,
+    rate_limiter=rate_limiter
+) if CHAT_MAX_CONCURRENT > 0 else None
+
+ADMISSION_MESSAGES = {
+    429: "Too many requests. Please slow down and try again shortly.",
+    503: "The chatbot is busy right now. Please try again shortly."
+}
 
 # Function definitions for Groq function calling
 AVAILABLE_FUNCTIONS = {
     "get_all_documents": {
         "name": "get_all_documents",
-        "description": "Get a list of all documents in the system",
+        "description": "List documents in the system one page at a time, optionally filtered; "
+                       "use next_offset from the result to get the next page",
         "parameters": {
             "type": "object",
-            "properties": {},
+            "properties": {
+                "limit": {
+                    "type": "integer",
+                    "description": f"Number of documents to return (default: {TOOL_LISTING_DEFAULT_LIMIT})"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Number of matching documents to skip (default: 0)"
+                },
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(DOCUMENT_FIELDS)},
+                    "description": "Document fields to return (default: all); id is always included"
+                },
+                "filename": {
+                    "type": "string",
+                    "description": "Only documents whose filename contains this text (case-insensitive)"
+                },
+                "file_type": {
+                    "type": "string",
+                    "description": "Only documents of this file type, e.g. pdf"
+                },
+                "uploaded_after": {
+                    "type": "string",
+                    "description": "Only documents uploaded on or after this ISO date, e.g. 2024-01-31"
+                },
+                "uploaded_before": {
+                    "type": "string",
+                    "description": "Only documents uploaded before this ISO date"
+                }
+            },
             "required": []
         }
     },
@@ -115,13 +628,27 @@ AVAILABLE_FUNCTIONS = {
     },
     "get_document_chunks": {
         "name": "get_document_chunks",
-        "description": "Get all text chunks for a specific document",
+        "description": "Get the text chunks of a specific document one page at a time, in order; "
+                       "use next_offset from the result to get the next page",
         "parameters": {
             "type": "object",
             "properties": {
                 "document_id": {
                     "type": "integer",
                     "description": "The ID of the document to get chunks for"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": f"Number of chunks to return (default: {TOOL_LISTING_DEFAULT_LIMIT})"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Number of chunks to skip (default: 0)"
+                },
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(CHUNK_FIELDS)},
+                    "description": "Chunk fields to return (default: all); id is always included"
                 }
             },
             "required": ["document_id"]
@@ -165,299 +692,588 @@ AVAILABLE_FUNCTIONS = {
     }
 }
 
-def execute_function_call(function_name, arguments):
-    """Execute a function call based on the function name and arguments"""
+prompt_templates = PromptTemplates(AVAILABLE_FUNCTIONS)
+
+def parse_n_results(value, default=5):
+    """Coerce a requested result count to a positive integer, returning (n_results, error)"""
+    if value is None:
+        return default, None
     try:
+        n_results = int(value)
+    except (TypeError, ValueError):
+        return None, "n_results must be an integer"
+    if n_results < 1:
+        return None, "n_results must be at least 1"
+    return n_results, None
+
+def synced_documents():
+    """The synced document listing and its sync time, or (None, None) once older than CORPUS_LISTING_MAX_AGE"""
+    if corpus_sync is None:
+        return None, None
+    documents, synced_at = corpus_sync.documents(), corpus_sync.synced_at
+    if documents is None or synced_at is None or time.time() - synced_at > CORPUS_LISTING_MAX_AGE:
+        return None, None
+    return documents, synced_at
+
+def execute_function_call(function_name, arguments, api=None, max_tokens=TOOL_RESULT_TOKEN_BUDGET):
+    """Execute a function call based on the function name and arguments
+    
+    `api` defaults to the shared ChatbotAPI; the ASGI server passes its async
+    client, in which case the returned value is awaitable. Listing pages are
+    built to fit `max_tokens`, the share of the tool budget this call gets.
+    """
+    if api is None:
+        api = chatbot_api
+    
+    try:
+        # Listings are paged: from the synced local copy when there is one, else read off
+        # DocMgr's response only as far as the requested page
         if function_name == "get_all_documents":
-            return chatbot_api.get_all_documents()
+            listing, error = parse_listing_query(arguments, DOCUMENT_FIELDS, TOOL_LISTING_DEFAULT_LIMIT,
+                                                 TOOL_RESULT_MAX_ITEMS, filters=True)
+            if error:
+                return {"error": error}
+            documents, synced_at = synced_documents()
+            if documents is not None:
+                # Tell the model how old the listing is; an older one is read live from DocMgr
+                return {**paginate(documents, listing, max_tokens),
+                        "synced_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(synced_at))}
+            return api.get_all_documents(listing, max_tokens=max_tokens)
         
         elif function_name == "get_document_by_id":
             document_id = arguments.get("document_id")
             if document_id is None:
                 return {"error": "document_id is required"}
-            return chatbot_api.get_document_by_id(document_id)
+            return api.get_document_by_id(document_id)
         
         elif function_name == "get_document_chunks":
             document_id = arguments.get("document_id")
             if document_id is None:
                 return {"error": "document_id is required"}
-            return chatbot_api.get_document_chunks(document_id)
+            listing, error = parse_listing_query(arguments, CHUNK_FIELDS, TOOL_LISTING_DEFAULT_LIMIT,
+                                                 TOOL_RESULT_MAX_ITEMS)
+            if error:
+                return {"error": error}
+            chunks = local_index.document_chunks(document_id) if local_index is not None else None
+            if chunks:
+                return paginate(chunks, listing, max_tokens)
+            return api.get_document_chunks(document_id, listing, max_tokens=max_tokens)
         
         elif function_name == "get_vector_stats":
-            return chatbot_api.get_vector_stats()
+            return api.get_vector_stats()
         
         elif function_name == "search_documents":
             query = arguments.get("query")
-            n_results = arguments.get("n_results", 5)
+            n_results, error = parse_n_results(arguments.get("n_results"))
             if query is None:
                 return {"error": "query is required"}
-            return chatbot_api.search_documents(query, min(n_results, 20))
+            if error:
+                return {"error": error}
+            return api.search_documents(query, min(n_results, 20))
         
         elif function_name == "get_api_info":
-            return chatbot_api.get_api_info()
+            return api.get_api_info()
         
         else:
             return {"error": f"Unknown function: {function_name}"}
     
+    except DocMgrUnavailable:
+        return dict(DOCMGR_UNAVAILABLE_TOOL_RESULT)
     except Exception as e:
         return {"error": f"Function execution failed: {str(e)}"}
 
-def generate_chat_response_stream(user_message, context_chunks):
-    """Generate a streaming response using Groq API with document context and function calling"""
-    if not GROQ_API_KEY:
-        yield "data: " + json.dumps({
-            "type": "error",
-            "content": "Groq API key not configured. Please set GROQ_API_KEY environment variable."
-        }) + "\n\n"
-        return
-    
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_CALL_WORKERS, thread_name_prefix="tool-call")
+pipeline_executor = ThreadPoolExecutor(max_workers=CHAT_PIPELINE_WORKERS, thread_name_prefix="chat-pipeline")
+
+def parse_tool_arguments(tool_call):
+    """Decode a tool call's JSON arguments, returning (arguments, error)"""
     try:
-        from groq import Groq
-        client = Groq(api_key=GROQ_API_KEY)
-        
-        # Prepare context from document chunks
-        context = "\n\n".join([
-            f"Document: {chunk['metadata']['original_filename']}\nContent: {chunk['content']}"
-            for chunk in context_chunks
-        ])
-        
-        system_prompt = f"""You are a helpful AI assistant that can access and analyze documents in the DocMgr system. You have access to several functions that allow you to:
+        return (json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}), None
+    except (TypeError, ValueError) as e:
+        return None, {"error": f"Invalid arguments for {tool_call.function.name}: {str(e)}"}
+
+def tool_label(name):
+    """A tool name for span and metric labels, so a name the model made up cannot add a series"""
+    return name if name in AVAILABLE_FUNCTIONS else "unknown"
 
-1. Get information about all documents
-2. Retrieve specific documents by ID
-3. Get document chunks and content
-4. Search documents semantically
-5. Get system statistics
-6. Access API information
+def tool_result_budget(call_count):
+    """Each tool call's share of TOOL_RESULT_TOKEN_BUDGET when a model turn makes `call_count` of them"""
+    return TOOL_RESULT_TOKEN_BUDGET // max(call_count, 1)
 
-Use these functions when users ask questions that require:
-- Listing documents
-- Getting document details
-- Searching for specific content
-- Understanding system status
-- Analyzing document collections
+def current_corpus_version():
+    """The corpus sync's version, else the search cache's DocMgr fingerprint (None without either)"""
+    if corpus_sync is not None:
+        return corpus_sync.corpus_version
+    if search_cache is not None:
+        return search_cache.corpus_version
+    return None
 
-Always explain what you're doing and provide helpful context. If a user asks about documents, use the appropriate functions to get current information.
+def run_tool_call(tool_call, trace=None, session=None, max_tokens=TOOL_RESULT_TOKEN_BUDGET):
+    """Execute a single model tool call and return its result
+    
+    Within a session, a reusable call an earlier turn already made over the
+    same corpus is answered from the session instead.
+    """
+    arguments, error = parse_tool_arguments(tool_call)
+    if error:
+        return error
+    corpus_version = current_corpus_version()
+    if session is not None:
+        found, result = session.tool_result(tool_call.function.name, arguments, corpus_version, max_tokens)
+        if found:
+            if trace is not None:
+                trace.record("session_tool", trace.clock(), 0.0, status="hit", tool=tool_label(tool_call.function.name))
+            return result
+    if trace is None:
+        result = execute_function_call(tool_call.function.name, arguments, max_tokens=max_tokens)
+    else:
+        with trace.span("tool", tool=tool_label(tool_call.function.name)), deadline_scope(trace.deadline):
+            result = execute_function_call(tool_call.function.name, arguments, max_tokens=max_tokens)
+    if session is not None:
+        session.remember_tool_result(tool_call.function.name, arguments, result, corpus_version, max_tokens)
+    return result
+
+def execute_tool_calls(tool_calls, trace=None, session=None):
+    """Run every tool call from one model turn concurrently, preserving order"""
+    max_tokens = tool_result_budget(len(tool_calls))
+    if len(tool_calls) == 1:
+        return [run_tool_call(tool_calls[0], trace, session, max_tokens)]
+    return list(tool_executor.map(lambda tool_call: run_tool_call(tool_call, trace, session, max_tokens), tool_calls))
+
+def append_tool_results(messages, tool_calls, results, assistant_content=""):
+    """Add one assistant tool_calls turn plus every tool result to the conversation"""
+    messages.append({
+        "role": "assistant",
+        "content": assistant_content or "",
+        "tool_calls": [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {
+                    "name": tool_call.function.name,
+                    "arguments": tool_call.function.arguments or "{}"
+                }
+            }
+            for tool_call in tool_calls
+        ]
+    })
+    # Tool results share one budget so several large results cannot overflow the prompt
+    per_call_budget = tool_result_budget(len(tool_calls))
+    for tool_call, result in zip(tool_calls, results):
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "name": tool_call.function.name,
+            "content": fit_tool_result(result, per_call_budget)
+        })
 
-Document Context (if available):
-{context}
+def retrieve_context(user_message, trace=None):
+    """Chunks for the chat prompt: hybrid retrieval when enabled, else DocMgr search"""
+    with deadline_scope(trace.deadline if trace is not None else None):
+        if hybrid_retriever is not None:
+            return hybrid_retriever.search(user_message, CHAT_CONTEXT_RESULTS, trace)
+        return chatbot_api.search_documents(user_message, n_results=CHAT_CONTEXT_RESULTS)
 
-Available Functions:
-{json.dumps(list(AVAILABLE_FUNCTIONS.keys()), indent=2)}
+def context_unavailable(trace):
+    """True when an empty retrieval means DocMgr search is failing or the chat's deadline passed, not no match"""
+    if local_index is not None and local_index.ready:
+        return False
+    if not docmgr_resilience.healthy(SEARCH_OPERATION):
+        return True
+    return trace.deadline is not None and trace.clock() >= trace.deadline
 
-Remember: You can call multiple functions to gather comprehensive information before providing a response."""
+def answer_cache_key(user_message, context_chunks, model=GROQ_CHAT_MODEL):
+    """Answer cache key for this question, context and routed model, or None when the cache is off"""
+    if corpus_sync is None and search_cache is not None:
+        # Without a sync the search cache's periodic fingerprint is the corpus version
+        set_answer_corpus_version(search_cache.corpus_version)
+    if answer_cache is None or answer_cache.corpus_version is None:
+        # Until the corpus version is known a cached answer could predate a document change
+        return None
+    chunk_ids = [chunk_key(chunk) for chunk in context_chunks]
+    return answer_key(user_message, chunk_ids, model, GROQ_TEMPERATURE, answer_cache.corpus_version)
+
+def lookup_answer(user_message, cache_key, context_chunks, trace, model=GROQ_CHAT_MODEL):
+    """Cached answer for this exact question, else for a similar one that retrieved the same chunks
+    
+    Timed as the answer_cache and semantic_cache spans (status hit/miss).
+    """
+    cached = None
+    if cache_key is not None:
+        started = trace.clock()
+        cached = answer_cache.get(cache_key)
+        trace.record("answer_cache", started, trace.clock() - started, status="hit" if cached else "miss")
+    if cached is None and semantic_cache is not None and semantic_cache.corpus_version is not None:
+        started = trace.clock()
+        match = semantic_cache.lookup(user_message, model, GROQ_TEMPERATURE,
+                                      [chunk_key(chunk) for chunk in context_chunks])
+        if match is None:
+            trace.record("semantic_cache", started, trace.clock() - started, status="miss")
+        else:
+            cached, similarity = match
+            trace.record("semantic_cache", started, trace.clock() - started, status="hit",
+                         similarity=round(similarity, 4))
+    return cached
+
+def store_answer(user_message, cache_key, context_chunks, text, tool_trace=None, model=GROQ_CHAT_MODEL):
+    """Remember a completed answer in the enabled answer caches"""
+    if cache_key is not None:
+        answer_cache.put(cache_key, text, tool_trace)
+    if semantic_cache is not None and semantic_cache.corpus_version is not None:
+        semantic_cache.put(user_message, text, tool_trace, model, GROQ_TEMPERATURE,
+                           [chunk_key(chunk) for chunk in context_chunks])
+
+def replay_answer(text):
+    """Content events for a cached answer, paced like a live stream when a replay interval is set"""
+    chunk_chars = ANSWER_CACHE_REPLAY_CHARS if ANSWER_CACHE_REPLAY_INTERVAL > 0 else 0
+    for index, piece in enumerate(replay_chunks(text, chunk_chars)):
+        if index:
+            time.sleep(ANSWER_CACHE_REPLAY_INTERVAL)
+        yield encode_event("content", piece)
+
+def build_system_prompt(context_chunks):
+    """Build the system prompt: cached static prefix plus budgeted document context"""
+    return prompt_templates.system_prompt(build_context(context_chunks, CONTEXT_TOKEN_BUDGET))
+
+def open_session(data):
+    """The conversation session a chat request belongs to, or None for a one-off question
+    
+    A request joins a session by sending `session_id`; an empty, unknown or
+    expired ID starts a new session.
+    """
+    if sessions is None or 'session_id' not in data:
+        return None
+    session_id = data.get('session_id')
+    return sessions.open(session_id if isinstance(session_id, str) else None)
+
+def session_context(session, search_results):
+    """Chat context: the fresh search results plus, within a session, chunks earlier turns retrieved"""
+    if session is None:
+        return search_results
+    return session.context_chunks(search_results)
+
+def route_chat(user_message, context_chunks, session=None):
+    """Pick the model tier from the question and the estimated prompt size"""
+    context_tokens = sum(estimate_tokens(chunk.get('content') or '') for chunk in context_chunks)
+    prompt_tokens = estimate_tokens(user_message) + min(context_tokens, CONTEXT_TOKEN_BUDGET)
+    if session is not None:
+        prompt_tokens += session.stats()["history_tokens"]
+    return model_router.route(user_message, prompt_tokens)
+
+def complete(client, route, messages, max_tokens, tools=True, stream=False):
+    """Run a chat completion over the route's models (hedged, with failover); returns (model, response)
+    
+    A streamed response is returned once its first chunk has arrived.
+    """
+    def attempt(model):
+        extra = {"tools": prompt_templates.tools, "tool_choice": "auto"} if tools else {}
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=GROQ_TEMPERATURE,
+            stream=stream,
+            **extra
+        )
+        return prime_stream(response) if stream else response
+    return model_router.run(route, attempt, discard=lambda response: response.close() if stream else None)
+
+def chat_messages(system_prompt, user_message, session=None):
+    """System prompt, the (compacted) conversation so far, then the new question"""
+    history = session.history_messages() if session is not None else []
+    return [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": user_message}]
+
+def generate_chat_response_stream(user_message, context_chunks, send_typing=True, trace=None, include_timings=False,
+                                  session=None):
+    """Generate a streaming response using Groq API with document context and function calling
+    
+    `trace` carries the request ID and collects phase timings; with
+    `include_timings` the breakdown is sent as the content of the `end` event.
+    With a `session`, earlier turns go into the prompt and the turn is recorded.
+    """
+    sse = SSEWriter(window=SSE_COALESCE_WINDOW, max_bytes=SSE_COALESCE_MAX_BYTES)
+    if trace is None:
+        trace = RequestTrace()
+    
+    if not GROQ_API_KEY:
+        yield sse.event("error", "Groq API key not configured. Please set GROQ_API_KEY environment variable.")
+        return
+    
+    try:
+        # A follow-up depends on the conversation before it, so only a session's first turn uses the answer caches
+        follow_up = session is not None and bool(session.turns)
+        route = route_chat(user_message, context_chunks, session)
+        cache_key = answer_cache_key(user_message, context_chunks, route.model) if not follow_up else None
+        cached = lookup_answer(user_message, cache_key, context_chunks, trace, route.model) if not follow_up else None
+        if cached is not None:
+            if send_typing:
+                yield sse.event("typing", "typing")
+            yield sse.event("start", "")
+            yield from replay_answer(cached["text"])
+            if session is not None:
+                session.add_turn(user_message, cached["text"], context_chunks)
+            yield sse.event("end", trace.breakdown() if include_timings else "")
+            return
+        
+        client = llm_clients.get_client()
         
-        # Send typing indicator
-        yield "data: " + json.dumps({
-            "type": "typing",
-            "content": "typing"
-        }) + "\n\n"
+        with trace.span("prompt"):
+            system_prompt = build_system_prompt(context_chunks)
+            # Use Groq's function calling API
+            messages = chat_messages(system_prompt, user_message, session)
         
-        # Small delay to show typing indicator
-        time.sleep(0.5)
+        # Send typing indicator (unless the caller already sent it while retrieving context)
+        if send_typing:
+            yield sse.event("typing", "typing")
         
         # Start streaming response
-        yield "data: " + json.dumps({
-            "type": "start",
-            "content": ""
-        }) + "\n\n"
-        
-        # Use Groq's function calling API
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+        yield sse.event("start", "")
         
         # Check if function calling is needed
-        response = client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=messages,
-            tools=[{"type": "function", "function": func} for func in AVAILABLE_FUNCTIONS.values()],
-            tool_choice="auto",
-            max_tokens=1000,
-            temperature=0.7,
-            stream=True
-        )
+        request_started = trace.clock()
+        model, response = complete(client, route, messages, route.tier.max_tokens, stream=True)
         
         function_calls = []
+        tool_calls = ToolCallAccumulator()
         current_response = ""
+        answer = ""
+        # An answer written without document context (DocMgr unavailable) is not worth replaying
+        cacheable = bool(context_chunks)
+        first_token = True
         
         for chunk in response:
+            if first_token:
+                ttft = trace.clock() - request_started
+                llm_clients.record_first_token(ttft)
+                TIME_TO_FIRST_TOKEN.observe(ttft, turn="first")
+                first_token = False
+            
             if chunk.choices[0].delta.content:
                 current_response += chunk.choices[0].delta.content
-                yield "data: " + json.dumps({
-                    "type": "content",
-                    "content": chunk.choices[0].delta.content
-                }) + "\n\n"
+                output = sse.content(chunk.choices[0].delta.content)
+                if output:
+                    yield output
             
-            # Check for tool calls
+            # Merge tool call fragments and start each call as soon as its arguments are complete
             if chunk.choices[0].delta.tool_calls:
-                for tool_call in chunk.choices[0].delta.tool_calls:
-                    if tool_call.function:
-                        function_calls.append(tool_call)
+                for tool_call in tool_calls.add(chunk.choices[0].delta.tool_calls):
+                    function_calls.append((tool_call, tool_executor.submit(run_tool_call, tool_call, trace, session)))
+        
+        for tool_call in tool_calls.finish():
+            function_calls.append((tool_call, tool_executor.submit(run_tool_call, tool_call, trace, session)))
+        trace.record("llm_first", request_started, trace.clock() - request_started, model=model, tier=route.tier.name,
+                     route=route.reason)
         
-        # Execute function calls if any
+        # Collect function call results if any
         if function_calls:
-            yield "data: " + json.dumps({
-                "type": "function_call",
-                "content": "Executing function calls to gather information..."
-            }) + "\n\n"
+            yield sse.event("function_call", "Executing function calls to gather information...")
             
-            for tool_call in function_calls:
-                if tool_call.function:
-                    function_name = tool_call.function.name
-                    try:
-                        arguments = json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}
-                        result = execute_function_call(function_name, arguments)
-                        
-                        # Add function result to context
-                        messages.append({
-                            "role": "assistant",
-                            "content": f"I called the function {function_name} to get more information."
-                        })
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": function_name,
-                            "content": json.dumps(result)
-                        })
-                        
-                        # Generate final response with function results
-                        final_response = client.chat.completions.create(
-                            model="llama3-8b-8192",
-                            messages=messages,
-                            max_tokens=500,
-                            temperature=0.7,
-                            stream=True
-                        )
-                        
-                        yield "data: " + json.dumps({
-                            "type": "content",
-                            "content": f"\n\nBased on the information I gathered: "
-                        }) + "\n\n"
-                        
-                        for chunk in final_response:
-                            if chunk.choices[0].delta.content:
-                                yield "data: " + json.dumps({
-                                    "type": "content",
-                                    "content": chunk.choices[0].delta.content
-                                }) + "\n\n"
-                        
-                    except Exception as e:
-                        yield "data: " + json.dumps({
-                            "type": "content",
-                            "content": f"\n\nI encountered an error while gathering information: {str(e)}"
-                        }) + "\n\n"
-        
-        # Send end marker
-        yield "data: " + json.dumps({
-            "type": "end",
-            "content": ""
-        }) + "\n\n"
+            try:
+                # Every call is already running; answer with a single follow-up
+                function_calls.sort(key=lambda item: item[0].index)
+                with trace.span("tool_wait"):
+                    results = [future.result() for _, future in function_calls]
+                append_tool_results(messages, [call for call, _ in function_calls], results, current_response)
+                
+                # Generate final response with function results
+                followup_started = trace.clock()
+                followup_model, final_response = complete(client, route.starting_with(model), messages,
+                                                          route.tier.followup_max_tokens, tools=False, stream=True)
+                
+                answer = "\n\nBased on the information I gathered: "
+                output = sse.content(answer)
+                if output:
+                    yield output
+                
+                first_token = True
+                for chunk in final_response:
+                    if first_token:
+                        TIME_TO_FIRST_TOKEN.observe(trace.clock() - followup_started, turn="followup")
+                        first_token = False
+                    if chunk.choices[0].delta.content:
+                        answer += chunk.choices[0].delta.content
+                        output = sse.content(chunk.choices[0].delta.content)
+                        if output:
+                            yield output
+                trace.record("llm_followup", followup_started, trace.clock() - followup_started, model=followup_model)
+                
+            except Exception as e:
+                # An answer missing its tool results is not worth replaying
+                cacheable = False
+                yield sse.content(f"\n\nI encountered an error while gathering information: {str(e)}") + sse.flush()
+        
+        if cacheable and not follow_up:
+            tool_trace = [{"name": call.function.name, "arguments": call.function.arguments} for call, _ in function_calls]
+            store_answer(user_message, cache_key, context_chunks, current_response + answer, tool_trace, route.model)
+        if session is not None:
+            session.add_turn(user_message, current_response + answer, context_chunks)
+        
+        # Send end marker (flushes any coalesced content first)
+        yield sse.event("end", trace.breakdown() if include_timings else "")
         
     except Exception as e:
         print(f"Error generating chat response: {e}")
-        yield "data: " + json.dumps({
-            "type": "error",
-            "content": "Sorry, I encountered an error while processing your request."
-        }) + "\n\n"
+        yield sse.event("error", "Sorry, I encountered an error while processing your request.")
 
-def generate_chat_response(user_message, context_chunks):
+def generate_chat_response(user_message, context_chunks, trace=None, session=None):
     """Generate a response using Groq API with document context and function calling (non-streaming fallback)"""
     if not GROQ_API_KEY:
         return "Groq API key not configured. Please set GROQ_API_KEY environment variable."
+    if trace is None:
+        trace = RequestTrace()
     
     try:
-        from groq import Groq
-        client = Groq(api_key=GROQ_API_KEY)
+        # A follow-up depends on the conversation before it, so only a session's first turn uses the answer caches
+        follow_up = session is not None and bool(session.turns)
+        route = route_chat(user_message, context_chunks, session)
+        cache_key = answer_cache_key(user_message, context_chunks, route.model) if not follow_up else None
+        cached = lookup_answer(user_message, cache_key, context_chunks, trace, route.model) if not follow_up else None
+        if cached is not None:
+            if session is not None:
+                session.add_turn(user_message, cached["text"], context_chunks)
+            return cached["text"]
         
-        # Prepare context from document chunks
-        context = "\n\n".join([
-            f"Document: {chunk['metadata']['original_filename']}\nContent: {chunk['content']}"
-            for chunk in context_chunks
-        ])
+        client = llm_clients.get_client()
         
-        system_prompt = f"""You are a helpful AI assistant that can access and analyze documents in the DocMgr system. You have access to several functions that allow you to:
-
-1. Get information about all documents
-2. Retrieve specific documents by ID
-3. Get document chunks and content
-4. Search documents semantically
-5. Get system statistics
-6. Access API information
-
-Use these functions when users ask questions that require:
-- Listing documents
-- Getting document details
-- Searching for specific content
-- Understanding system status
-- Analyzing document collections
-
-Always explain what you're doing and provide helpful context. If a user asks about documents, use the appropriate functions to get current information.
-
-Document Context (if available):
-{context}
-
-Available Functions:
-{json.dumps(list(AVAILABLE_FUNCTIONS.keys()), indent=2)}
-
-Remember: You can call multiple functions to gather comprehensive information before providing a response."""
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+        with trace.span("prompt"):
+            system_prompt = build_system_prompt(context_chunks)
+            messages = chat_messages(system_prompt, user_message, session)
         
         # Check if function calling is needed
-        response = client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=messages,
-            tools=[{"type": "function", "function": func} for func in AVAILABLE_FUNCTIONS.values()],
-            tool_choice="auto",
-            max_tokens=1000,
-            temperature=0.7
-        )
+        request_started = trace.clock()
+        model, response = complete(client, route, messages, route.tier.max_tokens)
+        trace.record("llm_first", request_started, trace.clock() - request_started, model=model, tier=route.tier.name,
+                     route=route.reason)
         
         # Handle function calls if any
-        if response.choices[0].message.tool_calls:
-            for tool_call in response.choices[0].message.tool_calls:
-                if tool_call.function:
-                    function_name = tool_call.function.name
-                    try:
-                        arguments = json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}
-                        result = execute_function_call(function_name, arguments)
-                        
-                        # Add function result to context
-                        messages.append({
-                            "role": "assistant",
-                            "content": f"I called the function {function_name} to get more information."
-                        })
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": function_name,
-                            "content": json.dumps(result)
-                        })
-                        
-                        # Generate final response with function results
-                        final_response = client.chat.completions.create(
-                            model="llama3-8b-8192",
-                            messages=messages,
-                            max_tokens=500,
-                            temperature=0.7
-                        )
-                        
-                        return final_response.choices[0].message.content
-                        
-                    except Exception as e:
-                        return f"I encountered an error while gathering information: {str(e)}"
-        
-        return response.choices[0].message.content
+        tool_calls = [
+            tool_call for tool_call in (response.choices[0].message.tool_calls or [])
+            if tool_call.function
+        ]
+        if tool_calls:
+            try:
+                with trace.span("tool_wait"):
+                    results = execute_tool_calls(tool_calls, trace, session)
+                append_tool_results(messages, tool_calls, results, response.choices[0].message.content)
+                
+                # Generate final response with function results
+                with trace.span("llm_followup"):
+                    _, final_response = complete(client, route.starting_with(model), messages,
+                                                 route.tier.followup_max_tokens, tools=False)
+                
+                answer = final_response.choices[0].message.content
+                tool_trace = [{"name": call.function.name, "arguments": call.function.arguments} for call in tool_calls]
+                if not follow_up and context_chunks:
+                    store_answer(user_message, cache_key, context_chunks, answer, tool_trace, route.model)
+                if session is not None:
+                    session.add_turn(user_message, answer, context_chunks)
+                return answer
+                
+            except Exception as e:
+                return f"I encountered an error while gathering information: {str(e)}"
+        
+        answer = response.choices[0].message.content
+        if not follow_up and context_chunks:
+            store_answer(user_message, cache_key, context_chunks, answer, model=route.model)
+        if session is not None:
+            session.add_turn(user_message, answer, context_chunks)
+        return answer
     
     except Exception as e:
         print(f"Error generating chat response: {e}")
         return "Sorry, I encountered an error while processing your request."
 
+def retrieve_with_ack(user_message, trace):
+    """Run retrieval in the background
+    
+    Yields a `status` acknowledgement if retrieval (e.g. a search cache miss)
+    is still running after CHAT_PIPELINE_ACK_DELAY, and returns the chunks.
+    """
+    future = pipeline_executor.submit(retrieve_context, user_message, trace)
+    try:
+        return future.result(timeout=max(0.0, CHAT_PIPELINE_ACK_DELAY - trace.elapsed()))
+    except FutureTimeoutError:
+        yield encode_event("status", PIPELINE_ACK_MESSAGE)
+    return future.result()
+
+def generate_chat_stream(user_message, trace, include_timings=False, pipeline=False, session=None):
+    """Stream a chat answer, sending the typing indicator before retrieval starts"""
+    status = "ok"
+    try:
+        yield encode_event("typing", "typing")
+        
+        try:
+            # Search for relevant document chunks
+            with trace.span("retrieval"):
+                if pipeline and GROQ_API_KEY:
+                    search_results = yield from retrieve_with_ack(user_message, trace)
+                else:
+                    search_results = retrieve_context(user_message, trace)
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            status = "error"
+            yield encode_event("error", "Sorry, I encountered an error while processing your request.")
+            return
+        
+        search_results = session_context(session, search_results)
+        if not search_results:
+            if not context_unavailable(trace):
+                status = "no_documents"
+                yield encode_event("error", NO_DOCUMENTS_MESSAGE)
+                return
+            # Answer without document context rather than not at all
+            status = "degraded"
+            yield encode_event("status", DOCMGR_UNAVAILABLE_MESSAGE)
+        
+        yield from generate_chat_response_stream(user_message, search_results, send_typing=False,
+                                                 trace=trace, include_timings=include_timings, session=session)
+    finally:
+        record_request(trace, "chat", True, status)
+
+def record_request(trace, endpoint, stream, status):
+    """Observe a finished request in the request histogram and counter"""
+    REQUEST_DURATION.observe(trace.elapsed(), endpoint=endpoint, stream=str(stream).lower())
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=status)
+
+def request_trace(headers):
+    """Start a trace, reusing the caller's X-Request-ID when given"""
+    return RequestTrace((headers.get('X-Request-ID') or '').strip()[:64] or None)
+
+def set_chat_deadline(trace, timeout_ms):
+    """Give the chat's DocMgr calls a deadline: CHAT_DEADLINE_MS, or the caller's shorter X-Request-Timeout-Ms"""
+    budget = CHAT_DEADLINE if CHAT_DEADLINE > 0 else None
+    try:
+        requested = float(timeout_ms) / 1000 if timeout_ms else None
+    except ValueError:
+        requested = None
+    if requested is not None and requested > 0:
+        budget = requested if budget is None else min(budget, requested)
+    if budget is not None:
+        trace.deadline = trace.started + budget
+
+def client_key(api_key, authorization, remote_addr):
+    """Rate limit key: the caller's API key (hashed, from X-API-Key or a Bearer token), else its address"""
+    if not api_key and (authorization or '').lower().startswith('bearer '):
+        api_key = authorization[7:].strip()
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"addr:{remote_addr}"
+
+def chat_priority(stream, user_message):
+    """Admission priority: short or non-streaming chats (0) go before long streamed ones (1)"""
+    return 0 if not stream or len(user_message) <= CHAT_SHORT_MESSAGE_CHARS else 1
+
+def admit_chat(key, priority, trace):
+    """Wait for an admission slot; returns a ticket (None when the gate is off) or raises AdmissionRejected"""
+    if admission is None:
+        if rate_limiter is not None:
+            rate_limiter.check(key)
+        return None
+    started = trace.clock()
+    ticket = admission.acquire(key, priority)
+    trace.record("admission", started, trace.clock() - started, priority=priority)
+    return ticket
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat requests with streaming support and function calling"""
@@ -465,48 +1281,83 @@ def chat():
         data = request.get_json()
         user_message = data.get('message', '')
         stream = data.get('stream', False)
+        include_timings = bool(data.get('include_timings', False))
+        pipeline = bool(data.get('pipeline', CHAT_PIPELINE_DEFAULT))
         
         if not user_message:
             return jsonify({'error': 'Message is required'}), 400
         
-        # Search for relevant document chunks
-        search_results = chatbot_api.search_documents(user_message, n_results=3)
+        trace = request_trace(request.headers)
+        set_chat_deadline(trace, request.headers.get(DEADLINE_HEADER))
         
-        if not search_results:
-            if stream:
-                def generate_error_stream():
-                    yield "data: " + json.dumps({
-                        "type": "error",
-                        "content": "I don't have any relevant documents to answer your question. Please try rephrasing or ask about something else."
-                    }) + "\n\n"
-                
-                return Response(generate_error_stream(), mimetype='text/event-stream')
-            else:
-                return jsonify({
-                    'response': 'I don\'t have any relevant documents to answer your question. Please try rephrasing or ask about something else.',
-                    'context': []
-                })
+        try:
+            key = client_key(request.headers.get('X-API-Key'), request.headers.get('Authorization'),
+                             request.remote_addr)
+            ticket = admit_chat(key, chat_priority(stream, user_message), trace)
+        except AdmissionRejected as e:
+            record_request(trace, "chat", bool(stream), e.reason)
+            return jsonify({'error': ADMISSION_MESSAGES[e.status], 'reason': e.reason,
+                            'retry_after': e.retry_after}), e.status, {
+                'Retry-After': str(e.retry_after),
+                'X-Request-ID': trace.request_id
+            }
+        
+        session = open_session(data)
+        response_headers = {'X-Request-ID': trace.request_id}
+        if session is not None:
+            response_headers['X-Session-ID'] = session.session_id
         
         if stream:
-            # Return streaming response
-            return Response(
-                generate_chat_response_stream(user_message, search_results),
+            # Return streaming response; retrieval runs inside the stream so the
+            # typing indicator reaches the client immediately
+            response = Response(
+                generate_chat_stream(user_message, trace, include_timings, pipeline, session),
                 mimetype='text/event-stream',
                 headers={
                     'Cache-Control': 'no-cache',
                     'Connection': 'keep-alive',
                     'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Cache-Control'
+                    'Access-Control-Allow-Headers': 'Cache-Control',
+                    **response_headers
                 }
             )
-        else:
+            # The slot is held until the stream is finished or the client disconnects
+            if ticket is not None:
+                response.call_on_close(ticket.release)
+            return response
+        
+        try:
+            # Search for relevant document chunks
+            with trace.span("retrieval"):
+                search_results = retrieve_context(user_message, trace)
+            search_results = session_context(session, search_results)
+            
+            degraded = not search_results and context_unavailable(trace)
+            if not search_results and not degraded:
+                record_request(trace, "chat", False, "no_documents")
+                return jsonify({
+                    'response': NO_DOCUMENTS_MESSAGE,
+                    'context': []
+                }), 200, response_headers
+            
             # Return regular response (fallback)
-            response = generate_chat_response(user_message, search_results)
+            response = generate_chat_response(user_message, search_results, trace, session)
+            record_request(trace, "chat", False, "degraded" if degraded else "ok")
             
-            return jsonify({
+            body = {
                 'response': response,
                 'context': search_results
-            })
+            }
+            if degraded:
+                body['notice'] = DOCMGR_UNAVAILABLE_MESSAGE
+            if session is not None:
+                body['session_id'] = session.session_id
+            if include_timings:
+                body['timings'] = trace.breakdown()
+            return jsonify(body), 200, response_headers
+        finally:
+            if ticket is not None:
+                ticket.release()
     
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
@@ -518,12 +1369,16 @@ def search():
     try:
         data = request.get_json()
         query = data.get('query', '')
-        n_results = data.get('n_results', 5)
+        n_results, error = parse_n_results(data.get('n_results'))
         
         if not query:
             return jsonify({'error': 'Query is required'}), 400
+        if error:
+            return jsonify({'error': error}), 400
         
+        trace = request_trace(request.headers)
         search_results = chatbot_api.search_documents(query, n_results)
+        record_request(trace, "search", False, "ok")
         
         return jsonify({
             'results': search_results,
@@ -545,7 +1400,29 @@ def get_available_functions():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'docmgr_url': DOCMGR_BASE_URL})
+    return jsonify({
+        'status': 'healthy',
+        'docmgr_url': DOCMGR_BASE_URL,
+        'docmgr_pool': chatbot_api.pool_stats(),
+        'docmgr_resilience': docmgr_resilience.stats(),
+        'sessions': sessions.stats() if sessions else None,
+        'admission': admission.stats() if admission else (
+            {'rate_limit': rate_limiter.stats()} if rate_limiter else None),
+        'single_flight': chatbot_api.single_flight.stats() if chatbot_api.single_flight else None,
+        'llm_client': llm_clients.stats(),
+        'model_router': model_router.stats(),
+        'search_cache': search_cache.stats() if search_cache else None,
+        'answer_cache': answer_cache.stats() if answer_cache else None,
+        'semantic_cache': semantic_cache.stats() if semantic_cache else None,
+        'local_index': local_index.stats() if local_index else None,
+        'corpus_sync': corpus_sync.stats() if corpus_sync else None,
+        'retrieval': hybrid_retriever.stats() if hybrid_retriever else None
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus-style latency histograms per phase, tool and upstream"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,885 @@
+"""
+ASGI serving mode for the DocMgr Chatbot backend
+
+Serves the same /api/chat, /api/search, /api/functions, /api/health and
+/api/metrics contracts as app.py, but every DocMgr call, the Groq streaming call and the
+SSE emission run on the event loop. An open chat stream costs a coroutine
+instead of an OS thread, so one process can hold thousands of streams.
+
+Usage:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+"""
+
+import asyncio
+import inspect
+import json
+import time
+
+import httpx
+
+from admission import AdmissionRejected
+from answer_cache import replay_chunks
+from app import (
+    ADMISSION_MESSAGES,
+    ANSWER_CACHE_REPLAY_CHARS,
+    ANSWER_CACHE_REPLAY_INTERVAL,
+    AVAILABLE_FUNCTIONS,
+    CHAT_CONTEXT_RESULTS,
+    CHAT_PIPELINE_ACK_DELAY,
+    CHAT_PIPELINE_DEFAULT,
+    DEADLINE_HEADER,
+    DOCMGR_BASE_URL,
+    DOCMGR_CONNECT_TIMEOUT,
+    DOCMGR_MAX_RETRIES,
+    DOCMGR_POOL_SIZE,
+    DOCMGR_READ_TIMEOUT,
+    DOCMGR_SINGLE_FLIGHT,
+    DOCMGR_UNAVAILABLE_MESSAGE,
+    DOCMGR_UNAVAILABLE_TOOL_RESULT,
+    GROQ_API_KEY,
+    GROQ_CHAT_MODEL,
+    GROQ_TEMPERATURE,
+    NO_DOCUMENTS_MESSAGE,
+    PIPELINE_ACK_MESSAGE,
+    SEARCH_OPERATION,
+    SSE_COALESCE_MAX_BYTES,
+    SSE_COALESCE_WINDOW,
+    TOOL_CALL_WORKERS,
+    TOOL_RESULT_TOKEN_BUDGET,
+    admission,
+    answer_cache,
+    answer_cache_key,
+    append_tool_results,
+    build_system_prompt,
+    chat_messages,
+    chat_priority,
+    client_key,
+    context_unavailable,
+    corpus_sync,
+    current_corpus_version,
+    docmgr_operation,
+    docmgr_resilience,
+    execute_function_call,
+    hybrid_retriever,
+    llm_clients,
+    local_index,
+    lookup_answer,
+    model_router,
+    open_session,
+    parse_n_results,
+    parse_tool_arguments,
+    prompt_templates,
+    rate_limiter,
+    record_request,
+    retrieve_context,
+    route_chat,
+    search_cache,
+    semantic_cache,
+    session_context,
+    sessions,
+    set_chat_deadline,
+    store_answer,
+    tool_label,
+    tool_result_budget,
+)
+from json_stream import STREAM_CHUNK_BYTES, JSONArrayParser
+from listings import Page
+from model_router import prime_stream_async
+from resilience import DocMgrUnavailable, deadline_scope
+from search_cache import SearchCache, corpus_fingerprint
+from single_flight import SingleFlight, coalesced
+from sse import SSEWriter, encode_event
+from tool_calls import ToolCallAccumulator
+from tracing import TIME_TO_FIRST_TOKEN, RequestTrace, metrics, observe_upstream
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"connection", b"keep-alive"),
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Cache-Control"),
+]
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, Cache-Control"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+class AsyncChatbotAPI:
+    """Non-blocking counterpart of ChatbotAPI built on a pooled httpx.AsyncClient"""
+
+    def __init__(self, base_url, pool_size=DOCMGR_POOL_SIZE, connect_timeout=DOCMGR_CONNECT_TIMEOUT,
+                 read_timeout=DOCMGR_READ_TIMEOUT, max_retries=DOCMGR_MAX_RETRIES, search_cache=None,
+                 local_index=None, single_flight=None, resilience=None):
+        self.base_url = base_url
+        self.search_cache = search_cache
+        self.local_index = local_index
+        self.single_flight = single_flight
+        self.resilience = resilience
+        self.timeout = (connect_timeout, read_timeout)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=max_retries)
+        )
+
+    async def _request(self, method, path, stream=False, **kwargs):
+        """Send a request, subject to the operation's breaker and the request's deadline (see ChatbotAPI)
+
+        With `stream` the response is returned once its headers are in and
+        must be closed by the caller.
+        """
+        operation = docmgr_operation(method, path)
+        remaining = self.resilience.admit(operation) if self.resilience is not None else None
+        if remaining is not None:
+            connect_timeout, read_timeout = self.timeout
+            kwargs["timeout"] = httpx.Timeout(min(read_timeout, remaining), connect=min(connect_timeout, remaining))
+            kwargs["headers"] = {**kwargs.get("headers", {}), DEADLINE_HEADER: str(int(remaining * 1000))}
+        started = time.perf_counter()
+        status = "error"
+        ok = None
+        try:
+            response = await self.client.send(self.client.build_request(method, path, **kwargs), stream=stream)
+            status = response.status_code
+            ok = status < 500
+            return response
+        except httpx.TimeoutException:
+            # A timeout cut short by the deadline says nothing about DocMgr's health
+            ok = None if remaining is not None and remaining < self.timeout[1] else False
+            raise
+        except httpx.HTTPError:
+            ok = False
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            observe_upstream("docmgr", operation, status, duration)
+            if self.resilience is not None:
+                self.resilience.record(operation, duration, ok)
+
+    async def _get_json(self, path):
+        response = await self._request("GET", path)
+        response.raise_for_status()
+        return response.json()
+
+    async def refresh_corpus_version(self):
+        """Fingerprint DocMgr's document set so cached results can be invalidated (None while it is unavailable)"""
+        try:
+            stats = await self.get_vector_stats()
+            documents = None if stats else await self.get_all_documents()
+        except DocMgrUnavailable as e:
+            print(f"Error fingerprinting the DocMgr corpus: {e}")
+            return None
+        return corpus_fingerprint(stats, documents)
+
+    @coalesced(key=lambda query, n_results=5: SearchCache.make_key(query, n_results))
+    async def search_documents(self, query, n_results=5):
+        """Search for relevant document chunks"""
+        cache = self.search_cache
+        generation = None
+        if cache is not None:
+            if cache.claim_version_check():
+                version = None
+                try:
+                    version = await self.refresh_corpus_version()
+                finally:
+                    cache.set_corpus_version(version)
+            cached = cache.get(query, n_results)
+            if cached is not None:
+                return cached
+            generation = cache.generation
+
+        local_index = self.local_index
+        if local_index is not None and local_index.ready:
+            # Embedding the query is CPU work; keep it off the event loop
+            started = time.perf_counter()
+            results = await asyncio.to_thread(local_index.search, query, n_results)
+            observe_upstream("local_index", "search", "ok", time.perf_counter() - started)
+        else:
+            try:
+                if self.resilience is not None:
+                    # A search slower than DocMgr's recent p95 is raced against a duplicate
+                    results = await self.resilience.hedged_async(
+                        SEARCH_OPERATION, lambda: self._post_search(query, n_results))
+                else:
+                    results = await self._post_search(query, n_results)
+            except (httpx.HTTPError, DocMgrUnavailable) as e:
+                print(f"Error searching documents: {e}")
+                stale = cache.get_stale(query, n_results) if cache is not None else None
+                return stale if stale is not None else []
+
+        if cache is not None and results:
+            cache.put(query, n_results, results, generation)
+        return results
+
+    async def _get_items(self, path, listing=None, max_tokens=None):
+        """GET a JSON array, parsing each item as it arrives (see ChatbotAPI._get_items)"""
+        response = await self._request("GET", path, stream=True)
+        try:
+            response.raise_for_status()
+            parser = JSONArrayParser()
+            page = Page(listing, max_tokens) if listing is not None else None
+            items = []
+            async for data in response.aiter_bytes(STREAM_CHUNK_BYTES):
+                for item in parser.feed(data):
+                    if page is None:
+                        items.append(item)
+                    elif not page.add(item):
+                        return page.result()
+                if parser.done:
+                    break
+            value = parser.close()
+            if value is not None:
+                return value
+            return items if page is None else page.result()
+        except ValueError as e:
+            raise httpx.DecodingError(f"Invalid JSON from DocMgr: {e}")
+        finally:
+            await response.aclose()
+
+    async def _post_search(self, query, n_results):
+        response = await self._request(
+            "POST",
+            "/api/search",
+            json={"query": query, "n_results": n_results}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    @coalesced()
+    async def get_document_chunks(self, document_id, listing=None, max_tokens=None):
+        """Get chunks for a specific document, or one page of them for a ListingQuery"""
+        try:
+            return await self._get_items(f"/api/documents/{document_id}/chunks", listing, max_tokens)
+        except httpx.HTTPError as e:
+            print(f"Error getting document chunks: {e}")
+            return []
+
+    @coalesced()
+    async def get_all_documents(self, listing=None, max_tokens=None):
+        """Get all documents, or one filtered page of them for a ListingQuery"""
+        try:
+            return await self._get_items("/api/documents", listing, max_tokens)
+        except httpx.HTTPError as e:
+            print(f"Error getting all documents: {e}")
+            return []
+
+    @coalesced()
+    async def get_document_by_id(self, document_id):
+        """Get a specific document by ID"""
+        try:
+            return await self._get_json(f"/api/documents/{document_id}")
+        except httpx.HTTPError as e:
+            print(f"Error getting document {document_id}: {e}")
+            return None
+
+    @coalesced()
+    async def get_vector_stats(self):
+        """Get vector collection statistics"""
+        try:
+            return await self._get_json("/api/vector/stats")
+        except httpx.HTTPError as e:
+            print(f"Error getting vector stats: {e}")
+            return None
+
+    @coalesced()
+    async def get_api_info(self):
+        """Get API information and available endpoints"""
+        try:
+            return await self._get_json("/")
+        except httpx.HTTPError as e:
+            print(f"Error getting API info: {e}")
+            return None
+
+    async def aclose(self):
+        await self.client.aclose()
+
+async_chatbot_api = AsyncChatbotAPI(DOCMGR_BASE_URL, search_cache=search_cache, local_index=local_index,
+                                    single_flight=SingleFlight() if DOCMGR_SINGLE_FLIGHT else None,
+                                    resilience=docmgr_resilience)
+
+async def retrieve_context_async(user_message, trace=None):
+    """Chunks for the chat prompt; hybrid retrieval runs in a worker thread"""
+    if hybrid_retriever is not None:
+        return await asyncio.to_thread(retrieve_context, user_message, trace)
+    with deadline_scope(trace.deadline if trace is not None else None):
+        return await async_chatbot_api.search_documents(user_message, n_results=CHAT_CONTEXT_RESULTS)
+
+async def execute_function_call_async(function_name, arguments, max_tokens=TOOL_RESULT_TOKEN_BUDGET):
+    """Execute a function call against the async DocMgr client"""
+    try:
+        result = execute_function_call(function_name, arguments, api=async_chatbot_api, max_tokens=max_tokens)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+    except DocMgrUnavailable:
+        return dict(DOCMGR_UNAVAILABLE_TOOL_RESULT)
+    except Exception as e:
+        return {"error": f"Function execution failed: {str(e)}"}
+
+tool_call_slots = asyncio.Semaphore(TOOL_CALL_WORKERS)
+
+async def run_tool_call_async(tool_call, trace=None, session=None, max_tokens=TOOL_RESULT_TOKEN_BUDGET):
+    """Execute a single model tool call, bounded by TOOL_CALL_WORKERS (or reused from the session)"""
+    arguments, error = parse_tool_arguments(tool_call)
+    if error:
+        return error
+    corpus_version = current_corpus_version()
+    if session is not None:
+        found, result = session.tool_result(tool_call.function.name, arguments, corpus_version, max_tokens)
+        if found:
+            if trace is not None:
+                trace.record("session_tool", trace.clock(), 0.0, status="hit", tool=tool_label(tool_call.function.name))
+            return result
+    async with tool_call_slots:
+        if trace is None:
+            result = await execute_function_call_async(tool_call.function.name, arguments, max_tokens)
+        else:
+            with trace.span("tool", tool=tool_label(tool_call.function.name)), deadline_scope(trace.deadline):
+                result = await execute_function_call_async(tool_call.function.name, arguments, max_tokens)
+    if session is not None:
+        session.remember_tool_result(tool_call.function.name, arguments, result, corpus_version, max_tokens)
+    return result
+
+async def execute_tool_calls_async(tool_calls, trace=None, session=None):
+    """Run every tool call from one model turn concurrently, preserving order"""
+    max_tokens = tool_result_budget(len(tool_calls))
+    return list(await asyncio.gather(*(run_tool_call_async(tool_call, trace, session, max_tokens)
+                                       for tool_call in tool_calls)))
+
+async def lookup_answer_async(user_message, cache_key, context_chunks, trace, model=GROQ_CHAT_MODEL):
+    """lookup_answer, moved off the event loop: the answer cache reads sqlite and the semantic cache embeds"""
+    if cache_key is None and semantic_cache is None:
+        return None
+    return await asyncio.to_thread(lookup_answer, user_message, cache_key, context_chunks, trace, model)
+
+async def store_answer_async(user_message, cache_key, context_chunks, text, tool_trace=None, model=GROQ_CHAT_MODEL):
+    if cache_key is None and semantic_cache is None:
+        return None
+    return await asyncio.to_thread(store_answer, user_message, cache_key, context_chunks, text, tool_trace, model)
+
+async def complete_async(client, route, messages, max_tokens, tools=True, stream=False):
+    """Async version of complete: hedged chat completion with failover; returns (model, response)"""
+    async def attempt(model):
+        extra = {"tools": prompt_templates.tools, "tool_choice": "auto"} if tools else {}
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=GROQ_TEMPERATURE,
+            stream=stream,
+            **extra
+        )
+        return await prime_stream_async(response) if stream else response
+    return await model_router.run_async(route, attempt, discard=lambda response: response.close() if stream else None)
+
+async def replay_answer_async(text):
+    """Async version of replay_answer"""
+    chunk_chars = ANSWER_CACHE_REPLAY_CHARS if ANSWER_CACHE_REPLAY_INTERVAL > 0 else 0
+    for index, piece in enumerate(replay_chunks(text, chunk_chars)):
+        if index:
+            await asyncio.sleep(ANSWER_CACHE_REPLAY_INTERVAL)
+        yield encode_event("content", piece)
+
+async def generate_chat_response_stream_async(user_message, context_chunks, send_typing=True, trace=None,
+                                              include_timings=False, session=None):
+    """Async version of generate_chat_response_stream yielding SSE event text"""
+    sse = SSEWriter(window=SSE_COALESCE_WINDOW, max_bytes=SSE_COALESCE_MAX_BYTES)
+    if trace is None:
+        trace = RequestTrace()
+
+    if not GROQ_API_KEY:
+        yield sse.event("error", "Groq API key not configured. Please set GROQ_API_KEY environment variable.")
+        return
+
+    function_calls = []
+    try:
+        # A follow-up depends on the conversation before it, so only a session's first turn uses the answer caches
+        follow_up = session is not None and bool(session.turns)
+        route = route_chat(user_message, context_chunks, session)
+        cache_key = answer_cache_key(user_message, context_chunks, route.model) if not follow_up else None
+        cached = await lookup_answer_async(user_message, cache_key, context_chunks, trace, route.model) if not follow_up else None
+        if cached is not None:
+            if send_typing:
+                yield sse.event("typing", "typing")
+            yield sse.event("start", "")
+            async for event in replay_answer_async(cached["text"]):
+                yield event
+            if session is not None:
+                session.add_turn(user_message, cached["text"], context_chunks)
+            yield sse.event("end", trace.breakdown() if include_timings else "")
+            return
+
+        client = llm_clients.get_async_client()
+
+        with trace.span("prompt"):
+            system_prompt = build_system_prompt(context_chunks)
+            messages = chat_messages(system_prompt, user_message, session)
+
+        # Send typing indicator (unless the caller already sent it while retrieving context)
+        if send_typing:
+            yield sse.event("typing", "typing")
+
+        # Start streaming response
+        yield sse.event("start", "")
+
+        request_started = trace.clock()
+        model, response = await complete_async(client, route, messages, route.tier.max_tokens, stream=True)
+
+        tool_calls = ToolCallAccumulator()
+        current_response = ""
+        answer = ""
+        # An answer written without document context (DocMgr unavailable) is not worth replaying
+        cacheable = bool(context_chunks)
+        first_token = True
+
+        async for chunk in response:
+            if first_token:
+                ttft = trace.clock() - request_started
+                llm_clients.record_first_token(ttft)
+                TIME_TO_FIRST_TOKEN.observe(ttft, turn="first")
+                first_token = False
+
+            if chunk.choices[0].delta.content:
+                current_response += chunk.choices[0].delta.content
+                output = sse.content(chunk.choices[0].delta.content)
+                if output:
+                    yield output
+
+            # Merge tool call fragments and start each call as soon as its arguments are complete
+            if chunk.choices[0].delta.tool_calls:
+                for tool_call in tool_calls.add(chunk.choices[0].delta.tool_calls):
+                    function_calls.append((tool_call, asyncio.create_task(run_tool_call_async(tool_call, trace, session))))
+
+        for tool_call in tool_calls.finish():
+            function_calls.append((tool_call, asyncio.create_task(run_tool_call_async(tool_call, trace, session))))
+        trace.record("llm_first", request_started, trace.clock() - request_started, model=model, tier=route.tier.name,
+                     route=route.reason)
+
+        # Collect function call results if any
+        if function_calls:
+            yield sse.event("function_call", "Executing function calls to gather information...")
+
+            try:
+                # Every call is already running; answer with a single follow-up
+                function_calls.sort(key=lambda item: item[0].index)
+                with trace.span("tool_wait"):
+                    results = await asyncio.gather(*(task for _, task in function_calls))
+                append_tool_results(messages, [call for call, _ in function_calls], results, current_response)
+
+                # Generate final response with function results
+                followup_started = trace.clock()
+                followup_model, final_response = await complete_async(
+                    client, route.starting_with(model), messages, route.tier.followup_max_tokens, tools=False,
+                    stream=True)
+
+                answer = "\n\nBased on the information I gathered: "
+                output = sse.content(answer)
+                if output:
+                    yield output
+
+                first_token = True
+                async for chunk in final_response:
+                    if first_token:
+                        TIME_TO_FIRST_TOKEN.observe(trace.clock() - followup_started, turn="followup")
+                        first_token = False
+                    if chunk.choices[0].delta.content:
+                        answer += chunk.choices[0].delta.content
+                        output = sse.content(chunk.choices[0].delta.content)
+                        if output:
+                            yield output
+                trace.record("llm_followup", followup_started, trace.clock() - followup_started, model=followup_model)
+
+            except Exception as e:
+                # An answer missing its tool results is not worth replaying
+                cacheable = False
+                yield sse.content(f"\n\nI encountered an error while gathering information: {str(e)}") + sse.flush()
+
+        if cacheable and not follow_up:
+            tool_trace = [{"name": call.function.name, "arguments": call.function.arguments} for call, _ in function_calls]
+            await store_answer_async(user_message, cache_key, context_chunks, current_response + answer, tool_trace, route.model)
+        if session is not None:
+            session.add_turn(user_message, current_response + answer, context_chunks)
+
+        # Send end marker (flushes any coalesced content first)
+        yield sse.event("end", trace.breakdown() if include_timings else "")
+
+    except Exception as e:
+        print(f"Error generating chat response: {e}")
+        yield sse.event("error", "Sorry, I encountered an error while processing your request.")
+
+    finally:
+        # A client that went away (the generator is closed) leaves no tool calls running
+        pending = [task for _, task in function_calls if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def generate_chat_response_async(user_message, context_chunks, trace=None, session=None):
+    """Async version of generate_chat_response (non-streaming fallback)"""
+    if not GROQ_API_KEY:
+        return "Groq API key not configured. Please set GROQ_API_KEY environment variable."
+    if trace is None:
+        trace = RequestTrace()
+
+    try:
+        # A follow-up depends on the conversation before it, so only a session's first turn uses the answer caches
+        follow_up = session is not None and bool(session.turns)
+        route = route_chat(user_message, context_chunks, session)
+        cache_key = answer_cache_key(user_message, context_chunks, route.model) if not follow_up else None
+        cached = await lookup_answer_async(user_message, cache_key, context_chunks, trace, route.model) if not follow_up else None
+        if cached is not None:
+            if session is not None:
+                session.add_turn(user_message, cached["text"], context_chunks)
+            return cached["text"]
+
+        client = llm_clients.get_async_client()
+
+        with trace.span("prompt"):
+            system_prompt = build_system_prompt(context_chunks)
+            messages = chat_messages(system_prompt, user_message, session)
+
+        request_started = trace.clock()
+        model, response = await complete_async(client, route, messages, route.tier.max_tokens)
+        trace.record("llm_first", request_started, trace.clock() - request_started, model=model, tier=route.tier.name,
+                     route=route.reason)
+
+        # Handle function calls if any
+        tool_calls = [
+            tool_call for tool_call in (response.choices[0].message.tool_calls or [])
+            if tool_call.function
+        ]
+        if tool_calls:
+            try:
+                with trace.span("tool_wait"):
+                    results = await execute_tool_calls_async(tool_calls, trace, session)
+                append_tool_results(messages, tool_calls, results, response.choices[0].message.content)
+
+                with trace.span("llm_followup"):
+                    _, final_response = await complete_async(client, route.starting_with(model), messages,
+                                                             route.tier.followup_max_tokens, tools=False)
+
+                answer = final_response.choices[0].message.content
+                tool_trace = [{"name": call.function.name, "arguments": call.function.arguments} for call in tool_calls]
+                if not follow_up and context_chunks:
+                    await store_answer_async(user_message, cache_key, context_chunks, answer, tool_trace, route.model)
+                if session is not None:
+                    session.add_turn(user_message, answer, context_chunks)
+                return answer
+
+            except Exception as e:
+                return f"I encountered an error while gathering information: {str(e)}"
+
+        answer = response.choices[0].message.content
+        if not follow_up and context_chunks:
+            await store_answer_async(user_message, cache_key, context_chunks, answer, model=route.model)
+        if session is not None:
+            session.add_turn(user_message, answer, context_chunks)
+        return answer
+
+    except Exception as e:
+        print(f"Error generating chat response: {e}")
+        return "Sorry, I encountered an error while processing your request."
+
+# ---------------------------------------------------------------------------
+# Minimal ASGI plumbing
+# ---------------------------------------------------------------------------
+
+async def read_json(receive):
+    """Read the full request body and decode it as JSON"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body) if body else None
+
+def request_trace(scope):
+    """Start a trace, reusing the caller's X-Request-ID when given"""
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            return RequestTrace(value.decode("latin-1").strip()[:64] or None)
+    return RequestTrace()
+
+def header(scope, name):
+    """First value of a request header (`name` in lower case), or None"""
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+async def admit_chat_async(key, priority, trace):
+    """Wait for an admission slot without blocking the loop; returns a ticket or None"""
+    if admission is None:
+        if rate_limiter is not None:
+            rate_limiter.check(key)
+        return None
+    started = trace.clock()
+    ticket = await admission.acquire_async(key, priority)
+    trace.record("admission", started, trace.clock() - started, priority=priority)
+    return ticket
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ] + CORS_HEADERS + (headers or [])
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def wait_for_disconnect(receive):
+    """Return once the client has gone away (the request body must already be read)"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def send_stream(send, events, headers=None, receive=None):
+    """Send an async generator of SSE event text as a chunked response
+
+    With `receive`, a client disconnect stops the stream: the generator is
+    cancelled and closed, so its Groq stream and tool calls end at once
+    instead of running to the end of an answer nobody will read. Returns
+    False if the client disconnected.
+    """
+    async def pump():
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS + (headers or [])})
+        async for event in events:
+            if event:
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    if receive is None:
+        await pump()
+        return True
+
+    sending = asyncio.ensure_future(pump())
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({sending, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not sending.done():
+            sending.cancel()
+            try:
+                await sending
+            except asyncio.CancelledError:
+                pass
+            return False
+        sending.result()
+        return True
+    finally:
+        disconnected.cancel()
+        await events.aclose()
+
+async def generate_chat_stream_async(user_message, trace, include_timings=False, pipeline=False, session=None):
+    """Stream a chat answer, sending the typing indicator before retrieval starts"""
+    status = "ok"
+    try:
+        yield encode_event("typing", "typing")
+
+        try:
+            # Search for relevant document chunks
+            with trace.span("retrieval"):
+                if pipeline and GROQ_API_KEY:
+                    retrieval = asyncio.create_task(retrieve_context_async(user_message, trace))
+                    done, _ = await asyncio.wait({retrieval}, timeout=max(0.0, CHAT_PIPELINE_ACK_DELAY - trace.elapsed()))
+                    if not done:
+                        yield encode_event("status", PIPELINE_ACK_MESSAGE)
+                    search_results = await retrieval
+                else:
+                    search_results = await retrieve_context_async(user_message, trace)
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            status = "error"
+            yield encode_event("error", "Sorry, I encountered an error while processing your request.")
+            return
+
+        search_results = session_context(session, search_results)
+        if not search_results:
+            if not context_unavailable(trace):
+                status = "no_documents"
+                yield encode_event("error", NO_DOCUMENTS_MESSAGE)
+                return
+            # Answer without document context rather than not at all
+            status = "degraded"
+            yield encode_event("status", DOCMGR_UNAVAILABLE_MESSAGE)
+
+        async for event in generate_chat_response_stream_async(user_message, search_results, send_typing=False,
+                                                               trace=trace, include_timings=include_timings,
+                                                               session=session):
+            yield event
+    finally:
+        record_request(trace, "chat", True, status)
+
+async def chat(scope, receive, send):
+    """Handle chat requests with streaming support and function calling"""
+    try:
+        data = await read_json(receive) or {}
+        user_message = data.get('message', '')
+        stream = data.get('stream', False)
+        include_timings = bool(data.get('include_timings', False))
+        pipeline = bool(data.get('pipeline', CHAT_PIPELINE_DEFAULT))
+
+        if not user_message:
+            return await send_json(send, {'error': 'Message is required'}, 400)
+
+        trace = request_trace(scope)
+        set_chat_deadline(trace, header(scope, DEADLINE_HEADER.lower().encode("latin-1")))
+        request_id_header = [(b"x-request-id", trace.request_id.encode("latin-1"))]
+
+        try:
+            client = scope.get("client") or ("unknown", 0)
+            key = client_key(header(scope, b"x-api-key"), header(scope, b"authorization"), client[0])
+            ticket = await admit_chat_async(key, chat_priority(stream, user_message), trace)
+        except AdmissionRejected as e:
+            record_request(trace, "chat", bool(stream), e.reason)
+            body = {'error': ADMISSION_MESSAGES[e.status], 'reason': e.reason, 'retry_after': e.retry_after}
+            return await send_json(send, body, e.status,
+                                   [(b"retry-after", str(e.retry_after).encode("ascii"))] + request_id_header)
+
+        session = open_session(data)
+        response_headers = list(request_id_header)
+        if session is not None:
+            response_headers.append((b"x-session-id", session.session_id.encode("latin-1")))
+
+        try:
+            if stream:
+                # Retrieval runs inside the stream so the typing indicator goes out immediately
+                events = generate_chat_stream_async(user_message, trace, include_timings, pipeline, session)
+                await send_stream(send, events, response_headers, receive)
+                return
+
+            # Search for relevant document chunks
+            with trace.span("retrieval"):
+                search_results = await retrieve_context_async(user_message, trace)
+            search_results = session_context(session, search_results)
+
+            degraded = not search_results and context_unavailable(trace)
+            if not search_results and not degraded:
+                record_request(trace, "chat", False, "no_documents")
+                return await send_json(send, {'response': NO_DOCUMENTS_MESSAGE, 'context': []}, headers=response_headers)
+
+            response = await generate_chat_response_async(user_message, search_results, trace, session)
+            record_request(trace, "chat", False, "degraded" if degraded else "ok")
+
+            body = {'response': response, 'context': search_results}
+            if degraded:
+                body['notice'] = DOCMGR_UNAVAILABLE_MESSAGE
+            if session is not None:
+                body['session_id'] = session.session_id
+            if include_timings:
+                body['timings'] = trace.breakdown()
+            return await send_json(send, body, headers=response_headers)
+        finally:
+            # The slot is held until the answer (or the stream) is finished or the client disconnects
+            if ticket is not None:
+                ticket.release()
+
+    except Exception as e:
+        print(f"Error in chat endpoint: {e}")
+        return await send_json(send, {'error': 'Internal server error'}, 500)
+
+async def search(scope, receive, send):
+    """Search documents directly"""
+    try:
+        data = await read_json(receive) or {}
+        query = data.get('query', '')
+        n_results, error = parse_n_results(data.get('n_results'))
+
+        if not query:
+            return await send_json(send, {'error': 'Query is required'}, 400)
+        if error:
+            return await send_json(send, {'error': error}, 400)
+
+        trace = request_trace(scope)
+        search_results = await async_chatbot_api.search_documents(query, n_results)
+        record_request(trace, "search", False, "ok")
+        return await send_json(send, {'results': search_results, 'query': query})
+
+    except Exception as e:
+        print(f"Error in search endpoint: {e}")
+        return await send_json(send, {'error': 'Internal server error'}, 500)
+
+async def get_available_functions(scope, receive, send):
+    """Get list of available functions for the chatbot"""
+    return await send_json(send, {
+        'functions': AVAILABLE_FUNCTIONS,
+        'description': 'Available functions for the AI chatbot to access DocMgr data'
+    })
+
+async def health_check(scope, receive, send):
+    """Health check endpoint"""
+    return await send_json(send, {
+        'status': 'healthy',
+        'docmgr_url': DOCMGR_BASE_URL,
+        'docmgr_resilience': docmgr_resilience.stats(),
+        'single_flight': async_chatbot_api.single_flight.stats() if async_chatbot_api.single_flight else None,
+        'sessions': sessions.stats() if sessions else None,
+        'admission': admission.stats() if admission else (
+            {'rate_limit': rate_limiter.stats()} if rate_limiter else None),
+        'llm_client': llm_clients.stats(),
+        'model_router': model_router.stats(),
+        'search_cache': search_cache.stats() if search_cache else None,
+        'answer_cache': answer_cache.stats() if answer_cache else None,
+        'semantic_cache': semantic_cache.stats() if semantic_cache else None,
+        'local_index': local_index.stats() if local_index else None,
+        'corpus_sync': corpus_sync.stats() if corpus_sync else None,
+        'retrieval': hybrid_retriever.stats() if hybrid_retriever else None
+    })
+
+async def metrics_endpoint(scope, receive, send):
+    """Prometheus-style latency histograms per phase, tool and upstream"""
+    body = metrics.render().encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/plain; version=0.0.4"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+ROUTES = {
+    '/api/chat': ('POST', chat),
+    '/api/search': ('POST', search),
+    '/api/functions': ('GET', get_available_functions),
+    '/api/health': ('GET', health_check),
+    '/api/metrics': ('GET', metrics_endpoint),
+}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_chatbot_api.aclose()
+            await llm_clients.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    route = ROUTES.get(scope["path"].rstrip("/") or "/")
+    if route is None:
+        return await send_json(send, {'error': 'Not found'}, 404)
+
+    method, handler = route
+    if scope["method"] == "OPTIONS":
+        return await send_json(send, {}, 200)
+    if scope["method"] != method:
+        return await send_json(send, {'error': 'Method not allowed'}, 405)
+
+    return await handler(scope, receive, send)
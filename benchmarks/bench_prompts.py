@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-request prompt and tool schema construction
+
+Compares rebuilding the system prompt and `tools` list on every request (the
+old behaviour) with the cached PromptTemplates prefix and schema.
+
+Usage:
+    python benchmarks/bench_prompts.py [--iterations 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import AVAILABLE_FUNCTIONS, prompt_templates  # noqa: E402
+from prompts import CONTEXT_SECTION, SYSTEM_PROMPT_PREAMBLE  # noqa: E402
+
+CONTEXT = "\n\n".join(
+    f"Document: report_{i}.pdf\nContent: " + "quarterly revenue figures " * 40
+    for i in range(3)
+)
+
+def rebuild_per_request():
+    """What every chat request used to do"""
+    static_prefix = SYSTEM_PROMPT_PREAMBLE.format(
+        function_names=json.dumps(list(AVAILABLE_FUNCTIONS.keys()), indent=2)
+    )
+    system_prompt = static_prefix + CONTEXT_SECTION.format(context=CONTEXT)
+    tools = [{"type": "function", "function": func} for func in AVAILABLE_FUNCTIONS.values()]
+    return system_prompt, tools
+
+def cached_templates():
+    """Cached prefix and schema, only the context is filled in"""
+    return prompt_templates.system_prompt(CONTEXT), prompt_templates.tools
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    assert rebuild_per_request() == cached_templates()
+
+    results = {}
+    for name, func in (("rebuild_per_request", rebuild_per_request), ("cached_templates", cached_templates)):
+        best = min(timeit.repeat(func, number=args.iterations, repeat=5))
+        results[name] = best / args.iterations * 1e6
+        print(f"{name:>20}: {results[name]:8.2f} us/request")
+
+    print(f"{'speedup':>20}: {results['rebuild_per_request'] / results['cached_templates']:8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time-to-first-token of streamed /api/chat answers
+
+Runs the Flask backend in-process against the fake DocMgr and Groq servers
+and measures, per request, when the typing indicator and the first content
+token reach the client. The "legacy" mode replays the old ordering on the
+same components (search before the response starts, then typing and a
+blocking 0.5 s sleep) so both can be compared on one machine; "pipelined"
+sends `pipeline: true`, which acknowledges slow retrievals with a status event.
+
+Usage:
+    python benchmarks/bench_ttft.py [--requests 20] [--docmgr-latency 0.05] [--first-token-latency 0.1]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeDocMgr, FakeGroq  # noqa: E402
+from harness import configure_environment, percentile, start_flask_backend  # noqa: E402
+
+def add_legacy_route(backend):
+    """Register the pre-change ordering: retrieval, then typing plus a fixed 0.5 s delay"""
+    from flask import Response, request
+
+    def legacy_chat():
+        user_message = request.get_json()["message"]
+        search_results = backend.chatbot_api.search_documents(user_message, n_results=3)
+
+        def generate():
+            yield backend.encode_event("typing", "typing")
+            time.sleep(0.5)
+            yield from backend.generate_chat_response_stream(user_message, search_results, send_typing=False)
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    backend.app.add_url_rule("/bench/legacy-chat", "bench_legacy_chat", legacy_chat, methods=["POST"])
+
+def measure(session, url, message, pipeline=False):
+    started = time.perf_counter()
+    typing_at = first_token_at = None
+    with session.post(url, json={"message": message, "stream": True, "pipeline": pipeline}, stream=True) as response:
+        for line in response.iter_lines():
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[6:])
+            now = time.perf_counter() - started
+            if event["type"] == "typing" and typing_at is None:
+                typing_at = now
+            elif event["type"] == "content" and first_token_at is None:
+                first_token_at = now
+            elif event["type"] in ("end", "error"):
+                break
+    return typing_at, first_token_at
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--docmgr-latency", type=float, default=0.05)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--idle", type=float, default=0.0, help="pause between requests (lets keep-alive connections expire)")
+    args = parser.parse_args()
+
+    import requests
+
+    with FakeDocMgr(latency=args.docmgr_latency) as docmgr, FakeGroq(first_token_latency=args.first_token_latency) as groq:
+        configure_environment(docmgr, groq, SEARCH_CACHE_ENABLED="false")
+        backend = start_flask_backend(setup=add_legacy_route)
+        base_url = backend.url
+        session = requests.Session()
+        try:
+            modes = (("legacy", "/bench/legacy-chat", False), ("current", "/api/chat", False),
+                     ("pipelined", "/api/chat", True))
+            for mode, path, pipeline in modes:
+                typing, ttft = [], []
+                for index in range(args.requests):
+                    typing_at, first_token_at = measure(session, base_url + path, f"quarterly revenue report {index}",
+                                                        pipeline)
+                    typing.append(typing_at)
+                    ttft.append(first_token_at)
+                    time.sleep(args.idle)
+                print(f"{mode:>8}: typing p50 {statistics.median(typing) * 1000:7.1f} ms | "
+                      f"TTFT p50 {statistics.median(ttft) * 1000:7.1f} ms, p95 {percentile(ttft, 95) * 1000:7.1f} ms")
+        finally:
+            backend.stop()
+
+if __name__ == "__main__":
+    main()
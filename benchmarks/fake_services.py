@@ -0,0 +1,359 @@
+"""
+Local stand-ins for DocMgr and the Groq API
+
+Both servers run in background threads on 127.0.0.1 so the chatbot can be
+benchmarked without a live DocMgr, a Groq key or network access. Point the
+chatbot at them with DOCMGR_BASE_URL and GROQ_BASE_URL.
+"""
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+WORDS = (
+    "invoice report contract policy revenue quarterly customer product error code "
+    "deployment server release budget forecast summary meeting roadmap security "
+    "backup migration incident analysis training manual warranty shipment"
+).split()
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _BaseService:
+    """Runs a request handler on an ephemeral port in a daemon thread"""
+
+    handler_class = None
+
+    def __init__(self):
+        self.server = None
+        self.thread = None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        service = self
+
+        class Handler(self.handler_class):
+            pass
+
+        Handler.service = service
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# ---------------------------------------------------------------------------
+# DocMgr
+# ---------------------------------------------------------------------------
+
+class _DocMgrHandler(_JSONHandler):
+    def do_GET(self):
+        service = self.service
+        service.count_request()
+        service.wait()
+        path = urlparse(self.path).path.rstrip("/")
+        parts = path.split("/")
+
+        if path == "":
+            return self.send_json({"name": "Fake DocMgr", "version": "bench", "endpoints": ["/api/documents", "/api/search"]})
+        if path == "/api/documents":
+            return self.send_json(service.list_documents())
+        if path == "/api/vector/stats":
+            return self.send_json(service.vector_stats())
+        if len(parts) >= 4 and parts[1:3] == ["api", "documents"]:
+            try:
+                document_id = int(parts[3])
+            except ValueError:
+                return self.send_json({"detail": "Invalid document id"}, 400)
+            if len(parts) == 5 and parts[4] == "chunks":
+                chunks = service.document_chunks(document_id)
+                if chunks is None:
+                    return self.send_json({"detail": "Document not found"}, 404)
+                return self.send_json(chunks)
+            document = service.get_document(document_id)
+            if document is None:
+                return self.send_json({"detail": "Document not found"}, 404)
+            return self.send_json(document)
+        return self.send_json({"detail": "Not found"}, 404)
+
+    def do_POST(self):
+        service = self.service
+        service.count_request()
+        data = self.read_json()
+        service.wait()
+        if urlparse(self.path).path == "/api/search":
+            return self.send_json(service.search(data.get("query", ""), int(data.get("n_results", 5))))
+        return self.send_json({"detail": "Not found"}, 404)
+
+class FakeDocMgr(_BaseService):
+    """DocMgr stand-in with a generated corpus and configurable latency"""
+
+    handler_class = _DocMgrHandler
+
+    def __init__(self, latency=0.0, jitter=0.0, documents=20, chunks_per_document=10, chunk_chars=800, seed=7):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks_per_document = chunks_per_document
+        self.chunk_chars = chunk_chars
+        self._random = random.Random(seed)
+        self._documents = {}
+        self._chunks = {}
+        for document_id in range(1, documents + 1):
+            self.add_document(document_id)
+
+    def wait(self):
+        delay = self.latency + (random.random() * self.jitter if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _text(self, chars):
+        words = []
+        length = 0
+        while length < chars:
+            word = self._random.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)[:chars]
+
+    def add_document(self, document_id, chunks=None):
+        """Add (or replace) a document and its chunks"""
+        chunks = self.chunks_per_document if chunks is None else chunks
+        filename = f"document_{document_id}.txt"
+        uploaded = datetime(2024, 1, 1) + timedelta(hours=document_id)
+        with self._lock:
+            self._chunks[document_id] = [
+                {
+                    "id": f"{document_id}_{index}",
+                    "content": self._text(self.chunk_chars),
+                    "metadata": {
+                        "document_id": document_id,
+                        "original_filename": filename,
+                        "chunk_index": index
+                    }
+                }
+                for index in range(chunks)
+            ]
+            self._documents[document_id] = {
+                "id": document_id,
+                "filename": filename,
+                "original_filename": filename,
+                "file_type": "txt",
+                "file_size": chunks * self.chunk_chars,
+                "upload_date": uploaded.isoformat(),
+                "chunk_count": chunks
+            }
+
+    def remove_document(self, document_id):
+        with self._lock:
+            self._documents.pop(document_id, None)
+            self._chunks.pop(document_id, None)
+
+    def list_documents(self):
+        with self._lock:
+            return [dict(document) for document in self._documents.values()]
+
+    def get_document(self, document_id):
+        with self._lock:
+            document = self._documents.get(document_id)
+            return dict(document) if document else None
+
+    def document_chunks(self, document_id):
+        with self._lock:
+            chunks = self._chunks.get(document_id)
+            return list(chunks) if chunks is not None else None
+
+    def vector_stats(self):
+        with self._lock:
+            return {
+                "collection_name": "documents",
+                "total_documents": len(self._documents),
+                "total_chunks": sum(len(chunks) for chunks in self._chunks.values())
+            }
+
+    def search(self, query, n_results):
+        """Rank chunks by word overlap with the query (deterministic, cheap)"""
+        terms = set(query.lower().split())
+        with self._lock:
+            chunks = [chunk for chunks in self._chunks.values() for chunk in chunks]
+        scored = []
+        for chunk in chunks:
+            overlap = len(terms & set(chunk["content"].split()))
+            scored.append((overlap, chunk["id"], chunk))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            {**chunk, "distance": round(1.0 / (1 + overlap), 4)}
+            for overlap, _, chunk in scored[:max(n_results, 0)]
+        ]
+
+# ---------------------------------------------------------------------------
+# Groq (OpenAI-compatible chat completions)
+# ---------------------------------------------------------------------------
+
+class _GroqHandler(_JSONHandler):
+    def do_GET(self):
+        self.service.count_request()
+        if urlparse(self.path).path.endswith("/models"):
+            return self.send_json({"object": "list", "data": [{"id": "llama3-8b-8192", "object": "model"}]})
+        return self.send_json({"error": {"message": "Not found"}}, 404)
+
+    def do_POST(self):
+        service = self.service
+        service.count_request()
+        request = self.read_json()
+        if not urlparse(self.path).path.endswith("/chat/completions"):
+            return self.send_json({"error": {"message": "Not found"}}, 404)
+
+        if request.get("model") in service.failing_models:
+            return self.send_json({"error": {"message": f"{request.get('model')} is over capacity"}}, 503)
+
+        tool_calls = service.tool_calls_for(request)
+        if request.get("stream"):
+            return self.stream(request, tool_calls)
+
+        time.sleep(service.latency_for(request) + service.response_tokens / service.tokens_per_second)
+        message = {"role": "assistant", "content": service.answer_text()}
+        if tool_calls:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": f"call_{index}", "type": "function", "function": {"name": name, "arguments": arguments}}
+                    for index, (name, arguments) in enumerate(tool_calls)
+                ]
+            }
+        return self.send_json({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": service.response_tokens, "total_tokens": service.response_tokens}
+        })
+
+    def stream(self, request, tool_calls):
+        service = self.service
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            write(json.dumps({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }))
+
+        try:
+            time.sleep(service.latency_for(request))
+            interval = 1.0 / service.tokens_per_second
+            if tool_calls:
+                for index, (name, arguments) in enumerate(tool_calls):
+                    chunk({"tool_calls": [{"index": index, "id": f"call_{index}", "type": "function",
+                                           "function": {"name": name, "arguments": ""}}]})
+                    # Arguments arrive in small fragments, as they do from the real API
+                    for start in range(0, len(arguments), 8):
+                        time.sleep(interval)
+                        chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 8]}}]})
+                chunk({}, "tool_calls")
+            else:
+                for token in service.answer_tokens():
+                    chunk({"content": token})
+                    time.sleep(interval)
+                chunk({}, "stop")
+            write("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class FakeGroq(_BaseService):
+    """Groq stand-in with a configurable token rate and scripted tool calls
+
+    `tool_calls` is a list of (function_name, json_arguments) pairs returned
+    on the first turn of any request that offers tools; follow-up turns (with
+    tool results in the conversation) get a plain text answer.
+    `model_latency` overrides the first-token latency per model, and models
+    in `failing_models` answer 503, for exercising model failover.
+    """
+
+    handler_class = _GroqHandler
+
+    def __init__(self, first_token_latency=0.05, tokens_per_second=500.0, response_tokens=60, tool_calls=None,
+                 model_latency=None, failing_models=()):
+        super().__init__()
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.tool_calls = tool_calls or []
+        self.model_latency = dict(model_latency or {})
+        self.failing_models = set(failing_models)
+
+    def latency_for(self, request):
+        return self.model_latency.get(request.get("model"), self.first_token_latency)
+
+    def tool_calls_for(self, request):
+        if not request.get("tools") or not self.tool_calls:
+            return []
+        if any(message.get("role") == "tool" for message in request.get("messages", [])):
+            return []
+        return self.tool_calls
+
+    def answer_tokens(self):
+        return [("" if index == 0 else " ") + WORDS[index % len(WORDS)] for index in range(self.response_tokens)]
+
+    def answer_text(self):
+        return "".join(self.answer_tokens())
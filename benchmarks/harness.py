@@ -0,0 +1,82 @@
+"""
+Shared helpers for the benchmark scripts
+
+Starts the chatbot backend in-process against the fake services (Flask via
+werkzeug, or the ASGI app via uvicorn when it is installed) and provides the
+small statistics helpers the scripts report with.
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def configure_environment(docmgr, groq, **overrides):
+    """Point the backend at the fakes; must run before `app` is imported"""
+    os.environ["DOCMGR_BASE_URL"] = docmgr.url
+    os.environ["GROQ_BASE_URL"] = groq.url
+    os.environ["GROQ_API_KEY"] = "bench"
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Backend:
+    def __init__(self, url, module, stop):
+        self.url = url
+        self.module = module
+        self._stop = stop
+
+    def stop(self):
+        self._stop()
+
+def start_flask_backend(setup=None):
+    """Serve app.app on an ephemeral port with werkzeug's threaded server"""
+    import app as backend
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if setup is not None:
+        setup(backend)
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return Backend(f"http://127.0.0.1:{server.server_port}", backend, server.shutdown)
+
+def start_asgi_backend():
+    """Serve asgi_app.app with uvicorn on an ephemeral port"""
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The ASGI backend needs uvicorn: pip install uvicorn")
+    import asgi_app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=5)
+
+    return Backend(f"http://127.0.0.1:{port}", asgi_app, stop)
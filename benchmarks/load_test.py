@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the DocMgr Chatbot backend
+
+Starts a fake DocMgr and a fake Groq endpoint, serves the backend in-process
+(Flask, or the ASGI app with --server asgi) unless --target points at a
+running server, and drives /api/chat (streaming and non-streaming) and
+/api/search at each requested concurrency level. Reports p50/p95/p99
+latency, time-to-first-token, tokens/sec and errors, and can save the
+results as a JSON baseline or compare against a previous one. With
+--paraphrases the question pool includes rewordings of each question, and the
+semantic answer cache's hit rate, lookup latency and false hits (a sampled
+hit whose matched question asks about something else) are reported. The
+semantic cache needs a sentence-transformers embedding model (install the
+package and set LOCAL_EMBEDDING_MODEL); with the default hashing embedder the
+backend turns it off and the run says so.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 50
+    python benchmarks/load_test.py --output benchmarks/results/baseline.json
+    python benchmarks/load_test.py --compare benchmarks/results/baseline.json
+    python benchmarks/load_test.py --tool-call get_all_documents --tool-call 'search_documents:{"query": "invoice"}'
+    python benchmarks/load_test.py --scenarios chat_stream --distinct-messages 50 --paraphrases 3 \
+        --env SEMANTIC_CACHE_ENABLED=true --env SEMANTIC_CACHE_SAMPLE_RATE=1 --env LOCAL_EMBEDDING_MODEL=all-MiniLM-L6-v2
+    python benchmarks/load_test.py --scenarios chat_stream --model-latency llama3-8b-8192=3 \
+        --env GROQ_FALLBACK_MODELS=llama3-70b-8192 --env MODEL_HEDGE_TTFT_MS=500
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import WORDS, FakeDocMgr, FakeGroq  # noqa: E402
+from harness import ROOT, configure_environment, percentile, start_asgi_backend, start_flask_backend  # noqa: E402
+
+SCENARIOS = ("chat_stream", "chat", "search")
+
+# Metrics where a higher value in the current run is a regression
+LOWER_IS_BETTER = ("latency_p50", "latency_p95", "latency_p99", "ttft_p50", "ttft_p95", "ttft_p99", "error_rate")
+
+def estimate_tokens(text):
+    from context_builder import estimate_tokens as estimate
+    return estimate(text)
+
+QUESTION_FORMS = (
+    "What does the {a} {b} say about item {i}?",
+    "Tell me what the {a} {b} says about item {i}.",
+    "What is said about item {i} in the {a} {b}?",
+    "Summarize what the {a} {b} says about item {i}",
+    "item {i}: what does the {a} {b} say",
+)
+
+def make_messages(count, paraphrases=0):
+    """A pool of questions and the topic each one asks about
+
+    A small pool exercises the caches, a large one defeats them. With
+    `paraphrases`, every question is asked again in that many other wordings
+    (after the whole pool has been asked once).
+    """
+    messages = []
+    topics = {}
+    for form in QUESTION_FORMS[:1 + paraphrases]:
+        for i in range(count):
+            message = form.format(a=WORDS[i % len(WORDS)], b=WORDS[(i * 7 + 3) % len(WORDS)], i=i)
+            messages.append(message)
+            topics[message] = i
+    return messages, topics
+
+# ---------------------------------------------------------------------------
+# Scenarios (each returns a result dict for one request)
+# ---------------------------------------------------------------------------
+
+def run_chat_stream(session, base_url, message, timeout):
+    started = time.perf_counter()
+    ttft = None
+    text = []
+    try:
+        with session.post(f"{base_url}/api/chat", json={"message": message, "stream": True},
+                          stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                return {"ok": False, "latency": time.perf_counter() - started, "error": f"HTTP {response.status_code}"}
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event["type"] == "content":
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    text.append(event["content"])
+                elif event["type"] == "error":
+                    return {"ok": False, "latency": time.perf_counter() - started, "error": event["content"][:80]}
+                elif event["type"] == "end":
+                    break
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": type(e).__name__}
+    latency = time.perf_counter() - started
+    return {"ok": True, "latency": latency, "ttft": ttft, "tokens": estimate_tokens("".join(text))}
+
+def run_chat(session, base_url, message, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/api/chat", json={"message": message, "stream": False}, timeout=timeout)
+        latency = time.perf_counter() - started
+        if response.status_code != 200:
+            return {"ok": False, "latency": latency, "error": f"HTTP {response.status_code}"}
+        return {"ok": True, "latency": latency, "tokens": estimate_tokens(response.json().get("response") or "")}
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": type(e).__name__}
+
+def run_search(session, base_url, message, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/api/search", json={"query": message, "n_results": 5}, timeout=timeout)
+        latency = time.perf_counter() - started
+        if response.status_code != 200:
+            return {"ok": False, "latency": latency, "error": f"HTTP {response.status_code}"}
+        return {"ok": True, "latency": latency}
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": type(e).__name__}
+
+SCENARIO_RUNNERS = {"chat_stream": run_chat_stream, "chat": run_chat, "search": run_search}
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def run_level(base_url, scenario, concurrency, total_requests, messages, timeout):
+    """Issue `total_requests` requests from `concurrency` worker threads"""
+    import requests
+
+    runner = SCENARIO_RUNNERS[scenario]
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            result = runner(session, base_url, messages[index % len(messages)], timeout)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(scenario, concurrency, results, time.perf_counter() - started)
+
+def summarize(scenario, concurrency, results, wall_time):
+    ok = [result for result in results if result["ok"]]
+    latencies = [result["latency"] for result in ok]
+    ttfts = [result["ttft"] for result in ok if result.get("ttft") is not None]
+    tokens = sum(result.get("tokens", 0) for result in ok)
+    errors = {}
+    for result in results:
+        if not result["ok"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+
+    # Per-stream generation rate: tokens over the time after the first token
+    stream_rates = [
+        result["tokens"] / (result["latency"] - result["ttft"])
+        for result in ok
+        if result.get("ttft") is not None and result.get("tokens") and result["latency"] > result["ttft"]
+    ]
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "error_kinds": errors,
+        "throughput_rps": round(len(results) / wall_time, 2) if wall_time else None,
+        "latency_p50": ms(percentile(latencies, 50)),
+        "latency_p95": ms(percentile(latencies, 95)),
+        "latency_p99": ms(percentile(latencies, 99)),
+        "ttft_p50": ms(percentile(ttfts, 50)),
+        "ttft_p95": ms(percentile(ttfts, 95)),
+        "ttft_p99": ms(percentile(ttfts, 99)),
+        "tokens_per_sec": round(tokens / wall_time, 1) if wall_time and tokens else None,
+        "stream_tokens_per_sec_p50": round(percentile(stream_rates, 50), 1) if stream_rates else None
+    }
+
+def print_table(rows):
+    header = f"{'scenario':<12}{'conc':>5}{'reqs':>6}{'err':>5}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft50':>9}{'ttft95':>9}{'tok/s':>9}"
+    print(header)
+    print("-" * len(header))
+
+    def fmt(value, width):
+        return f"{value:>{width}}" if value is not None else f"{'-':>{width}}"
+
+    for row in rows:
+        print(f"{row['scenario']:<12}{row['concurrency']:>5}{row['requests']:>6}{row['errors']:>5}"
+              f"{fmt(row['throughput_rps'], 9)}{fmt(row['latency_p50'], 10)}{fmt(row['latency_p95'], 10)}"
+              f"{fmt(row['latency_p99'], 10)}{fmt(row['ttft_p50'], 9)}{fmt(row['ttft_p95'], 9)}"
+              f"{fmt(row['tokens_per_sec'], 9)}")
+
+def compare(rows, baseline_path, threshold):
+    """Print metric deltas against a saved baseline; return the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(row["scenario"], row["concurrency"]): row for row in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (regression threshold {threshold:.0%}):")
+    for row in rows:
+        previous = baseline.get((row["scenario"], row["concurrency"]))
+        if previous is None:
+            print(f"  {row['scenario']} @ {row['concurrency']}: no baseline")
+            continue
+        for metric in LOWER_IS_BETTER:
+            before, after = previous.get(metric), row.get(metric)
+            if before is None or after is None:
+                continue
+            if metric == "error_rate":
+                regressed = after > before + 0.01
+                change = f"{before:.2%} -> {after:.2%}"
+            else:
+                regressed = before > 0 and after > before * (1 + threshold)
+                change = f"{before:.1f} -> {after:.1f} ms ({(after - before) / before:+.1%})" if before else f"{before} -> {after}"
+            if regressed:
+                regressions += 1
+            marker = "REGRESSION" if regressed else "ok"
+            print(f"  {row['scenario']:<12} c={row['concurrency']:<4} {metric:<12} {change:<40} {marker}")
+    return regressions
+
+def semantic_cache_report(base_url, topics):
+    """Hit rate, lookup latency and sampled false hits of the backend's semantic cache"""
+    import requests
+
+    try:
+        stats = requests.get(f"{base_url}/api/health", timeout=10).json().get("semantic_cache")
+    except (requests.RequestException, ValueError):
+        return None
+    if not stats:
+        return None
+    samples = [
+        sample for sample in stats.get("samples", [])
+        if sample["question"] in topics and sample["matched"] in topics
+    ]
+    false_hits = [sample for sample in samples if topics[sample["question"]] != topics[sample["matched"]]]
+    return {
+        "lookups": stats["lookups"],
+        "hits": stats["hits"],
+        "hit_rate": round(stats["hit_rate"], 4) if stats["hit_rate"] is not None else None,
+        "threshold": stats["threshold"],
+        "model": stats["model"],
+        "lookup_ms_p50": stats["lookup_ms_p50"],
+        "lookup_ms_p95": stats["lookup_ms_p95"],
+        "sampled_hits": len(samples),
+        "false_hits": len(false_hits),
+        "false_hit_rate": round(len(false_hits) / len(samples), 4) if samples else None,
+        "false_hit_examples": false_hits[:5]
+    }
+
+def model_router_report(base_url):
+    """The backend's model routing stats: hedges, fallbacks and each model's recent TTFT and error rate"""
+    import requests
+
+    try:
+        return requests.get(f"{base_url}/api/health", timeout=10).json().get("model_router")
+    except (requests.RequestException, ValueError):
+        return None
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_tool_call(value):
+    name, _, arguments = value.partition(":")
+    arguments = arguments or "{}"
+    json.loads(arguments)
+    return name, arguments
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario and level")
+    parser.add_argument("--distinct-messages", type=int, default=1000, help="size of the question pool")
+    parser.add_argument("--paraphrases", type=int, default=0, choices=range(len(QUESTION_FORMS)),
+                        help="extra wordings of each question (exercises the semantic answer cache)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--target", help="benchmark an already running backend instead (fakes are not used)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="backend setting override")
+
+    docmgr = parser.add_argument_group("fake DocMgr")
+    docmgr.add_argument("--docmgr-latency", type=float, default=0.02)
+    docmgr.add_argument("--docmgr-jitter", type=float, default=0.01)
+    docmgr.add_argument("--documents", type=int, default=50)
+    docmgr.add_argument("--chunks-per-document", type=int, default=20)
+    docmgr.add_argument("--chunk-chars", type=int, default=800)
+
+    groq = parser.add_argument_group("fake Groq")
+    groq.add_argument("--first-token-latency", type=float, default=0.1)
+    groq.add_argument("--tokens-per-second", type=float, default=400.0)
+    groq.add_argument("--response-tokens", type=int, default=80)
+    groq.add_argument("--tool-call", action="append", default=[], metavar="NAME[:JSON_ARGS]",
+                      help="tool call the fake model makes on its first turn (repeatable)")
+    groq.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                      help="first-token latency of one model (repeatable; exercises model hedging)")
+    groq.add_argument("--failing-model", action="append", default=[], metavar="MODEL",
+                      help="model that answers 503 (repeatable; exercises model failover)")
+
+    output = parser.add_argument_group("results")
+    output.add_argument("--output", help="write results as JSON (a baseline for --compare)")
+    output.add_argument("--compare", help="compare against a saved JSON baseline")
+    output.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIO_RUNNERS:
+            parser.error(f"unknown scenario: {name}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    messages, topics = make_messages(args.distinct_messages, args.paraphrases)
+    env = dict(item.split("=", 1) for item in args.env)
+
+    fakes = []
+    backend = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            fake_docmgr = FakeDocMgr(latency=args.docmgr_latency, jitter=args.docmgr_jitter, documents=args.documents,
+                                     chunks_per_document=args.chunks_per_document, chunk_chars=args.chunk_chars).start()
+            fake_groq = FakeGroq(first_token_latency=args.first_token_latency, tokens_per_second=args.tokens_per_second,
+                                 response_tokens=args.response_tokens,
+                                 tool_calls=[parse_tool_call(value) for value in args.tool_call],
+                                 model_latency={model: float(seconds) for model, seconds in
+                                                (value.split("=", 1) for value in args.model_latency)},
+                                 failing_models=args.failing_model).start()
+            fakes = [fake_docmgr, fake_groq]
+            configure_environment(fake_docmgr, fake_groq, **env)
+            backend = start_asgi_backend() if args.server == "asgi" else start_flask_backend()
+            base_url = backend.url
+
+        rows = []
+        for scenario in scenarios:
+            for level in levels:
+                rows.append(run_level(base_url, scenario, level, args.requests, messages, args.timeout))
+                row = rows[-1]
+                print(f"  {scenario} @ {level}: {row['requests']} requests, {row['errors']} errors, "
+                      f"p50 {row['latency_p50']} ms", file=sys.stderr)
+
+        print()
+        print_table(rows)
+
+        semantic = semantic_cache_report(base_url, topics)
+        if semantic is None and args.paraphrases:
+            print("\nSemantic cache is off, so no hit rate was measured: it needs SEMANTIC_CACHE_ENABLED=true and a "
+                  "sentence-transformers LOCAL_EMBEDDING_MODEL (it turns itself off with the hashing embedder)",
+                  file=sys.stderr)
+        if semantic:
+            print(f"\nSemantic cache ({semantic['model']}, threshold {semantic['threshold']}): "
+                  f"{semantic['hits']}/{semantic['lookups']} hits, lookup p50 {semantic['lookup_ms_p50']} ms, "
+                  f"p95 {semantic['lookup_ms_p95']} ms")
+            if semantic["sampled_hits"]:
+                print(f"  false hits: {semantic['false_hits']} of {semantic['sampled_hits']} sampled hits")
+                for sample in semantic["false_hit_examples"]:
+                    print(f"    {sample['similarity']}: {sample['question']!r} -> {sample['matched']!r}")
+
+        router = model_router_report(base_url)
+        if router and len(router["models"]) > 1:
+            print(f"\nModel router: {router['hedges']} hedges, {router['fallbacks']} fallbacks")
+            for model, health in router["models"].items():
+                ttft = f"{health['ttft_p50'] * 1000:.0f} ms" if health["ttft_p50"] is not None else "-"
+                print(f"  {model:<24} {health['calls']:>4} recent calls, error rate {health['error_rate']}, "
+                      f"ttft p50 {ttft}")
+
+        if args.output:
+            report = {
+                "meta": {
+                    "created": datetime.now(timezone.utc).isoformat(),
+                    "git_revision": git_revision(),
+                    "python": platform.python_version(),
+                    "server": "external" if args.target else args.server,
+                    "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+                },
+                "results": rows,
+                "semantic_cache": semantic,
+                "model_router": router
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResults written to {args.output}")
+
+        if args.compare:
+            regressions = compare(rows, args.compare, args.threshold)
+            if regressions:
+                print(f"\n{regressions} regression(s) found")
+                sys.exit(1)
+    finally:
+        if backend is not None:
+            backend.stop()
+        for fake in fakes:
+            fake.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Token-budgeted prompt context assembly
+
+Keeps prompt size bounded regardless of corpus size: retrieved chunks are
+packed best-first into a token budget, and tool results are trimmed or
+summarized before they are added to the conversation. Token counts are a
+local estimate (no tokenizer download or API call) that errs on the high
+side for English text and code.
+"""
+
+import json
+import re
+
+# Words, numbers and individual punctuation marks each cost at least a token;
+# long words are split roughly every four characters, as BPE tokenizers do.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_CHARS_PER_WORD_PIECE = 4
+
+TRUNCATION_MARKER = " ...[truncated]"
+
+def estimate_tokens(text):
+    """Estimate how many model tokens `text` will use"""
+    if not text:
+        return 0
+    tokens = 0
+    for match in _TOKEN_RE.finditer(text):
+        tokens += max(1, -(-len(match.group()) // _CHARS_PER_WORD_PIECE))
+    return tokens
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut `text` so that it stays within `max_tokens`, marking the cut"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens - estimate_tokens(TRUNCATION_MARKER)
+    used = 0
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        cost = max(1, -(-len(match.group()) // _CHARS_PER_WORD_PIECE))
+        if used + cost > budget:
+            break
+        used += cost
+        end = match.end()
+    return text[:end] + TRUNCATION_MARKER
+
+def chunk_score(chunk):
+    """Relevance of a search result; higher is better"""
+    for key in ("score", "similarity", "relevance_score"):
+        value = chunk.get(key)
+        if isinstance(value, (int, float)):
+            return value
+    distance = chunk.get("distance")
+    if isinstance(distance, (int, float)):
+        return -distance
+    return None
+
+def format_chunk(chunk):
+    metadata = chunk.get("metadata") or {}
+    filename = metadata.get("original_filename", "unknown")
+    return f"Document: {filename}\nContent: {chunk.get('content', '')}"
+
+def build_context(context_chunks, max_tokens, min_chunk_tokens=50):
+    """Pack the highest-scoring chunks into `max_tokens`, truncating the last one if needed"""
+    ranked = list(enumerate(context_chunks or []))
+    # Keep DocMgr's order for ties and unscored results
+    ranked.sort(key=lambda item: (-(chunk_score(item[1]) or 0), item[0]))
+
+    separator_tokens = estimate_tokens("\n\n")
+    parts = []
+    remaining = max_tokens
+    for _, chunk in ranked:
+        text = format_chunk(chunk)
+        cost = estimate_tokens(text) + (separator_tokens if parts else 0)
+        if cost <= remaining:
+            parts.append(text)
+            remaining -= cost
+        elif remaining >= min_chunk_tokens:
+            parts.append(truncate_to_tokens(text, remaining - separator_tokens))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return "\n\n".join(parts)
+
+def _trim_strings(value, max_chars):
+    """Shorten every long string inside a JSON-like value"""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + TRUNCATION_MARKER
+    if isinstance(value, list):
+        return [_trim_strings(item, max_chars) for item in value]
+    if isinstance(value, dict):
+        return {key: _trim_strings(item, max_chars) for key, item in value.items()}
+    return value
+
+class ItemBudget:
+    """Token (and optional item count) budget for the leading items of a list tool result
+
+    Items are costed with their long text fields shortened, as they are
+    sent to the model, so a caller reading a list one item at a time can
+    stop as soon as take() reports that the next one no longer fits.
+    """
+
+    def __init__(self, max_tokens=None, max_items=None, max_field_chars=500, reserved_tokens=0):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_field_chars = max_field_chars
+        self.used = reserved_tokens
+        self.taken = 0
+        self.truncated = False
+
+    def take(self, item, whole_first=False):
+        """Count `item` against the budget; returns (fits, item with long text fields shortened)
+
+        With `whole_first` the item is kept as it is when it fits, and only
+        shortened when it would not.
+        """
+        if self.max_items is not None and self.taken >= self.max_items:
+            self.truncated = True
+            return False, None
+        trimmed = _trim_strings(item, self.max_field_chars)
+        for candidate in ((item, trimmed) if whole_first else (trimmed,)):
+            cost = estimate_tokens(json.dumps(candidate, default=str)) + 1
+            if self.max_tokens is None or self.used + cost <= self.max_tokens:
+                self.used += cost
+                self.taken += 1
+                return True, candidate
+        self.truncated = True
+        return False, None
+
+def fit_tool_result(result, max_tokens, max_field_chars=500):
+    """Serialize a tool result for the model, bounded to `max_tokens`
+
+    Lists keep as many leading items as fit (with long text fields
+    shortened) and report how many were left out; anything else that is
+    still too large is cut off.
+    """
+    text = json.dumps(result, default=str)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    if isinstance(result, list):
+        kept = []
+        envelope = {"total_items": len(result), "returned_items": 0, "truncated": True, "items": kept}
+        budget = ItemBudget(max_tokens, max_field_chars=max_field_chars,
+                            reserved_tokens=estimate_tokens(json.dumps(envelope)))
+        for item in result:
+            fits, trimmed = budget.take(item)
+            if not fits:
+                break
+            kept.append(trimmed)
+        envelope["returned_items"] = len(kept)
+        if kept or not result:
+            return json.dumps(envelope, default=str)
+
+    trimmed = json.dumps(_trim_strings(result, max_field_chars), default=str)
+    if estimate_tokens(trimmed) <= max_tokens:
+        return trimmed
+    return truncate_to_tokens(trimmed, max_tokens)
@@ -0,0 +1,229 @@
+"""
+Incremental corpus sync from DocMgr
+
+Lists DocMgr's documents once per pass and fingerprints each one (id, size,
+updated/upload timestamp, chunk count). Only new or changed documents have
+their chunks fetched, a bounded number at a time, and documents that
+disappeared are reported as removed. Fingerprints are persisted, so after a
+restart a pass costs one listing call plus the documents that changed while
+the process was down. The last pass's listing is kept (and persisted) too, so
+document listings can be served without calling DocMgr. The consumer (the local index) receives each pass's
+changes through `on_change` before the new state is saved, so a failed
+update is simply retried on the next pass.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from resilience import DocMgrUnavailable
+
+FINGERPRINT_FIELDS = (
+    ("id",),
+    ("file_size", "size"),
+    ("updated_at", "modified_date", "upload_date"),
+    ("chunk_count",),
+)
+
+def document_fingerprint(document):
+    """Stable digest of the fields that change when a document's content does"""
+    values = []
+    for candidates in FINGERPRINT_FIELDS:
+        values.append(next((document[key] for key in candidates if document.get(key) is not None), None))
+    return hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+class SyncResult:
+    """Outcome of one sync pass"""
+
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self.failed = []
+        self.unchanged = 0
+        self.chunk_requests = 0
+        self.seconds = 0.0
+
+    @property
+    def changed(self):
+        return bool(self.added or self.updated or self.removed)
+
+    def as_dict(self):
+        return {
+            "added": len(self.added),
+            "updated": len(self.updated),
+            "removed": len(self.removed),
+            "failed": len(self.failed),
+            "unchanged": self.unchanged,
+            "chunk_requests": self.chunk_requests,
+            "seconds": round(self.seconds, 3)
+        }
+
+class CorpusSync:
+    """Keeps a consumer in step with DocMgr, fetching only what changed
+
+    `on_change(changed, removed, corpus_version)` receives a dict of
+    document id -> (document, chunks) for new and changed documents and the
+    ids of removed ones. Ids are strings, as they are in the saved state.
+    """
+
+    def __init__(self, api, state_path, on_change, workers=4):
+        self.api = api
+        self.state_path = state_path
+        self.on_change = on_change
+        self.workers = max(1, workers)
+        self._fingerprints = {}
+        self._catalog = None
+        self._sync_lock = threading.Lock()
+        self._syncs = 0
+        self._synced_at = None
+        self._last_result = None
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self._fingerprints = dict(state.get("documents") or {})
+            self._catalog = state.get("catalog")
+            self._synced_at = state.get("synced_at")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable corpus sync state {self.state_path}: {e}")
+
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"documents": self._fingerprints, "catalog": self._catalog, "synced_at": self._synced_at}, f)
+        os.replace(tmp, self.state_path)
+
+    def reset(self):
+        """Forget every fingerprint so the next pass fetches the whole corpus"""
+        with self._sync_lock:
+            self._fingerprints = {}
+
+    def documents(self):
+        """DocMgr's document listing as of the last successful pass, or None before the first one"""
+        return self._catalog
+
+    @property
+    def synced_at(self):
+        """Wall-clock time of the last successful pass, or None"""
+        return self._synced_at
+
+    @property
+    def corpus_version(self):
+        """Digest of every document fingerprint"""
+        digest = hashlib.sha1()
+        for document_id, fingerprint in sorted(self._fingerprints.items()):
+            digest.update(f"{document_id}:{fingerprint};".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _fetch_chunks(self, document):
+        try:
+            chunks = self.api.get_document_chunks(document["id"])
+        except DocMgrUnavailable:
+            return None
+        # ChatbotAPI returns [] on errors; only trust an empty list for an empty document
+        if not chunks and document.get("chunk_count"):
+            return None
+        return chunks or []
+
+    def sync(self):
+        """Run one pass; returns a SyncResult (nothing is applied if listing fails)"""
+        with self._sync_lock:
+            started = time.perf_counter()
+            result = SyncResult()
+
+            documents = self.api.get_all_documents()
+            if not isinstance(documents, list):
+                raise ValueError("DocMgr returned an invalid document list")
+            if not documents and self._fingerprints:
+                # get_all_documents also returns [] on errors; wait for a non-empty listing
+                # before dropping everything, unless the corpus really was emptied
+                stats = self.api.get_vector_stats()
+                if not stats or stats.get("total_documents"):
+                    raise ValueError("DocMgr returned no documents")
+
+            current = {}
+            to_fetch = []
+            catalog = []
+            for document in documents:
+                if not isinstance(document, dict) or document.get("id") is None:
+                    continue
+                catalog.append(document)
+                document_id = str(document["id"])
+                fingerprint = document_fingerprint(document)
+                current[document_id] = fingerprint
+                previous = self._fingerprints.get(document_id)
+                if previous == fingerprint:
+                    result.unchanged += 1
+                else:
+                    to_fetch.append((document_id, document, previous is None))
+
+            changed = {}
+            fingerprints = {key: value for key, value in self._fingerprints.items() if key in current}
+            if to_fetch:
+                with ThreadPoolExecutor(max_workers=min(self.workers, len(to_fetch)),
+                                        thread_name_prefix="corpus-sync") as pool:
+                    fetched = pool.map(lambda item: self._fetch_chunks(item[1]), to_fetch)
+                    for (document_id, document, is_new), chunks in zip(to_fetch, fetched):
+                        result.chunk_requests += 1
+                        if chunks is None:
+                            result.failed.append(document_id)
+                            continue
+                        changed[document_id] = (document, chunks)
+                        fingerprints[document_id] = current[document_id]
+                        (result.added if is_new else result.updated).append(document_id)
+
+            result.removed = [document_id for document_id in self._fingerprints if document_id not in current]
+
+            if result.changed:
+                previous_fingerprints = self._fingerprints
+                self._fingerprints = fingerprints
+                try:
+                    self.on_change(changed, result.removed, self.corpus_version)
+                except Exception:
+                    self._fingerprints = previous_fingerprints
+                    raise
+            self._catalog = catalog
+            self._synced_at = time.time()
+            self._save_state()
+
+            result.seconds = time.perf_counter() - started
+            self._syncs += 1
+            self._last_result = result
+            return result
+
+    def start(self, interval):
+        """Sync now and then every `interval` seconds from a daemon thread (once if interval <= 0)"""
+        def run():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Error syncing corpus from DocMgr: {e}")
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="corpus-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        last_result = self._last_result
+        return {
+            "documents": len(self._fingerprints),
+            "workers": self.workers,
+            "syncs": self._syncs,
+            "synced_at": self._synced_at,
+            "last_sync": last_result.as_dict() if last_result else None
+        }
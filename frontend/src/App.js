@@ -10,6 +10,8 @@ function App() {
     const [searchResults, setSearchResults] = useState([]);
     const [showSearch, setShowSearch] = useState(false);
     const [isTyping, setIsTyping] = useState(false);
+    const [statusText, setStatusText] = useState('');
+    const [sessionId, setSessionId] = useState(''); // server-side conversation history
     const [isFunctionCalling, setIsFunctionCalling] = useState(false);
     const [availableFunctions, setAvailableFunctions] = useState([]);
     const [activeTab, setActiveTab] = useState('chat'); // 'chat', 'search', 'documents'
@@ -187,10 +189,27 @@ function App() {
                 },
                 body: JSON.stringify({
                     message: inputMessage,
-                    stream: true
+                    stream: true,
+                    session_id: sessionId
                 })
             });
 
+            if (response.headers.get('X-Session-ID')) {
+                setSessionId(response.headers.get('X-Session-ID'));
+            }
+
+            if (response.status === 429 || response.status === 503) {
+                // Turned away by admission control; tell the user when to retry
+                const body = await response.json().catch(() => ({}));
+                const retryAfter = body.retry_after || response.headers.get('Retry-After') || 1;
+                setMessages(prev => prev.map(msg =>
+                    msg.id === botMessageId
+                        ? { ...msg, text: `⏳ ${body.error || 'The chatbot is busy right now.'} Please try again in ${retryAfter}s.`, isStreaming: false }
+                        : msg
+                ));
+                return;
+            }
+
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -216,8 +235,12 @@ function App() {
                                 case 'typing':
                                     setIsTyping(true);
                                     break;
+                                case 'status':
+                                    setStatusText(data.content);
+                                    break;
                                 case 'start':
                                     setIsTyping(false);
+                                    setStatusText('');
                                     break;
                                 case 'function_call':
                                     setIsFunctionCalling(true);
@@ -243,6 +266,8 @@ function App() {
                                     ));
                                     break;
                                 case 'error':
+                                    setIsTyping(false);
+                                    setStatusText('');
                                     setMessages(prev => prev.map(msg =>
                                         msg.id === botMessageId
                                             ? { ...msg, text: msg.text + '\n\n❌ Error: ' + data.content, isStreaming: false }
@@ -267,6 +292,7 @@ function App() {
         } finally {
             setIsLoading(false);
             setIsTyping(false);
+            setStatusText('');
             setIsFunctionCalling(false);
         }
     };
@@ -331,6 +357,9 @@ function App() {
                                             <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '0.1s' }}></div>
                                             <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '0.2s' }}></div>
                                         </div>
+                                        {statusText && (
+                                            <div className="text-xs text-gray-500 mt-1">{statusText}</div>
+                                        )}
                                     </div>
                                 </div>
                             )}
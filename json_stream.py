@@ -0,0 +1,101 @@
+"""
+Incremental parsing of JSON array responses
+
+DocMgr answers document listings and chunk listings with one JSON array,
+which for a large corpus or a long document runs to megabytes. Rather than
+buffer the whole body and parse it into one object, JSONArrayParser is fed
+the body as it arrives and hands back each item as soon as it is complete,
+keeping only the unfinished item in memory, so a caller with a budget can
+stop reading (and close the connection) once it has enough items.
+"""
+
+import codecs
+import json
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+class JSONArrayParser:
+    """Feed a JSON body in pieces; complete top-level array items come back from feed()
+
+    A body that is not an array is buffered and returned whole by close().
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._is_array = None
+        self._expect_item = True
+        self.done = False
+        self.items = 0
+
+    def feed(self, data):
+        """Add the next piece of the body (bytes or str); returns the items it completed"""
+        text = self._text.decode(data) if isinstance(data, bytes) else data
+        if self.done or not text:
+            return []
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        if self._is_array is None:
+            stripped = self._buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                return []
+            self._is_array = stripped[0] == "["
+            self._pos = len(self._buffer) - len(stripped) + 1
+        if not self._is_array:
+            self._pos = 0
+            return []
+        return self._parse()
+
+    def _parse(self):
+        buffer = self._buffer
+        items = []
+        while True:
+            pos = self._skip_whitespace(buffer, self._pos)
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self.done = True
+                self._pos = pos + 1
+                break
+            if not self._expect_item:
+                if buffer[pos] != ",":
+                    raise ValueError(f"expected ',' or ']' in JSON array at offset {pos}")
+                self._expect_item = True
+                self._pos = pos + 1
+                continue
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # The item is not complete yet
+                self._pos = pos
+                break
+            if end == len(buffer) and not isinstance(item, (dict, list, str)):
+                # A number or literal at the very end may continue in the next piece
+                self._pos = pos
+                break
+            items.append(item)
+            self.items += 1
+            self._expect_item = False
+            self._pos = end
+        return items
+
+    @staticmethod
+    def _skip_whitespace(buffer, pos):
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def close(self):
+        """Finish the body: the whole value when it was not an array, else None; raises ValueError if cut short"""
+        tail = self._text.decode(b"", final=True)
+        if self._is_array is False:
+            return json.loads(self._buffer + tail)
+        if not self.done:
+            if self._is_array is None and not (self._buffer + tail).strip(_WHITESPACE):
+                raise ValueError("empty JSON body")
+            raise ValueError("JSON array ended early")
+        return None
@@ -0,0 +1,157 @@
+"""
+Paging, filtering and field projection for document and chunk listings
+
+The get_all_documents and get_document_chunks tools take `limit` and
+`offset`, a `fields` list and (for documents) filename, file type and upload
+date filters, so a tool result is only as large as the page the model asked
+for. A Page is fed the listing one item at a time, from the local copy of
+the corpus or straight off DocMgr's streamed response, and reports when it
+is full so the rest of a DocMgr listing is never read.
+"""
+
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from context_builder import ItemBudget, estimate_tokens
+
+DOCUMENT_FIELDS = ("id", "filename", "original_filename", "file_type", "file_size", "upload_date", "chunk_count")
+CHUNK_FIELDS = ("id", "content", "metadata")
+
+ListingQuery = namedtuple(
+    "ListingQuery",
+    ("limit", "offset", "fields", "filename", "file_type", "uploaded_after", "uploaded_before"),
+    defaults=(None, None, None, None, None)
+)
+
+def _non_negative_int(arguments, name, default):
+    value = arguments.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if value < 0:
+        raise ValueError(f"{name} must not be negative")
+    return value
+
+def _iso_date(arguments, name):
+    value = arguments.get(name)
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date such as 2024-01-31")
+    return value
+
+def parse_listing_query(arguments, allowed_fields, default_limit, max_limit=None, filters=False):
+    """Read paging, projection and (with `filters`) document filter arguments; returns (query, error)"""
+    try:
+        limit = _non_negative_int(arguments, "limit", default_limit) or default_limit
+        if max_limit:
+            limit = min(limit, max_limit)
+        offset = _non_negative_int(arguments, "offset", 0)
+
+        fields = arguments.get("fields") or None
+        if fields is not None:
+            if isinstance(fields, str):
+                fields = [field.strip() for field in fields.split(",")]
+            unknown = [field for field in fields if field not in allowed_fields]
+            if unknown:
+                raise ValueError(f"unknown fields {unknown}; choose from {list(allowed_fields)}")
+            # Keep the id so the model can follow up on any item it is shown
+            fields = tuple(dict.fromkeys(["id", *fields]))
+
+        if not filters:
+            return ListingQuery(limit, offset, fields), None
+        filename = str(arguments.get("filename") or "").strip().lower() or None
+        file_type = str(arguments.get("file_type") or "").strip().lower().lstrip(".") or None
+        return ListingQuery(limit, offset, fields, filename, file_type,
+                            _iso_date(arguments, "uploaded_after"), _iso_date(arguments, "uploaded_before")), None
+    except ValueError as e:
+        return None, str(e)
+
+def matches(item, query):
+    """Whether a document passes the query's filters (items are never filtered by a query without any)"""
+    if query.filename:
+        names = (item.get("original_filename"), item.get("filename"))
+        if not any(query.filename in str(name).lower() for name in names if name):
+            return False
+    if query.file_type and str(item.get("file_type") or "").lower().lstrip(".") != query.file_type:
+        return False
+    if query.uploaded_after or query.uploaded_before:
+        # ISO timestamps compare correctly as strings, and a date bound compares against the day
+        uploaded = str(item.get("upload_date") or "")
+        if not uploaded:
+            return False
+        if query.uploaded_after and uploaded < query.uploaded_after:
+            return False
+        if query.uploaded_before and uploaded >= query.uploaded_before:
+            return False
+    return True
+
+def project(item, fields):
+    """`item` cut down to `fields` (all of it when fields is None)"""
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+class Page:
+    """One page of a listing, collected from the listing's items in order"""
+
+    def __init__(self, query, max_tokens=None):
+        self.query = query
+        envelope = {"items": [], "offset": query.offset, "returned_items": 0, "next_offset": None}
+        self.budget = ItemBudget(max_tokens, reserved_tokens=estimate_tokens(json.dumps(envelope))) \
+            if max_tokens else None
+        self.items = []
+        self.matched = 0
+        self.has_more = False
+        self.truncated = False
+
+    def add(self, item):
+        """Take the next listing item; returns False once the page is full and reading can stop"""
+        if not isinstance(item, dict) or not matches(item, self.query):
+            return True
+        self.matched += 1
+        if self.matched <= self.query.offset:
+            return True
+        if len(self.items) >= self.query.limit:
+            self.has_more = True
+            return False
+        item = project(item, self.query.fields)
+        if self.budget is not None:
+            fits, item = self.budget.take(item, whole_first=True)
+            if not fits:
+                # The page is cut short; the model can continue from next_offset
+                self.has_more = self.truncated = True
+                return False
+        self.items.append(item)
+        return True
+
+    def result(self, total=None):
+        """The page as a tool result; `total` (matching items) is known only for local listings"""
+        offset = self.query.offset
+        result = {
+            "items": self.items,
+            "offset": offset,
+            "returned_items": len(self.items),
+            "next_offset": offset + len(self.items) if self.has_more else None
+        }
+        if self.truncated:
+            result["truncated"] = True
+        if total is not None:
+            result["total_items"] = total
+        return result
+
+def paginate(items, query, max_tokens=None):
+    """A page of an in-memory listing, with the number of items matching the filters"""
+    page = Page(query, max_tokens)
+    for item in items:
+        if not page.add(item):
+            break
+    total = sum(1 for item in items if isinstance(item, dict) and matches(item, query))
+    return page.result(total)
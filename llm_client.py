@@ -0,0 +1,143 @@
+"""
+Process-wide Groq client management
+
+Builds the Groq (and AsyncGroq) client once, lazily, on top of a pooled
+httpx client so HTTP connections to the Groq API are reused across chat
+requests. Also keeps simple counters for time-to-first-token and for how
+many requests were served over an already-open connection, and can report
+each Groq call's latency (up to the response headers) to an observer.
+"""
+
+import threading
+import time
+
+import httpx
+
+class LLMClientManager:
+    """Lazily creates and shares one Groq client per process"""
+
+    def __init__(self, api_key, pool_size=20, connect_timeout=5.0, read_timeout=60.0, max_retries=2,
+                 observer=None):
+        self.api_key = api_key
+        self.observer = observer
+        self.pool_size = pool_size
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._connections_opened = 0
+        self._ttft_count = 0
+        self._ttft_total = 0.0
+        self._ttft_max = 0.0
+        self._ttft_last = None
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+
+    def _count_request(self):
+        with self._stats_lock:
+            self._requests += 1
+
+    def _count_trace_event(self, event_name):
+        # httpcore only emits connect_tcp when it has to open a new connection
+        if event_name.endswith("connect_tcp.complete"):
+            with self._stats_lock:
+                self._connections_opened += 1
+
+    def _on_request(self, request):
+        self._count_request()
+
+        def trace(event_name, info):
+            self._count_trace_event(event_name)
+
+        request.extensions = {**request.extensions, "trace": trace, "started": time.perf_counter()}
+
+    async def _on_async_request(self, request):
+        self._count_request()
+
+        async def trace(event_name, info):
+            self._count_trace_event(event_name)
+
+        request.extensions = {**request.extensions, "trace": trace, "started": time.perf_counter()}
+
+    def _observe_response(self, response):
+        started = response.request.extensions.get("started")
+        if self.observer is not None and started is not None:
+            self.observer("groq", response.request.url.path, response.status_code, time.perf_counter() - started)
+
+    def _on_response(self, response):
+        self._observe_response(response)
+
+    async def _on_async_response(self, response):
+        self._observe_response(response)
+
+    def get_client(self):
+        """Return the shared synchronous Groq client, creating it on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from groq import Groq
+                    http_client = httpx.Client(
+                        limits=self._limits(),
+                        timeout=self.timeout,
+                        event_hooks={"request": [self._on_request], "response": [self._on_response]}
+                    )
+                    self._client = Groq(
+                        api_key=self.api_key,
+                        timeout=self.timeout,
+                        max_retries=self.max_retries,
+                        http_client=http_client
+                    )
+        return self._client
+
+    def get_async_client(self):
+        """Return the shared AsyncGroq client, creating it on first use"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    from groq import AsyncGroq
+                    http_client = httpx.AsyncClient(
+                        limits=self._limits(),
+                        timeout=self.timeout,
+                        event_hooks={"request": [self._on_async_request], "response": [self._on_async_response]}
+                    )
+                    self._async_client = AsyncGroq(
+                        api_key=self.api_key,
+                        timeout=self.timeout,
+                        max_retries=self.max_retries,
+                        http_client=http_client
+                    )
+        return self._async_client
+
+    async def aclose(self):
+        """Close the async client's connections (called on ASGI shutdown)"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def record_first_token(self, seconds):
+        """Record the time between sending a completion request and its first token"""
+        with self._stats_lock:
+            self._ttft_count += 1
+            self._ttft_total += seconds
+            self._ttft_max = max(self._ttft_max, seconds)
+            self._ttft_last = seconds
+
+    def stats(self):
+        """Connection reuse and time-to-first-token counters"""
+        with self._stats_lock:
+            return {
+                "pool_size": self.pool_size,
+                "requests": self._requests,
+                "connections_opened": self._connections_opened,
+                "connections_reused": max(self._requests - self._connections_opened, 0),
+                "ttft_count": self._ttft_count,
+                "ttft_avg": self._ttft_total / self._ttft_count if self._ttft_count else None,
+                "ttft_max": self._ttft_max if self._ttft_count else None,
+                "ttft_last": self._ttft_last
+            }
@@ -0,0 +1,285 @@
+"""
+In-process embedding index for document search
+
+Optional replacement for DocMgr's /api/search: chunks are pulled through the
+DocMgr document APIs (see corpus_sync.py), embedded on the CPU and stored as
+a float32 matrix in a .npy file that is memory-mapped for search, so a query
+is one matrix-vector product instead of an HTTP round-trip. Updates only
+embed the chunks of new or changed documents. Results use DocMgr's search
+result shape (id, content, metadata, distance).
+
+The default "hashing" model is dependency-free (signed feature hashing of
+words and word pairs) and needs no model download. Naming a
+sentence-transformers model (with the package installed) gives semantic
+embeddings; if that model cannot be loaded, hashing is used instead.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_MODEL = "hashing"
+HASHING_DIMENSIONS = 512
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+class HashingEmbedder:
+    """Bag of hashed words and word pairs, L2-normalized"""
+
+    name = "hashing"
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self._features = {}
+
+    def _feature(self, token):
+        feature = self._features.get(token)
+        if feature is None:
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            feature = self._features[token] = (digest % self.dimensions, 1.0 if digest >> 63 else -1.0)
+        return feature
+
+    def embed(self, texts):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(text.lower())
+            tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for token in tokens:
+                index, sign = self._feature(token)
+                vectors[row, index] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class SentenceTransformerEmbedder:
+    """CPU sentence-transformers model producing normalized embeddings"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        import numpy as np
+
+        vectors = self.model.encode(list(texts), batch_size=64, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+def load_embedder(model_name=DEFAULT_MODEL):
+    """Return an embedder for `model_name`, falling back to hashing if unavailable"""
+    if model_name == HashingEmbedder.name:
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(model_name)
+    except ImportError:
+        print(f"sentence-transformers is not installed; using the hashing embedder instead of {model_name}")
+    except Exception as e:
+        # A failed download (no network, unknown model) must not stop the server from starting
+        print(f"Could not load embedding model {model_name} ({e}); using the hashing embedder instead")
+    return HashingEmbedder()
+
+def document_chunks_for_index(document, chunks):
+    """Normalize DocMgr chunks to the search result shape (id, content, metadata)"""
+    entries = []
+    for index, chunk in enumerate(chunks or []):
+        if not isinstance(chunk, dict) or not chunk.get("content"):
+            continue
+        metadata = dict(chunk.get("metadata") or {})
+        metadata.setdefault("document_id", document.get("id"))
+        metadata.setdefault("original_filename", document.get("original_filename") or document.get("filename"))
+        metadata.setdefault("chunk_index", index)
+        entries.append({
+            "id": chunk.get("id") or f"{document.get('id')}_{index}",
+            "content": chunk["content"],
+            "metadata": metadata
+        })
+    return entries
+
+class LocalVectorIndex:
+    """Memory-mapped embedding matrix plus chunk metadata, stored in `directory`"""
+
+    VECTORS_FILE = "vectors.npy"
+    CHUNKS_FILE = "chunks.json"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, directory, embedder):
+        self.directory = directory
+        self.embedder = embedder
+        self.corpus_version = None
+        self.built_at = None
+        self._vectors = None
+        self._chunks = []
+        self._document_rows = {}
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._updates = 0
+        self._last_update_seconds = None
+        self._last_embedded = 0
+
+    @property
+    def ready(self):
+        return self._vectors is not None
+
+    def all_chunks(self):
+        """Every indexed chunk, in row order"""
+        with self._lock:
+            return list(self._chunks)
+
+    def document_chunks(self, document_id):
+        """The indexed chunks of one document, in order (empty if it is not indexed)"""
+        with self._lock:
+            chunks, rows = self._chunks, self._document_rows.get(str(document_id), ())
+        return sorted((chunks[row] for row in rows), key=lambda chunk: chunk["metadata"].get("chunk_index") or 0)
+
+    @staticmethod
+    def _rows_by_document(chunks):
+        rows = {}
+        for row, chunk in enumerate(chunks):
+            rows.setdefault(str(chunk["metadata"].get("document_id")), []).append(row)
+        return rows
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        """Memory-map a previously built index; returns False if none is usable"""
+        import numpy as np
+
+        try:
+            with open(self._path(self.MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            with open(self._path(self.CHUNKS_FILE)) as f:
+                chunks = json.load(f)
+            vectors = np.load(self._path(self.VECTORS_FILE), mmap_mode="r")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"No usable local index in {self.directory}: {e}")
+            return False
+
+        if manifest.get("model") != self.embedder.name or vectors.shape != (len(chunks), self.embedder.dimensions):
+            print(f"Local index in {self.directory} was built with a different model; it will be rebuilt")
+            return False
+
+        document_rows = self._rows_by_document(chunks)
+        with self._lock:
+            self._vectors = vectors
+            self._chunks = chunks
+            self._document_rows = document_rows
+            self.corpus_version = manifest.get("corpus_version")
+            self.built_at = manifest.get("built_at")
+        return True
+
+    def build(self, chunks, corpus_version=None):
+        """Embed `chunks`, write the index files and switch searches over to them"""
+        self._write(chunks, None, [], corpus_version)
+
+    def apply_changes(self, changed, removed, corpus_version=None):
+        """Replace the chunks of changed documents and drop removed ones
+
+        `changed` maps document id -> (document, chunks) as produced by
+        CorpusSync; rows of every other document keep their vectors.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            vectors, chunks = self._vectors, self._chunks
+        dropped = {str(document_id) for document_id in removed} | {str(document_id) for document_id in changed}
+
+        kept_rows = [
+            row for row, chunk in enumerate(chunks)
+            if str(chunk["metadata"].get("document_id")) not in dropped
+        ] if vectors is not None else []
+        new_chunks = [chunks[row] for row in kept_rows]
+        for document, document_chunks in changed.values():
+            new_chunks.extend(document_chunks_for_index(document, document_chunks))
+
+        self._write(new_chunks, vectors, kept_rows, corpus_version)
+        with self._lock:
+            self._updates += 1
+            self._last_update_seconds = time.perf_counter() - started
+            self._last_embedded = len(new_chunks) - len(kept_rows)
+
+    def _write(self, chunks, source, kept_rows, corpus_version):
+        """Write a matrix whose first rows are `source[kept_rows]`; the remaining chunks are embedded"""
+        import numpy as np
+
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_tmp = self._path(self.VECTORS_FILE + ".tmp")
+        # open_memmap writes a regular .npy file without holding the matrix in memory twice
+        matrix = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=np.float32,
+                                           shape=(len(chunks), self.embedder.dimensions))
+        copy_block = 8192
+        for start in range(0, len(kept_rows), copy_block):
+            rows = kept_rows[start:start + copy_block]
+            matrix[start:start + len(rows)] = source[rows]
+        batch_size = 256
+        for start in range(len(kept_rows), len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            matrix[start:start + len(batch)] = self.embedder.embed([chunk["content"] for chunk in batch])
+        matrix.flush()
+        del matrix
+
+        built_at = time.time()
+        self._write_json(self.CHUNKS_FILE, chunks)
+        os.replace(vectors_tmp, self._path(self.VECTORS_FILE))
+        self._write_json(self.MANIFEST_FILE, {
+            "model": self.embedder.name,
+            "dimensions": self.embedder.dimensions,
+            "count": len(chunks),
+            "corpus_version": corpus_version,
+            "built_at": built_at
+        })
+
+        vectors = np.load(self._path(self.VECTORS_FILE), mmap_mode="r")
+        document_rows = self._rows_by_document(chunks)
+        with self._lock:
+            self._vectors = vectors
+            self._chunks = chunks
+            self._document_rows = document_rows
+            self.corpus_version = corpus_version
+            self.built_at = built_at
+
+    def _write_json(self, name, payload):
+        tmp = self._path(name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp, self._path(name))
+
+    def search(self, query, n_results=5):
+        """Top-k cosine search, returned in DocMgr's search result shape"""
+        import numpy as np
+
+        with self._lock:
+            vectors, chunks = self._vectors, self._chunks
+            self._searches += 1
+        if vectors is None or not chunks or n_results <= 0:
+            return []
+
+        query_vector = self.embedder.embed([query])[0]
+        scores = vectors @ query_vector
+        k = min(n_results, len(chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [{**chunks[i], "distance": round(float(1.0 - scores[i]), 6)} for i in top]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self._vectors is not None,
+                "model": self.embedder.name,
+                "dimensions": self.embedder.dimensions,
+                "chunks": len(self._chunks),
+                "corpus_version": self.corpus_version,
+                "built_at": self.built_at,
+                "searches": self._searches,
+                "updates": self._updates,
+                "last_update_seconds": self._last_update_seconds,
+                "last_update_embedded": self._last_embedded
+            }
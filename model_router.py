@@ -0,0 +1,354 @@
+"""
+Model routing for chat completions
+
+Each chat is sent to a model tier picked from its prompt: questions that
+look like listing or stats lookups (answered through tool calls) and small
+prompts go to the fast tier; long prompts (question, retrieved context and
+conversation history) go to the large tier when one is configured. Every
+model keeps a moving window of its recent calls, so a model whose error rate
+is too high or whose typical time to first token is past the hedge threshold
+is tried after the others. A call that fails moves on to the next model at
+once, and a call still waiting for its first token after `hedge_after`
+seconds is hedged: the next model gets the same request and whichever
+answers first is used, the other is closed.
+"""
+
+import asyncio
+import inspect
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+from tracing import metrics
+
+MODEL_ROUTES = metrics.counter(
+    "chatbot_model_routes_total", "Chats routed to each model tier, by reason", ("tier", "reason"))
+MODEL_ATTEMPTS = metrics.counter(
+    "chatbot_model_attempts_total", "Completion attempts per model by kind (primary, hedge, fallback) and outcome",
+    ("model", "kind", "outcome"))
+MODEL_TTFT = metrics.histogram(
+    "chatbot_model_ttft_seconds", "Time to first token (or to the full response when not streaming) per model",
+    ("model",))
+
+# Questions answered by listing or stats tool calls rather than by synthesis over the context
+TOOL_HINT_RE = re.compile(
+    r"\b(list|how many|count|stats|statistics|all (the )?documents|which documents|document id|chunks?)\b", re.I)
+
+class ModelTier:
+    """A named model with its completion limits"""
+
+    def __init__(self, name, model, max_tokens=1000, followup_max_tokens=500):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.followup_max_tokens = followup_max_tokens
+
+class Route:
+    """Where one chat goes: its tier, why, and the models to try in order"""
+
+    def __init__(self, tier, reason, models):
+        self.tier = tier
+        self.reason = reason
+        self.models = models
+
+    @property
+    def model(self):
+        return self.tier.model
+
+    def starting_with(self, model):
+        """The same route with `model` (e.g. the one that answered the first turn) tried first"""
+        return Route(self.tier, self.reason, [model] + [other for other in self.models if other != model])
+
+class ModelHealth:
+    """Moving window of one model's recent calls"""
+
+    def __init__(self, window=50):
+        self.calls = deque(maxlen=window)  # (seconds to first token or None, ok)
+
+    def observe(self, seconds, ok):
+        self.calls.append((seconds, ok))
+
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def ttft(self, pct):
+        latencies = sorted(seconds for seconds, ok in self.calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))]
+
+class PrimedStream:
+    """A completion stream whose first chunk has already arrived"""
+
+    def __init__(self, stream, first, iterator):
+        self.stream = stream
+        self.first = first
+        self._iterator = iterator
+
+    def __iter__(self):
+        if self.first is not None:
+            yield self.first
+        yield from self._iterator
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        if self.first is not None:
+            yield self.first
+        async for chunk in self._iterator:
+            yield chunk
+
+    def close(self):
+        close = getattr(self.stream, "close", None)
+        return close() if close is not None else None
+
+def prime_stream(stream):
+    """Wait for a stream's first chunk, so it can be timed and raced"""
+    iterator = iter(stream)
+    return PrimedStream(stream, next(iterator, None), iterator)
+
+async def prime_stream_async(stream):
+    iterator = stream.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        # A hedge cancelled while waiting for its first chunk still holds the response open
+        close = getattr(stream, "close", None)
+        result = close() if close is not None else None
+        if inspect.isawaitable(result):
+            await result
+        raise
+    return PrimedStream(stream, first, iterator)
+
+class ModelRouter:
+    """Picks a tier per chat and runs completions with hedging and failover"""
+
+    def __init__(self, fast, large=None, fallback_models=(), large_prompt_tokens=1200, hedge_after=2.0,
+                 window=50, max_error_rate=0.5, min_samples=5, clock=time.perf_counter):
+        self.fast = fast
+        self.large = large
+        self.fallback_models = [model for model in fallback_models if model]
+        self.large_prompt_tokens = large_prompt_tokens
+        self.hedge_after = hedge_after
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.clock = clock
+
+        self._health = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.fallbacks = 0
+
+    def _model_health(self, model):
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(self._window)
+        return health
+
+    def observe(self, model, seconds, ok):
+        """Record one call: seconds to its first token, or ok=False for an error"""
+        with self._lock:
+            self._model_health(model).observe(seconds, ok)
+        if ok:
+            MODEL_TTFT.observe(seconds, model=model)
+
+    def degraded(self, model):
+        """True if the model's recent calls mostly failed or are typically slower than the hedge threshold"""
+        with self._lock:
+            health = self._health.get(model)
+            if health is None or len(health.calls) < self.min_samples:
+                return False
+            if health.error_rate() > self.max_error_rate:
+                return True
+            median = health.ttft(50)
+            return bool(self.hedge_after) and median is not None and median > self.hedge_after
+
+    def route(self, user_message, prompt_tokens):
+        """Route a chat by its question and its estimated prompt size (context and history included)"""
+        if TOOL_HINT_RE.search(user_message):
+            tier, reason = self.fast, "tools"
+        elif self.large is None:
+            tier, reason = self.fast, "single_tier"
+        elif prompt_tokens >= self.large_prompt_tokens:
+            tier, reason = self.large, "large_prompt"
+        else:
+            tier, reason = self.fast, "small_prompt"
+        MODEL_ROUTES.inc(tier=tier.name, reason=reason)
+
+        models = [tier.model]
+        for model in [self.fast.model] + ([self.large.model] if self.large else []) + self.fallback_models:
+            if model not in models:
+                models.append(model)
+        # Healthy models first, otherwise keep the preferred order
+        models.sort(key=self.degraded)
+        return Route(tier, reason, models)
+
+    def _count(self, kind):
+        with self._lock:
+            if kind == "hedge":
+                self.hedges += 1
+            elif kind == "fallback":
+                self.fallbacks += 1
+
+    def run(self, route, attempt, discard=None):
+        """Call attempt(model) over the route's models; returns (model, result)
+
+        `attempt` should return once the first token is in (see
+        prime_stream); `discard(result)` releases a losing hedge's result.
+        """
+        models = list(route.models)
+        if len(models) == 1:
+            value = self._timed(models[0], "primary", attempt)
+            MODEL_ATTEMPTS.inc(model=models[0], kind="primary", outcome="won")
+            return models[0], value
+
+        results = queue.Queue()
+        decided = threading.Event()
+        lock = threading.Lock()
+
+        def launch(model, kind):
+            self._count(kind)
+
+            def target():
+                try:
+                    value = self._timed(model, kind, attempt)
+                except Exception as e:
+                    results.put((model, kind, None, e))
+                    return
+                with lock:
+                    if not decided.is_set():
+                        results.put((model, kind, value, None))
+                        return
+                MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="lost")
+                if discard is not None:
+                    discard(value)
+
+            threading.Thread(target=target, name="model-attempt", daemon=True).start()
+
+        launch(models.pop(0), "primary")
+        pending = 1
+        last_error = None
+        while True:
+            try:
+                model, kind, value, error = results.get(
+                    timeout=self.hedge_after if models and self.hedge_after > 0 else None)
+            except queue.Empty:
+                launch(models.pop(0), "hedge")
+                pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                with lock:
+                    decided.set()
+                MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="won")
+                return model, value
+            last_error = error
+            if models:
+                launch(models.pop(0), "fallback")
+                pending += 1
+            elif not pending:
+                raise last_error
+
+    def _timed(self, model, kind, attempt):
+        started = self.clock()
+        try:
+            value = attempt(model)
+        except Exception:
+            self.observe(model, None, False)
+            MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="error")
+            raise
+        self.observe(model, self.clock() - started, True)
+        return value
+
+    async def run_async(self, route, attempt, discard=None):
+        """Coroutine version of `run`; `attempt` and `discard` may be coroutine functions"""
+        models = list(route.models)
+        tasks = {}
+
+        def launch(model, kind):
+            self._count(kind)
+            tasks[asyncio.ensure_future(self._timed_async(model, kind, attempt))] = (model, kind)
+
+        launch(models.pop(0), "primary")
+        last_error = None
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=self.hedge_after if models and self.hedge_after > 0 else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(models.pop(0), "hedge")
+                    continue
+                winner = None
+                for task in done:
+                    model, kind = tasks.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = (model, task.result())
+                        MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="won")
+                    else:
+                        MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="lost")
+                        await self._discard(discard, task.result())
+                if winner is not None:
+                    return winner
+                if models:
+                    launch(models.pop(0), "fallback")
+                elif not tasks:
+                    raise last_error
+        finally:
+            for task, (model, kind) in tasks.items():
+                task.cancel()
+                MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="lost")
+            # Let the cancelled attempts close their responses; one that finished first is discarded
+            for value in await asyncio.gather(*tasks, return_exceptions=True):
+                if not isinstance(value, BaseException):
+                    await self._discard(discard, value)
+
+    async def _timed_async(self, model, kind, attempt):
+        started = self.clock()
+        try:
+            value = await attempt(model)
+        except Exception:
+            self.observe(model, None, False)
+            MODEL_ATTEMPTS.inc(model=model, kind=kind, outcome="error")
+            raise
+        self.observe(model, self.clock() - started, True)
+        return value
+
+    @staticmethod
+    async def _discard(discard, value):
+        if discard is not None:
+            result = discard(value)
+            if inspect.isawaitable(result):
+                await result
+
+    def stats(self):
+        with self._lock:
+            models = {
+                model: {
+                    "calls": len(health.calls),
+                    "error_rate": round(health.error_rate(), 3),
+                    "ttft_p50": health.ttft(50),
+                    "ttft_p95": health.ttft(95)
+                }
+                for model, health in self._health.items()
+            }
+            return {
+                "fast_model": self.fast.model,
+                "large_model": self.large.model if self.large else None,
+                "fallback_models": self.fallback_models,
+                "large_prompt_tokens": self.large_prompt_tokens,
+                "hedge_after": self.hedge_after,
+                "hedges": self.hedges,
+                "fallbacks": self.fallbacks,
+                "models": models
+            }
@@ -0,0 +1,79 @@
+"""
+Prompt templates for the DocMgr chatbot
+
+The system prompt's static part (instructions and the function list) and the
+Groq `tools` schema are built once and reused for every request; only the
+document context is filled in per request. The static prefix comes first so
+provider-side prompt caching can reuse it across requests.
+"""
+
+import json
+import threading
+
+SYSTEM_PROMPT_PREAMBLE = """You are a helpful AI assistant that can access and analyze documents in the DocMgr system. You have access to several functions that allow you to:
+
+1. Get information about all documents
+2. Retrieve specific documents by ID
+3. Get document chunks and content
+4. Search documents semantically
+5. Get system statistics
+6. Access API information
+
+Use these functions when users ask questions that require:
+- Listing documents
+- Getting document details
+- Searching for specific content
+- Understanding system status
+- Analyzing document collections
+
+Always explain what you're doing and provide helpful context. If a user asks about documents, use the appropriate functions to get current information.
+
+Available Functions:
+{function_names}
+
+Remember: You can call multiple functions to gather comprehensive information before providing a response."""
+
+CONTEXT_SECTION = """
+
+Document Context (if available):
+{context}"""
+
+class PromptTemplates:
+    """Caches the static system prompt prefix and tool schema for a function registry"""
+
+    def __init__(self, functions):
+        self.functions = functions
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _registry_signature(self):
+        return tuple((name, id(definition)) for name, definition in self.functions.items())
+
+    def refresh(self):
+        """Rebuild the cached prompt and schema (call after editing a function definition in place)"""
+        with self._lock:
+            self._signature = self._registry_signature()
+            self._static_prefix = SYSTEM_PROMPT_PREAMBLE.format(
+                function_names=json.dumps(list(self.functions.keys()), indent=2)
+            )
+            self._tools = [{"type": "function", "function": func} for func in self.functions.values()]
+
+    def _ensure_current(self):
+        # Adding, removing or replacing a function triggers a rebuild
+        if self._registry_signature() != self._signature:
+            self.refresh()
+
+    @property
+    def static_prefix(self):
+        self._ensure_current()
+        return self._static_prefix
+
+    @property
+    def tools(self):
+        """Groq `tools` parameter for the current function registry"""
+        self._ensure_current()
+        return self._tools
+
+    def system_prompt(self, context):
+        """Static prefix followed by this request's document context"""
+        return self.static_prefix + CONTEXT_SECTION.format(context=context)
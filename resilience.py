@@ -0,0 +1,291 @@
+"""
+Resilience for DocMgr calls: circuit breakers, hedged searches and deadlines
+
+Every DocMgr operation (method and path, document ids collapsed) has its own
+circuit breaker. After `failure_threshold` consecutive failures (connection
+errors, timeouts or 5xx answers) the breaker opens and calls fail at once
+with CircuitOpen instead of waiting on a dead upstream; after `reset_timeout`
+seconds one trial call is let through (half-open) and its outcome closes or
+reopens the breaker. Each operation also keeps a window of recent latencies,
+so a call that has not answered by the operation's p95 can be hedged: the
+same request is sent again and whichever answers first is used.
+
+A chat request's deadline is carried in a context variable: within
+deadline_scope() every DocMgr call has its timeouts cut to the time left,
+and fails with DeadlineExceeded once none is left.
+"""
+
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from tracing import metrics
+
+BREAKER_STATE = metrics.gauge(
+    "chatbot_docmgr_breaker_state", "DocMgr circuit breaker state per operation (0 closed, 1 half-open, 2 open)",
+    ("operation",))
+RESILIENCE_EVENTS = metrics.counter(
+    "chatbot_docmgr_resilience_events_total",
+    "DocMgr breaker transitions, rejected calls, deadline expiries and hedges per operation", ("operation", "event"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_deadline = contextvars.ContextVar("docmgr_deadline", default=None)
+
+class DocMgrUnavailable(Exception):
+    """A DocMgr call that was not sent"""
+
+class CircuitOpen(DocMgrUnavailable):
+    """The operation's breaker is open; retry after `retry_after` seconds"""
+
+    def __init__(self, operation, retry_after):
+        super().__init__(f"circuit open for {operation} (retry in {retry_after:.1f}s)")
+        self.operation = operation
+        self.retry_after = retry_after
+
+class DeadlineExceeded(DocMgrUnavailable):
+    """The request's deadline passed before the call could be sent"""
+
+@contextmanager
+def deadline_scope(deadline):
+    """Apply `deadline` (a time.perf_counter() reading, or None) to the DocMgr calls made inside the block"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left(clock=time.perf_counter):
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - clock()
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over consecutive failures"""
+
+    def __init__(self, operation, failure_threshold=5, reset_timeout=10.0, clock=time.monotonic):
+        self.operation = operation
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, operation=operation)
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go out now"""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                waited = self.clock() - self.opened_at
+                if waited < self.reset_timeout:
+                    self.rejected += 1
+                    RESILIENCE_EVENTS.inc(operation=self.operation, event="rejected")
+                    raise CircuitOpen(self.operation, self.reset_timeout - waited)
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # One trial call at a time decides whether the upstream is back
+                if self._trial_running:
+                    self.rejected += 1
+                    RESILIENCE_EVENTS.inc(operation=self.operation, event="rejected")
+                    raise CircuitOpen(self.operation, 0.0)
+                self._trial_running = True
+
+    def record(self, ok):
+        """Record an allowed call's outcome; ok=None for a call abandoned before it finished"""
+        with self._lock:
+            self._trial_running = False
+            if ok is None:
+                return
+            if ok:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    self._set_state(OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_STATE.set(STATE_VALUES[state], operation=self.operation)
+        RESILIENCE_EVENTS.inc(operation=self.operation, event=f"breaker_{state}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
+
+class DocMgrResilience:
+    """Per-operation breakers and latency windows shared by the DocMgr clients"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0, hedge_percentile=95, hedge_min_samples=20,
+                 window=200, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.window = window
+        self.clock = clock
+
+        self._breakers = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedges_won = 0
+        self.deadline_exceeded = 0
+
+    def breaker(self, operation):
+        with self._lock:
+            breaker = self._breakers.get(operation)
+            if breaker is None:
+                breaker = self._breakers[operation] = CircuitBreaker(
+                    operation, self.failure_threshold, self.reset_timeout, self.clock)
+            return breaker
+
+    def admit(self, operation):
+        """Check the deadline and the breaker before a call; returns the seconds left (None without a deadline)"""
+        remaining = time_left()
+        if remaining is not None and remaining <= 0:
+            with self._lock:
+                self.deadline_exceeded += 1
+            RESILIENCE_EVENTS.inc(operation=operation, event="deadline_exceeded")
+            raise DeadlineExceeded(f"deadline passed before {operation}")
+        self.breaker(operation).allow()
+        return remaining
+
+    def record(self, operation, seconds, ok):
+        """Record an admitted call's outcome (see CircuitBreaker.record) and, on success, its latency"""
+        self.breaker(operation).record(ok)
+        if ok:
+            with self._lock:
+                latencies = self._latencies.get(operation)
+                if latencies is None:
+                    latencies = self._latencies[operation] = deque(maxlen=self.window)
+                latencies.append(seconds)
+
+    def healthy(self, operation):
+        """False while the operation's breaker is not closed or its last call failed"""
+        breaker = self.breaker(operation)
+        return breaker.state == CLOSED and breaker.failures == 0
+
+    def _percentile(self, operation, pct):
+        with self._lock:
+            latencies = sorted(self._latencies.get(operation) or ())
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))]
+
+    def hedge_delay(self, operation):
+        """The operation's recent p95 latency, or None until there are enough samples to trust it"""
+        with self._lock:
+            samples = len(self._latencies.get(operation) or ())
+        if not self.hedge_percentile or samples < self.hedge_min_samples:
+            return None
+        return self._percentile(operation, self.hedge_percentile)
+
+    def _count_hedge(self, operation, won=False):
+        with self._lock:
+            if won:
+                self.hedges_won += 1
+            else:
+                self.hedges += 1
+        RESILIENCE_EVENTS.inc(operation=operation, event="hedge_won" if won else "hedged")
+
+    def hedged(self, operation, call):
+        """Return call(); a duplicate call is raced if the first has not returned by the hedge delay"""
+        delay = self.hedge_delay(operation)
+        if delay is None:
+            return call()
+
+        results = queue.Queue()
+
+        def launch(kind):
+            # Copy the caller's context so the deadline applies to both calls
+            context = contextvars.copy_context()
+
+            def target():
+                try:
+                    results.put((kind, context.run(call), None))
+                except Exception as e:
+                    results.put((kind, None, e))
+
+            threading.Thread(target=target, name="docmgr-hedge", daemon=True).start()
+
+        launch("primary")
+        try:
+            kind, value, error = results.get(timeout=delay)
+        except queue.Empty:
+            self._count_hedge(operation)
+            launch("hedge")
+            kind, value, error = results.get()
+            if error is not None:
+                kind, value, error = results.get()
+            if error is None and kind == "hedge":
+                self._count_hedge(operation, won=True)
+        if error is not None:
+            raise error
+        return value
+
+    async def hedged_async(self, operation, call):
+        """Coroutine version of `hedged`; `call` is a coroutine function and the losing call is cancelled"""
+        delay = self.hedge_delay(operation)
+        if delay is None:
+            return await call()
+
+        tasks = {asyncio.ensure_future(call()): "primary"}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._count_hedge(operation)
+                tasks[asyncio.ensure_future(call())] = "hedge"
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    kind = tasks.pop(task)
+                    if task.exception() is None:
+                        if kind == "hedge":
+                            self._count_hedge(operation, won=True)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.items())
+            operations = list(self._latencies)
+        return {
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "deadline_exceeded": self.deadline_exceeded,
+            "breakers": {operation: breaker.stats() for operation, breaker in breakers},
+            "latency": {
+                operation: {"p50": self._percentile(operation, 50), "p95": self._percentile(operation, 95)}
+                for operation in operations
+            }
+        }
@@ -0,0 +1,295 @@
+"""
+Hybrid retrieval for chat context
+
+Semantic search alone misses exact identifiers (error codes, product names,
+ticket numbers), so the chat context is retrieved in stages:
+
+1. vector: the local index or DocMgr's /api/search, bounded by a time budget
+2. keyword: BM25 over an incremental inverted index of the synced chunks
+3. fuse: reciprocal rank fusion of both candidate lists
+4. rerank (optional): a CPU cross-encoder over as many fused candidates as
+   fit in its time budget
+
+Each stage is timed as a span on the request trace, so the stages show up in
+/api/metrics (chatbot_phase_duration_seconds) and in per-request timings.
+"""
+
+import contextvars
+import math
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from local_index import document_chunks_for_index
+from resilience import deadline_scope, time_left
+from tracing import RequestTrace, metrics
+
+BUDGET_EXCEEDED = metrics.counter(
+    "chatbot_retrieval_budget_exceeded_total", "Retrieval stages cut short by their latency budget", ("stage",))
+
+# Compound identifiers (ERR-1042, v2.3.1, order_id) are indexed whole and by their parts
+_TERM_RE = re.compile(r"\w+(?:[-_.:/]\w+)*", re.UNICODE)
+_PART_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+def tokenize(text):
+    terms = []
+    for match in _TERM_RE.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        parts = _PART_RE.findall(term)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+def chunk_key(chunk):
+    metadata = chunk.get("metadata") or {}
+    return str(chunk.get("id") or f"{metadata.get('document_id')}_{metadata.get('chunk_index')}")
+
+class BM25Index:
+    """Inverted index over chunks, updated per document"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._chunks = {}
+        self._lengths = {}
+        self._document_chunks = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def add_document(self, document_id, chunks):
+        """Index (or re-index) one document's chunks"""
+        document_id = str(document_id)
+        with self._lock:
+            self.remove_document(document_id)
+            keys = []
+            for chunk in chunks:
+                key = chunk_key(chunk)
+                if key in self._chunks:
+                    continue
+                terms = Counter(tokenize(chunk.get("content") or ""))
+                for term, frequency in terms.items():
+                    self._postings.setdefault(term, {})[key] = frequency
+                length = sum(terms.values())
+                self._chunks[key] = chunk
+                self._lengths[key] = length
+                self._total_length += length
+                keys.append(key)
+            self._document_chunks[document_id] = keys
+
+    def remove_document(self, document_id):
+        with self._lock:
+            for key in self._document_chunks.pop(str(document_id), []):
+                chunk = self._chunks.pop(key)
+                self._total_length -= self._lengths.pop(key)
+                for term in set(tokenize(chunk.get("content") or "")):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(key, None)
+                        if not postings:
+                            del self._postings[term]
+
+    def rebuild(self, chunks):
+        """Index chunks grouped by their metadata document_id (e.g. from the local index)"""
+        by_document = {}
+        for chunk in chunks:
+            by_document.setdefault(str((chunk.get("metadata") or {}).get("document_id")), []).append(chunk)
+        with self._lock:
+            for document_id, document_chunks in by_document.items():
+                self.add_document(document_id, document_chunks)
+
+    def apply_changes(self, changed, removed, corpus_version=None):
+        """CorpusSync callback; `changed` maps document id -> (document, chunks)"""
+        with self._lock:
+            for document_id in removed:
+                self.remove_document(document_id)
+            for document_id, (document, chunks) in changed.items():
+                self.add_document(document_id, document_chunks_for_index(document, chunks))
+
+    def search(self, query, n_results=20):
+        """Top chunks by BM25 score as (chunk, score) pairs"""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._chunks)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[key] / average_length)
+                    scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            ranked = sorted(scores.items(), key=lambda item: -item[1])[:n_results]
+            return [(self._chunks[key], score) for key, score in ranked]
+
+    def stats(self):
+        with self._lock:
+            return {"chunks": len(self._chunks), "documents": len(self._document_chunks), "terms": len(self._postings)}
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """Merge ranked chunk lists; a chunk's score is the sum of 1 / (k + rank)"""
+    scores = {}
+    chunks = {}
+    for ranked in ranked_lists:
+        for rank, chunk in enumerate(ranked, start=1):
+            key = chunk_key(chunk)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            # Keep the vector result's fields (e.g. distance) when both lists have the chunk
+            chunks.setdefault(key, chunk)
+    ordered = sorted(scores, key=lambda key: -scores[key])
+    return [(chunks[key], scores[key]) for key in ordered]
+
+class CrossEncoderReranker:
+    """sentence-transformers cross-encoder on the CPU"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder
+
+        self.name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query, chunks):
+        return [float(score) for score in self.model.predict([(query, chunk.get("content") or "") for chunk in chunks])]
+
+def load_reranker(model_name):
+    """Return a reranker for `model_name`, or None when disabled or unavailable"""
+    if not model_name:
+        return None
+    try:
+        return CrossEncoderReranker(model_name)
+    except ImportError:
+        print(f"sentence-transformers is not installed; reranking with {model_name} is disabled")
+    except Exception as e:
+        print(f"Could not load rerank model {model_name} ({e}); reranking is disabled")
+    return None
+
+class HybridRetriever:
+    """Vector + BM25 retrieval with rank fusion and optional reranking
+
+    `vector_search(query, n_results)` returns chunks in DocMgr's search
+    result shape. Results keep that shape plus `score` (1.0 for the best
+    result, decreasing with rank) and the raw `rrf_score` / `rerank_score`.
+    """
+
+    def __init__(self, keyword_index, vector_search, reranker=None, candidates=20, rrf_k=60,
+                 vector_budget=0.8, rerank_budget=0.15, vector_workers=8):
+        self.keyword_index = keyword_index
+        self.vector_search = vector_search
+        self.reranker = reranker
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.vector_budget = vector_budget
+        self.rerank_budget = rerank_budget
+        self._executor = ThreadPoolExecutor(max_workers=vector_workers, thread_name_prefix="retrieval")
+        # One slot per worker, so searches that outlived their budget can never queue up new ones
+        self._vector_slots = threading.BoundedSemaphore(vector_workers)
+        # Running estimate of cross-encoder cost per candidate, used to size reranks to the budget
+        self._rerank_seconds_per_pair = None
+
+    def search(self, query, n_results=5, trace=None):
+        if trace is None:
+            trace = RequestTrace()
+
+        # Vector search runs in the background while the keyword stage runs here, in a copy of
+        # this context so the request's DocMgr deadline applies to it; with every worker still busy
+        # the stage is skipped rather than queued
+        vector_started = trace.clock()
+        vector_future = None
+        if self._vector_slots.acquire(blocking=False):
+            left = time_left()
+            deadline = time.perf_counter() + (self.vector_budget if left is None else min(self.vector_budget, left))
+            vector_future = self._executor.submit(contextvars.copy_context().run, self._vector_search, query,
+                                                  deadline)
+
+        with trace.span("retrieval_keyword"):
+            keyword_results = [chunk for chunk, _ in self.keyword_index.search(query, self.candidates)]
+
+        remaining = max(0.0, self.vector_budget - (trace.clock() - vector_started))
+        if vector_future is None:
+            BUDGET_EXCEEDED.inc(stage="vector")
+            trace.record("retrieval_vector", vector_started, 0.0, status="saturated")
+            vector_results = []
+        else:
+            try:
+                vector_results = vector_future.result(timeout=remaining) or []
+                trace.record("retrieval_vector", vector_started, trace.clock() - vector_started)
+            except FutureTimeoutError:
+                BUDGET_EXCEEDED.inc(stage="vector")
+                trace.record("retrieval_vector", vector_started, trace.clock() - vector_started, status="timeout")
+                vector_results = []
+            except Exception as e:
+                print(f"Error in vector retrieval: {e}")
+                trace.record("retrieval_vector", vector_started, trace.clock() - vector_started, status="error")
+                vector_results = []
+
+        with trace.span("retrieval_fuse"):
+            fused = [
+                {**chunk, "rrf_score": round(score, 6)}
+                for chunk, score in reciprocal_rank_fusion([vector_results, keyword_results], self.rrf_k)
+            ]
+
+        if self.reranker is not None and len(fused) > 1:
+            fused = self._rerank(query, fused, n_results, trace)
+
+        results = fused[:n_results]
+        for rank, chunk in enumerate(results):
+            chunk["score"] = round(1.0 - rank / len(results), 6)
+        return results
+
+    def _vector_search(self, query, deadline):
+        """The vector stage, with DocMgr calls cut off at the stage's deadline"""
+        try:
+            with deadline_scope(deadline):
+                return self.vector_search(query, self.candidates)
+        finally:
+            self._vector_slots.release()
+
+    def _rerank(self, query, fused, n_results, trace):
+        """Rerank the head of the fused list, as far as the budget allows"""
+        pairs = min(len(fused), self.candidates)
+        if self._rerank_seconds_per_pair:
+            pairs = min(pairs, int(self.rerank_budget / self._rerank_seconds_per_pair))
+        if pairs < min(2, n_results):
+            BUDGET_EXCEEDED.inc(stage="rerank")
+            return fused
+        if pairs < min(len(fused), self.candidates):
+            BUDGET_EXCEEDED.inc(stage="rerank")
+
+        head = fused[:pairs]
+        started = trace.clock()
+        try:
+            scores = self.reranker.score(query, head)
+        except Exception as e:
+            print(f"Error reranking results: {e}")
+            trace.record("retrieval_rerank", started, trace.clock() - started, status="error")
+            return fused
+        elapsed = trace.clock() - started
+        trace.record("retrieval_rerank", started, elapsed)
+
+        per_pair = elapsed / len(head)
+        previous = self._rerank_seconds_per_pair
+        self._rerank_seconds_per_pair = per_pair if previous is None else 0.8 * previous + 0.2 * per_pair
+
+        for chunk, score in zip(head, scores):
+            chunk["rerank_score"] = round(score, 6)
+        return sorted(head, key=lambda chunk: -chunk["rerank_score"]) + fused[pairs:]
+
+    def stats(self):
+        return {
+            "keyword_index": self.keyword_index.stats(),
+            "candidates": self.candidates,
+            "reranker": self.reranker.name if self.reranker else None,
+            "rerank_ms_per_candidate": round(self._rerank_seconds_per_pair * 1000, 3)
+            if self._rerank_seconds_per_pair else None
+        }
@@ -0,0 +1,170 @@
+"""
+Search result cache for DocMgr /api/search
+
+Caches search results keyed by normalized query and n_results, with a TTL,
+LRU eviction bounded by entry count and approximate memory, and wholesale
+invalidation when DocMgr's document set changes (tracked as a corpus
+version fingerprint). Expired entries can be kept for a further `stale_ttl`
+seconds, to be served by get_stale() while DocMgr cannot be reached.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n?!.,;:"
+
+def normalize_query(query):
+    """Fold case, whitespace and trailing punctuation so near-identical questions share a key"""
+    return _WHITESPACE_RE.sub(" ", str(query).casefold()).strip(_EDGE_PUNCTUATION)
+
+def corpus_fingerprint(vector_stats=None, documents=None):
+    """Fingerprint the DocMgr corpus from vector stats, or from the document list"""
+    if vector_stats:
+        payload = vector_stats
+    elif documents:
+        payload = {
+            "count": len(documents),
+            "ids": sorted(str(doc.get("id")) for doc in documents if isinstance(doc, dict))
+        }
+    else:
+        return None
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+class SearchCache:
+    """Thread-safe LRU + TTL cache of DocMgr search results"""
+
+    def __init__(self, ttl=300, max_entries=1000, max_bytes=16 * 1024 * 1024, version_check_interval=30,
+                 stale_ttl=0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_check_interval = version_check_interval
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, results)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.corpus_version = None
+        self.generation = 0
+        self._last_version_check = 0.0
+        self._version_check_running = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query, n_results):
+        return (normalize_query(query), int(n_results))
+
+    def get(self, query, n_results):
+        """Return cached results or None"""
+        key = self.make_key(query, n_results)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, results = entry
+            if expires_at <= now:
+                if expires_at + self.stale_ttl <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def get_stale(self, query, n_results):
+        """Return results even if expired (within `stale_ttl`), for when they cannot be refreshed"""
+        key = self.make_key(query, n_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_ttl <= time.time():
+                return None
+            self.stale_hits += 1
+            return entry[2]
+
+    def put(self, query, n_results, results, generation=None):
+        """Store results unless the corpus changed since `generation` was read"""
+        key = self.make_key(query, n_results)
+        size = len(json.dumps(results, default=str)) + len(key[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, results)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def claim_version_check(self):
+        """Return True if the caller should refresh the corpus version now"""
+        now = time.time()
+        with self._lock:
+            if self._version_check_running or now - self._last_version_check < self.version_check_interval:
+                return False
+            self._version_check_running = True
+            self._last_version_check = now
+            return True
+
+    def set_corpus_version(self, version):
+        """Record the latest corpus fingerprint, dropping every entry if it changed"""
+        with self._lock:
+            self._version_check_running = False
+            if version is None or version == self.corpus_version:
+                return
+            changed = self.corpus_version is not None
+            self.corpus_version = version
+            if changed:
+                self._entries.clear()
+                self._bytes = 0
+                self.generation += 1
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "corpus_version": self.corpus_version
+            }
@@ -0,0 +1,226 @@
+"""
+Server-side conversation sessions for multi-turn chat
+
+A session keeps the turns of one conversation so follow-up questions are
+answered with the earlier exchange in the prompt, together with the chunks
+retrieved and the tool results fetched by earlier turns so they are not
+searched for or requested again. Only results of the tools the session is
+told are reusable (calls scoped to one document) are kept, each tagged with
+the corpus version it was fetched at and dropped once the corpus changes. History is compacted to a token budget:
+once the turns no longer fit, the oldest ones are folded into a short
+extractive summary (each question and answer cut to a few dozen tokens),
+and the summary itself drops its oldest lines, so the prompt cost of a turn
+stays flat however long the conversation gets. Sessions live in memory, in
+an LRU bounded by count and evicted after an idle TTL.
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from context_builder import estimate_tokens, truncate_to_tokens
+from retrieval import chunk_key
+from tracing import metrics
+
+SESSION_EVENTS = metrics.counter(
+    "chatbot_session_events_total", "Conversation session lifecycle and reuse events", ("event",))
+
+SUMMARY_QUESTION_TOKENS = 40
+SUMMARY_ANSWER_TOKENS = 60
+
+class Session:
+    """One conversation: recent turns, a summary of older ones, and reusable chunks and tool results"""
+
+    def __init__(self, session_id, history_tokens=1500, max_chunks=12, max_tool_results=8,
+                 reusable_tools=(), clock=time.monotonic):
+        self.session_id = session_id
+        self.history_tokens = history_tokens
+        self.max_chunks = max_chunks
+        self.max_tool_results = max_tool_results
+        self.reusable_tools = frozenset(reusable_tools)
+        self.clock = clock
+        self.created_at = clock()
+        self.used_at = self.created_at
+
+        self.turns = []  # [{"user", "assistant", "tokens"}]
+        self.summary = []  # one line per compacted turn, oldest first
+        self.compacted_turns = 0
+        self._chunks = OrderedDict()  # chunk key -> chunk, most recent last
+        self._tool_results = OrderedDict()  # (name, arguments json) -> (corpus version, result)
+        self._lock = threading.Lock()
+
+    def history_messages(self):
+        """Chat messages carrying the conversation so far (summary first)"""
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({"role": "system",
+                                 "content": "Summary of earlier turns in this conversation:\n" + "\n".join(self.summary)})
+            for turn in self.turns:
+                messages.append({"role": "user", "content": turn["user"]})
+                messages.append({"role": "assistant", "content": turn["assistant"]})
+            return messages
+
+    def context_chunks(self, fresh_chunks):
+        """Fresh search results followed by chunks earlier turns retrieved (no duplicates)"""
+        with self._lock:
+            seen = {chunk_key(chunk) for chunk in fresh_chunks or []}
+            earlier = [chunk for key, chunk in reversed(self._chunks.items()) if key not in seen]
+        if earlier:
+            SESSION_EVENTS.inc(event="chunks_reused")
+        return list(fresh_chunks or []) + earlier
+
+    def tool_result(self, name, arguments, corpus_version=None, max_tokens=None):
+        """(True, result) when an earlier turn made this reusable call over the same corpus, else (False, None)
+
+        Paged results are sized to the turn's tool budget, so `max_tokens` is
+        part of what makes two calls the same.
+        """
+        if name not in self.reusable_tools:
+            return False, None
+        key = (name, json.dumps(arguments, sort_keys=True, default=str), max_tokens)
+        with self._lock:
+            entry = self._tool_results.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] != corpus_version:
+                del self._tool_results[key]
+                return False, None
+            self._tool_results.move_to_end(key)
+            result = entry[1]
+        SESSION_EVENTS.inc(event="tool_result_reused")
+        return True, result
+
+    def remember_tool_result(self, name, arguments, result, corpus_version=None, max_tokens=None):
+        """Keep a successful result of a reusable tool, whole, with the corpus version it was fetched at"""
+        if name not in self.reusable_tools:
+            return
+        if result is None or (isinstance(result, dict) and "error" in result):
+            return
+        key = (name, json.dumps(arguments, sort_keys=True, default=str), max_tokens)
+        with self._lock:
+            self._tool_results[key] = (corpus_version, result)
+            self._tool_results.move_to_end(key)
+            while len(self._tool_results) > self.max_tool_results:
+                self._tool_results.popitem(last=False)
+
+    def add_turn(self, user_message, answer, context_chunks=()):
+        """Record a finished turn, then compact the history back into its budget
+
+        `context_chunks` is the turn's context in prompt order, as returned by
+        context_chunks(): this turn's search results first, then earlier
+        chunks from most to least recent. They are stored back to front, so
+        the fresh results end up most recent and older chunks are evicted
+        first.
+        """
+        with self._lock:
+            self.used_at = self.clock()
+            self.turns.append({"user": user_message, "assistant": answer or "",
+                               "tokens": estimate_tokens(user_message) + estimate_tokens(answer or "")})
+            for chunk in reversed(list(context_chunks or ())):
+                key = chunk_key(chunk)
+                self._chunks[key] = chunk
+                self._chunks.move_to_end(key)
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+            self._compact()
+
+    def _compact(self):
+        # The summary may use a third of the budget; the remaining turns the rest
+        summary_budget = self.history_tokens // 3
+        turn_budget = self.history_tokens - summary_budget
+        while len(self.turns) > 1 and sum(turn["tokens"] for turn in self.turns) > turn_budget:
+            turn = self.turns.pop(0)
+            self.summary.append(
+                f"- User: {truncate_to_tokens(turn['user'], SUMMARY_QUESTION_TOKENS)}"
+                f" | Assistant: {truncate_to_tokens(turn['assistant'], SUMMARY_ANSWER_TOKENS)}")
+            self.compacted_turns += 1
+            SESSION_EVENTS.inc(event="turn_compacted")
+        if self.turns and self.turns[0]["tokens"] > turn_budget:
+            # A single oversized turn: keep the question, cut the answer
+            turn = self.turns[0]
+            answer_budget = max(0, turn_budget - estimate_tokens(turn["user"]))
+            turn["assistant"] = truncate_to_tokens(turn["assistant"], answer_budget)
+            turn["tokens"] = estimate_tokens(turn["user"]) + estimate_tokens(turn["assistant"])
+        while self.summary and sum(estimate_tokens(line) for line in self.summary) > summary_budget:
+            self.summary.pop(0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "turns": len(self.turns) + self.compacted_turns,
+                "compacted_turns": self.compacted_turns,
+                "history_tokens": sum(turn["tokens"] for turn in self.turns)
+                + sum(estimate_tokens(line) for line in self.summary),
+                "chunks": len(self._chunks),
+                "tool_results": len(self._tool_results)
+            }
+
+class SessionStore:
+    """Thread-safe LRU of sessions, each evicted after `ttl` idle seconds"""
+
+    def __init__(self, max_sessions=10000, ttl=1800, history_tokens=1500, max_chunks=12, max_tool_results=8,
+                 reusable_tools=(), clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.max_chunks = max_chunks
+        self.max_tool_results = max_tool_results
+        self.reusable_tools = reusable_tools
+        self.clock = clock
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def open(self, session_id=None):
+        """Resume the live session `session_id`, else start a new one (with a fresh ID)"""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.used_at = now
+                self.resumed += 1
+                SESSION_EVENTS.inc(event="resumed")
+                return session
+
+            session = Session(secrets.token_urlsafe(16), self.history_tokens, self.max_chunks,
+                              self.max_tool_results, self.reusable_tools, self.clock)
+            self._sessions[session.session_id] = session
+            self.created += 1
+            SESSION_EVENTS.inc(event="created")
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            return session
+
+    def _expire(self, now):
+        # Least recently used first, so stop at the first live session
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.used_at <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+            SESSION_EVENTS.inc(event="expired")
+
+    def stats(self):
+        with self._lock:
+            self._expire(self.clock())
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "history_tokens": self.history_tokens,
+                "created": self.created,
+                "resumed": self.resumed,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
@@ -0,0 +1,140 @@
+"""
+Single-flight coalescing of identical concurrent DocMgr calls
+
+When a listing or a popular search is hot (for example right after the search
+cache was invalidated), many chats ask DocMgr the same thing at the same
+moment. A SingleFlight lets the first caller for a key run the call while
+every identical caller that arrives before it finishes waits for, and shares,
+that one result. Nothing is cached: once the call returns, the next caller
+starts a fresh one.
+
+Methods of ChatbotAPI / AsyncChatbotAPI opt in with the `coalesced`
+decorator, which is a no-op when the instance has no `single_flight`.
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+
+from tracing import metrics
+
+DEDUPLICATED = metrics.counter(
+    "chatbot_docmgr_deduplicated_total", "DocMgr calls answered by an identical call already in flight", ("operation",))
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Shares one in-flight call per key between threads (`do`) or tasks (`do_async`)"""
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executed = 0
+        self.deduplicated = 0
+
+    def _count(self, key, leader):
+        self.calls += 1
+        if leader:
+            self.executed += 1
+        else:
+            self.deduplicated += 1
+            DEDUPLICATED.inc(operation=key[0] if isinstance(key, tuple) else key)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs), or wait for the identical call already running"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(key, leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Coroutine version of `do`; a cancelled waiter does not cancel the shared call"""
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+                task.add_done_callback(lambda _: self._forget_task(key))
+            self._count(key, leader)
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key):
+        with self._lock:
+            self._tasks.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "deduplicated": self.deduplicated,
+                "in_flight": len(self._calls) + len(self._tasks)
+            }
+
+def coalesced(key=None):
+    """Method decorator routing calls through `self.single_flight`
+
+    Calls share a key when the method name and the bound arguments (defaults
+    applied) match; `key(*args, **kwargs)` replaces the argument part, e.g.
+    to treat differently-cased queries as one.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        def make_key(self, args, kwargs):
+            """Flight key, or None to call straight through (unbound or unhashable arguments)"""
+            try:
+                if key is not None:
+                    flight_key = (method.__name__,) + tuple(key(*args, **kwargs))
+                else:
+                    bound = signature.bind(self, *args, **kwargs)
+                    bound.apply_defaults()
+                    flight_key = (method.__name__,) + tuple(bound.arguments.values())[1:]
+                hash(flight_key)
+                return flight_key
+            except (TypeError, ValueError):
+                return None
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                flight_key = make_key(self, args, kwargs) if self.single_flight is not None else None
+                if flight_key is None:
+                    return await method(self, *args, **kwargs)
+                return await self.single_flight.do_async(flight_key, method, self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            flight_key = make_key(self, args, kwargs) if self.single_flight is not None else None
+            if flight_key is None:
+                return method(self, *args, **kwargs)
+            return self.single_flight.do(flight_key, method, self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for /api/chat admission control (no running services needed)
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_rate_limiter_refuses_a_key_past_its_burst():
+    """Each key gets its own bucket; a refusal says when the next token arrives"""
+    clock = FakeClock()
+    limiter = RateLimiter(rate=0.5, burst=2, clock=clock)
+    limiter.check("key:a")
+    limiter.check("key:a")
+
+    with pytest.raises(AdmissionRejected) as refused:
+        limiter.check("key:a")
+    assert (refused.value.status, refused.value.reason, refused.value.retry_after) == (429, "rate_limited", 2)
+
+    limiter.check("key:b")
+    clock.now = 2.0
+    limiter.check("key:a")
+    assert limiter.stats()["limited"] == 1
+
+def test_short_requests_are_admitted_before_long_ones():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_delay=5)
+    first = controller.acquire(priority=1)
+    order = []
+
+    def chat(name, priority):
+        ticket = controller.acquire(priority=priority)
+        order.append(name)
+        ticket.release()
+
+    threads = []
+    for name, priority in (("long-1", 1), ("long-2", 1), ("short", 0)):
+        threads.append(threading.Thread(target=chat, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.02)
+    assert controller.stats()["queued"] == 3
+
+    first.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["short", "long-1", "long-2"]
+    assert controller.stats()["in_flight"] == 0
+
+def test_early_rejection_when_the_queue_is_full_or_too_slow():
+    """A full queue, or an expected wait past the target, is refused at once with 503"""
+    clock = FakeClock()
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_queue_delay=2, clock=clock)
+
+    ticket = controller.acquire()
+    queued = threading.Thread(target=lambda: controller.acquire().release())
+    queued.start()
+    time.sleep(0.02)
+
+    with pytest.raises(AdmissionRejected) as refused:
+        controller.acquire()
+    assert (refused.value.status, refused.value.reason) == (503, "queue_full")
+    ticket.release()
+    queued.join()
+
+    # Chats now hold their slot for ~3s, so even the first queued chat expects to wait too long
+    controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_delay=2, clock=clock)
+    ticket = controller.acquire()
+    clock.now += 3
+    ticket.release()
+    ticket = controller.acquire()
+    with pytest.raises(AdmissionRejected) as refused:
+        controller.acquire()
+    assert (refused.value.reason, refused.value.retry_after) == ("queue_delay", 3)
+    assert controller.stats()["rejected"] == 1
+
+def test_async_waiters_time_out_and_get_released_slots():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_delay=0.05)
+        held = await controller.acquire_async()
+        with pytest.raises(AdmissionRejected) as refused:
+            await controller.acquire_async()
+        assert refused.value.reason == "queue_timeout"
+
+        waiting = asyncio.ensure_future(controller.acquire_async(priority=0))
+        await asyncio.sleep(0.01)
+        held.release()
+        ticket = await waiting
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["admitted"], stats["in_flight"], stats["queued"], stats["rejected"]) == (2, 0, 0, 1)
+
+def test_concurrent_queue_timeouts_are_all_counted():
+    controller = AdmissionController(max_concurrent=1, max_queue=20, max_queue_delay=0.05)
+    held = controller.acquire()
+    reasons = []
+
+    def wait():
+        try:
+            controller.acquire().release()
+        except AdmissionRejected as e:
+            reasons.append(e.reason)
+
+    waiters = [threading.Thread(target=wait) for _ in range(16)]
+    for waiter in waiters:
+        waiter.start()
+    for waiter in waiters:
+        waiter.join()
+    held.release()
+
+    assert reasons == ["queue_timeout"] * 16
+    assert controller.stats()["rejected"] == 16
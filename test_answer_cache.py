@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script for the chat answer cache (no running services needed)
+"""
+
+from answer_cache import AnswerCache, SemanticAnswerCache, answer_key, replay_chunks
+from local_index import HashingEmbedder
+
+def test_key_covers_question_context_model_and_corpus():
+    """Near-identical questions share a key; other context, model, temperature or corpus do not"""
+    key = answer_key("What is ERR-1042?", ["1_0", "2_3"], "llama3-8b-8192", 0.7, "v1")
+
+    assert answer_key("  what is err-1042", ["1_0", "2_3"], "llama3-8b-8192", 0.74, "v1") == key
+    assert answer_key("What is ERR-1042?", ["2_3", "1_0"], "llama3-8b-8192", 0.7, "v1") != key
+    assert answer_key("What is ERR-1042?", ["1_0", "2_3"], "llama3-70b-8192", 0.7, "v1") != key
+    assert answer_key("What is ERR-1042?", ["1_0", "2_3"], "llama3-8b-8192", 0.2, "v1") != key
+    assert answer_key("What is ERR-1042?", ["1_0", "2_3"], "llama3-8b-8192", 0.7, "v2") != key
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = AnswerCache(max_entries=2, max_bytes=100)
+    cache.put("a", "answer a")
+    cache.put("b", "answer b")
+    cache.get("a")
+    cache.put("c", "answer c")
+
+    assert cache.get("b") is None
+    assert cache.get("a")["text"] == "answer a"
+
+    cache.put("big", "x" * 101)
+    assert cache.get("big") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_store_survives_restart_and_corpus_change_clears_it(tmp_path):
+    path = str(tmp_path / "answers.db")
+    cache = AnswerCache(path=path)
+    cache.set_corpus_version("v1")
+    cache.put("k", "cached answer", [{"name": "get_vector_stats", "arguments": "{}"}])
+
+    restarted = AnswerCache(path=path)
+    entry = restarted.get("k")
+    assert entry["tool_calls"][0]["name"] == "get_vector_stats"
+    assert restarted.stats()["disk_hits"] == 1
+
+    restarted.set_corpus_version("v1")
+    assert restarted.get("k") is not None
+    restarted.set_corpus_version("v2")
+    assert restarted.get("k") is None
+    assert AnswerCache(path=path).stats()["disk_entries"] == 0
+
+def test_replay_chunks_break_on_words_and_rejoin():
+    text = "The quarterly revenue report covers three regions and two product lines."
+    pieces = replay_chunks(text, 20)
+
+    assert "".join(pieces) == text
+    assert all(len(piece) <= 20 for piece in pieces)
+    assert all(piece.endswith(" ") for piece in pieces[:-1])
+    assert replay_chunks(text, 0) == [text]
+
+def test_semantic_cache_serves_similar_questions_for_the_same_model_and_corpus():
+    cache = SemanticAnswerCache(HashingEmbedder(), threshold=0.8, sample_rate=1.0)
+    cache.set_corpus_version("v1")
+    chunks = ["1_0", "2_0"]
+    cache.put("What documents do we have?", "You have 3 documents.", [], "llama3-8b-8192", 0.7, chunks)
+
+    entry, similarity = cache.lookup("what documents do we have", "llama3-8b-8192", 0.7, chunks)
+    assert entry["text"] == "You have 3 documents." and similarity > 0.99
+    assert cache.lookup("How do I rotate the API keys?", "llama3-8b-8192", 0.7, chunks) is None
+    assert cache.lookup("What documents do we have?", "llama3-70b-8192", 0.7, chunks) is None
+
+    stats = cache.stats()
+    assert (stats["lookups"], stats["hits"]) == (3, 1)
+    assert stats["samples"][0]["matched"] == "What documents do we have?"
+
+    cache.set_corpus_version("v2")
+    assert cache.lookup("What documents do we have?", "llama3-8b-8192", 0.7, chunks) is None
+
+def test_semantic_cache_misses_near_identical_questions_about_different_things():
+    """The hashing embedder scores these pairs above 0.9; their retrieved chunks tell them apart"""
+    cache = SemanticAnswerCache(HashingEmbedder(), threshold=0.9)
+    question = "Summarize the revenue, margin and headcount figures reported in the {} annual report for the board"
+    regional = "Summarize the revenue, margin and headcount figures reported for the {} region in the board pack"
+    cache.put(question.format(2023), "2023: $4M revenue.", [], "m", 0.7, ["ar2023_0", "ar2023_1", "board_0"])
+    cache.put(regional.format("EMEA"), "EMEA: $1M revenue.", [], "m", 0.7, ["emea_0", "emea_1"])
+
+    similarity = cache._embed(question.format(2023)) @ cache._embed(question.format(2024))
+    assert similarity >= 0.9
+    assert cache.lookup(question.format(2024), "m", 0.7, ["ar2024_0", "ar2024_1", "board_0"]) is None
+    assert cache.lookup(regional.format("APAC"), "m", 0.7, ["apac_0", "apac_1"]) is None
+
+    # The same question over mostly the same chunks still hits, and without chunks nothing does
+    entry, _ = cache.lookup(question.format(2023).lower(), "m", 0.7, ["ar2023_0", "ar2023_1"])
+    assert entry["text"] == "2023: $4M revenue."
+    assert cache.lookup(question.format(2023), "m", 0.7, []) is None
+
+def test_semantic_cache_replaces_the_oldest_question_when_full():
+    cache = SemanticAnswerCache(HashingEmbedder(), threshold=0.95, max_entries=2)
+    for question in ("alpha report summary", "beta invoice totals", "gamma server errors"):
+        cache.put(question, f"answer about {question}", [], "m", 0.7, [question])
+
+    assert cache.lookup("alpha report summary", "m", 0.7, ["alpha report summary"]) is None
+    assert cache.lookup("gamma server errors", "m", 0.7, ["gamma server errors"])[0]["text"] == "answer about gamma server errors"
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for client disconnects and blocking work on the ASGI streaming path (no running services needed)
+"""
+
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import asgi_app
+from admission import AdmissionController
+
+def slow_events(produced, closed):
+    async def events():
+        try:
+            for index in range(1000):
+                produced.append(index)
+                yield f"data: {index}\n\n"
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(True)
+    return events()
+
+def disconnect_after(sent, messages):
+    async def receive():
+        while len(sent) < messages:
+            await asyncio.sleep(0.005)
+        return {"type": "http.disconnect"}
+    return receive
+
+def test_disconnect_closes_the_event_generator():
+    produced, closed, sent = [], [], []
+
+    async def send(message):
+        sent.append(message)
+
+    result = asyncio.run(asgi_app.send_stream(send, slow_events(produced, closed), receive=disconnect_after(sent, 4)))
+    assert result is False
+    assert closed == [True] and len(produced) < 10
+    assert sent[-1].get("more_body") is True
+
+    # A stream that runs to its end finishes the response and stops watching for a disconnect
+    async def never_disconnects():
+        await asyncio.sleep(3600)
+
+    async def short():
+        yield "data: only\n\n"
+
+    sent.clear()
+    assert asyncio.run(asgi_app.send_stream(send, short(), receive=never_disconnects)) is True
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+def test_disconnected_chat_releases_its_admission_slot(monkeypatch):
+    produced, closed, sent = [], [], []
+    admission = AdmissionController(max_concurrent=1)
+    monkeypatch.setattr(asgi_app, "admission", admission)
+    monkeypatch.setattr(asgi_app, "generate_chat_stream_async",
+                        lambda *args: slow_events(produced, closed))
+    body = json.dumps({"message": "What is in the Q3 report?", "stream": True}).encode("utf-8")
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+    disconnect = disconnect_after(sent, 4)
+
+    async def receive():
+        return requests.pop(0) if requests else await disconnect()
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await asyncio.wait_for(asgi_app.chat({"type": "http", "headers": []}, receive, send), timeout=2)
+
+    asyncio.run(run())
+    assert closed == [True] and len(produced) < 10
+    assert admission.stats()["in_flight"] == 0
+
+def test_answer_cache_lookups_run_off_the_event_loop(monkeypatch):
+    """The sqlite answer cache is read and written from worker threads, even without the semantic cache"""
+    threads = []
+    monkeypatch.setattr(asgi_app, "semantic_cache", None)
+    monkeypatch.setattr(asgi_app, "lookup_answer", lambda *args: threads.append(threading.current_thread()))
+    monkeypatch.setattr(asgi_app, "store_answer", lambda *args: threads.append(threading.current_thread()))
+
+    async def run():
+        await asgi_app.lookup_answer_async("question", "key", [], None)
+        await asgi_app.store_answer_async("question", "key", [], "answer")
+        assert await asgi_app.lookup_answer_async("question", None, [], None) is None
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2 and loop_thread not in threads
+
+def test_closing_the_stream_cancels_running_tool_calls(monkeypatch):
+    started, cancelled = [], []
+
+    async def slow_tool_call(tool_call, trace=None, session=None, max_tokens=None):
+        started.append(tool_call.function.name)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(tool_call.function.name)
+            raise
+
+    async def create(**kwargs):
+        async def chunks():
+            fragment = SimpleNamespace(index=0, id="call-1",
+                                       function=SimpleNamespace(name="get_vector_stats", arguments="{}"))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[fragment]))])
+        return chunks()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(asgi_app, "GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(asgi_app, "answer_cache_key", lambda *args: None)
+    monkeypatch.setattr(asgi_app, "semantic_cache", None)
+    monkeypatch.setattr(asgi_app, "run_tool_call_async", slow_tool_call)
+    monkeypatch.setattr(asgi_app.llm_clients, "get_async_client", lambda: client)
+
+    async def run():
+        events = asgi_app.generate_chat_response_stream_async("How many chunks are indexed?", [])
+        async for event in events:
+            if "function_call" in event:
+                break
+        await asyncio.sleep(0.05)
+        await events.aclose()
+        return list(cancelled)
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=2)) == ["get_vector_stats"]
+    assert started == ["get_vector_stats"]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Test script for token-budgeted context assembly (no running services needed)
+"""
+
+import json
+
+from context_builder import build_context, estimate_tokens, fit_tool_result
+
+def make_chunk(filename, content, distance):
+    return {"content": content, "metadata": {"original_filename": filename}, "distance": distance}
+
+def test_context_prefers_relevant_chunks_and_respects_budget():
+    """The closest chunk goes first and an oversized one is cut to the budget"""
+    chunks = [
+        make_chunk("big.txt", "filler " * 5000, 0.6),
+        make_chunk("answer.txt", "The invoice total is 42 EUR", 0.1),
+    ]
+    context = build_context(chunks, 300)
+
+    assert context.startswith("Document: answer.txt")
+    assert "Document: big.txt" in context
+    assert estimate_tokens(context) <= 300
+
+def test_large_list_results_are_summarized():
+    """Long listings keep leading items and say how many were dropped"""
+    documents = [{"id": i, "filename": f"doc{i}.pdf", "content": "x" * 4000} for i in range(1000)]
+    text = fit_tool_result(documents, 800)
+    payload = json.loads(text)
+
+    assert estimate_tokens(text) <= 800
+    assert payload["truncated"] is True
+    assert payload["total_items"] == 1000
+    assert 0 < payload["returned_items"] == len(payload["items"])
+
+def test_small_results_pass_through_unchanged():
+    result = {"total_documents": 3}
+    assert fit_tool_result(result, 100) == json.dumps(result)
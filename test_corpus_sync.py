@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental corpus sync (no running services needed)
+"""
+
+import threading
+import time
+
+from corpus_sync import CorpusSync
+
+class FakeDocMgrAPI:
+    def __init__(self, documents=3):
+        self.documents = {
+            document_id: {"id": document_id, "file_size": 100, "upload_date": "2024-01-01", "chunk_count": 1}
+            for document_id in range(1, documents + 1)
+        }
+        self.chunk_requests = []
+        self.fail = set()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_all_documents(self):
+        return list(self.documents.values())
+
+    def get_vector_stats(self):
+        return {"total_documents": len(self.documents)}
+
+    def get_document_chunks(self, document_id):
+        with self._lock:
+            self.chunk_requests.append(document_id)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        if document_id in self.fail:
+            return []
+        return [{"id": f"{document_id}_0", "content": f"document {document_id}", "metadata": {}}]
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, changed, removed, corpus_version):
+        self.calls.append((sorted(changed), sorted(removed)))
+
+def test_only_changed_documents_are_fetched(tmp_path):
+    api = FakeDocMgrAPI()
+    recorder = Recorder()
+    sync = CorpusSync(api, str(tmp_path / "state.json"), recorder)
+
+    assert sync.sync().as_dict()["added"] == 3
+    api.chunk_requests.clear()
+
+    api.documents[2]["file_size"] = 200
+    api.documents[4] = {"id": 4, "file_size": 10, "upload_date": "2024-02-01", "chunk_count": 1}
+    del api.documents[3]
+    result = sync.sync()
+
+    assert sorted(api.chunk_requests) == [2, 4]
+    assert (result.added, result.updated, result.removed, result.unchanged) == (["4"], ["2"], ["3"], 1)
+    assert recorder.calls[-1] == (["2", "4"], ["3"])
+
+    assert not sync.sync().changed
+    assert len(recorder.calls) == 2
+    assert [document["id"] for document in sync.documents()] == [1, 2, 4]
+
+def test_state_survives_restart_and_failures_are_retried(tmp_path):
+    api = FakeDocMgrAPI()
+    api.fail = {2}
+    state_path = str(tmp_path / "state.json")
+    first = CorpusSync(api, state_path, Recorder())
+    assert first.sync().failed == ["2"]
+
+    api.fail = set()
+    api.chunk_requests.clear()
+    restarted = CorpusSync(api, state_path, Recorder())
+    assert restarted.documents() == first.documents()
+    result = restarted.sync()
+    assert api.chunk_requests == [2]
+    assert result.added == ["2"]
+
+def test_fetches_are_bounded_and_failed_updates_are_not_saved(tmp_path):
+    api = FakeDocMgrAPI(documents=12)
+
+    def failing(changed, removed, corpus_version):
+        raise RuntimeError("index write failed")
+
+    sync = CorpusSync(api, str(tmp_path / "state.json"), failing, workers=3)
+    try:
+        sync.sync()
+    except RuntimeError:
+        pass
+    assert api.peak_in_flight <= 3
+    assert sync.stats()["documents"] == 0
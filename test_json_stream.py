@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental JSON array parsing of DocMgr listings (no running services needed)
+"""
+
+import json
+
+import pytest
+
+from context_builder import ItemBudget
+from json_stream import JSONArrayParser
+
+def pieces(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+def test_items_come_out_as_soon_as_they_are_complete():
+    """Items split anywhere, even inside a UTF-8 character or a number, parse the same as a whole body"""
+    items = [{"id": i, "title": f"Résumé {i}", "tags": ["a", "b"]} for i in range(50)] + [12345, "x", None, True]
+    body = json.dumps(items).encode("utf-8")
+
+    for size in (1, 3, 7, 4096):
+        parser = JSONArrayParser()
+        seen = []
+        for piece in pieces(body, size):
+            seen.extend(parser.feed(piece))
+        assert parser.close() is None
+        assert seen == items
+
+    parser = JSONArrayParser()
+    assert parser.feed(b'[{"id": 1}, {"id": 2}, {"id"') == [{"id": 1}, {"id": 2}]
+    assert parser.feed(b': 3}]') == [{"id": 3}]
+    assert parser.done and parser.items == 3
+
+def test_other_bodies_and_broken_arrays():
+    parser = JSONArrayParser()
+    assert parser.feed(b'{"detail": ') == []
+    assert parser.feed(b'"not a list"}') == []
+    assert parser.close() == {"detail": "not a list"}
+
+    parser = JSONArrayParser()
+    parser.feed(b'[{"id": 1}, {"id": 2')
+    with pytest.raises(ValueError):
+        parser.close()
+
+    with pytest.raises(ValueError):
+        JSONArrayParser().feed(b'[1 2]')
+
+def test_budget_stops_reading_a_large_listing_early():
+    """Only the pieces up to the first item over the budget are read"""
+    chunks = [{"chunk_index": i, "content": "word " * 400} for i in range(5000)]
+    body = json.dumps(chunks).encode("utf-8")
+    parser = JSONArrayParser()
+    budget = ItemBudget(max_tokens=3000)
+    kept = []
+    read = 0
+    for piece in pieces(body, 64 * 1024):
+        read += len(piece)
+        fitting = [item for item in parser.feed(piece) if budget.take(item)[0]]
+        kept.extend(fitting)
+        if budget.truncated:
+            break
+
+    assert budget.truncated and 0 < len(kept) < 50
+    assert read < len(body) / 50
+
+    budget = ItemBudget(max_items=2)
+    assert [budget.take(chunk)[0] for chunk in chunks[:3]] == [True, True, False]
+    assert ItemBudget().take(chunks[0])[1]["content"].endswith("...[truncated]")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for paged, filtered and projected document and chunk listings (no running services needed)
+"""
+
+import json
+
+from json_stream import JSONArrayParser
+from listings import CHUNK_FIELDS, DOCUMENT_FIELDS, Page, paginate, parse_listing_query
+
+DOCUMENTS = [
+    {"id": i, "filename": f"report_{i}.{'pdf' if i % 2 else 'txt'}", "original_filename": f"Report {i}",
+     "file_type": "pdf" if i % 2 else "txt", "file_size": 1000 * i, "upload_date": f"2024-01-{i:02d}T09:00:00",
+     "chunk_count": i}
+    for i in range(1, 21)
+]
+
+def test_arguments_are_validated_and_capped():
+    query, error = parse_listing_query({"limit": "500", "offset": 5, "fields": ["filename"], "file_type": ".PDF"},
+                                       DOCUMENT_FIELDS, 20, max_limit=100, filters=True)
+    assert error is None
+    assert (query.limit, query.offset, query.fields, query.file_type) == (100, 5, ("id", "filename"), "pdf")
+    assert parse_listing_query({}, CHUNK_FIELDS, 20)[0] == (20, 0, None, None, None, None, None)
+
+    assert "unknown fields" in parse_listing_query({"fields": ["password"]}, DOCUMENT_FIELDS, 20)[1]
+    assert parse_listing_query({"offset": -1}, DOCUMENT_FIELDS, 20)[1] == "offset must not be negative"
+    assert "ISO date" in parse_listing_query({"uploaded_after": "last week"}, DOCUMENT_FIELDS, 20, filters=True)[1]
+
+def test_filtered_pages_follow_on_from_next_offset():
+    arguments = {"limit": 3, "fields": ["filename"], "file_type": "pdf",
+                 "uploaded_after": "2024-01-04", "uploaded_before": "2024-01-15"}
+    query, _ = parse_listing_query(arguments, DOCUMENT_FIELDS, 20, filters=True)
+    first = paginate(DOCUMENTS, query)
+    assert [item["id"] for item in first["items"]] == [5, 7, 9]
+    assert first["items"][0] == {"id": 5, "filename": "report_5.pdf"}
+    assert (first["next_offset"], first["total_items"]) == (3, 5)
+
+    query, _ = parse_listing_query({**arguments, "offset": first["next_offset"]}, DOCUMENT_FIELDS, 20, filters=True)
+    second = paginate(DOCUMENTS, query)
+    assert [item["id"] for item in second["items"]] == [11, 13]
+    assert second["next_offset"] is None
+
+    query, _ = parse_listing_query({"filename": "REPORT_1"}, DOCUMENT_FIELDS, 20, filters=True)
+    assert [item["id"] for item in paginate(DOCUMENTS, query)["items"]] == [1] + list(range(10, 20))
+
+def test_streamed_page_stops_reading_once_full():
+    """A page over DocMgr's streamed listing reads only as far as offset + limit + 1 items"""
+    chunks = [{"id": f"7_{i}", "content": "word " * 200, "metadata": {"chunk_index": i}} for i in range(2000)]
+    body = json.dumps(chunks).encode("utf-8")
+    query, _ = parse_listing_query({"limit": 5, "offset": 10, "fields": ["content"]}, CHUNK_FIELDS, 20)
+    parser = JSONArrayParser()
+    page = Page(query, max_tokens=3000)
+    read = 0
+    full = False
+    for start in range(0, len(body), 4096):
+        read += 4096
+        full = not all(page.add(item) for item in parser.feed(body[start:start + 4096]))
+        if full:
+            break
+
+    result = page.result()
+    assert full and read < len(body) / 50
+    assert [item["id"] for item in result["items"]] == [f"7_{i}" for i in range(10, 15)]
+    assert set(result["items"][0]) == {"id", "content"} and result["next_offset"] == 15
+
+    # A page that runs into the token budget is cut short and can be continued
+    small = Page(query, max_tokens=400)
+    for item in chunks:
+        if not small.add(item):
+            break
+    cut = small.result()
+    assert cut["truncated"] and 0 < cut["returned_items"] < 5
+    assert cut["next_offset"] == 10 + cut["returned_items"]
+
+def test_page_under_budget_keeps_content_whole():
+    """Long text is only shortened for the item that would not otherwise fit"""
+    chunks = [{"id": f"7_{i}", "content": "x" * 1000, "metadata": {"chunk_index": i}} for i in range(3)]
+    query, _ = parse_listing_query({"limit": 1}, CHUNK_FIELDS, 20)
+    assert paginate(chunks, query, max_tokens=3000)["items"][0]["content"] == "x" * 1000
+
+    query, _ = parse_listing_query({"limit": 3}, CHUNK_FIELDS, 20)
+    items = paginate(chunks, query, max_tokens=500)["items"]
+    assert items[0]["content"] == "x" * 1000
+    assert len(items) == 2 and items[1]["content"].endswith("...[truncated]")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-process embedding index (no running services needed)
+"""
+
+import local_index
+from local_index import HashingEmbedder, LocalVectorIndex, load_embedder
+
+DOCUMENTS = {
+    "1": ({"id": 1, "original_filename": "invoices.txt"}, [
+        {"id": "1_0", "content": "invoice total amount due march", "metadata": {"document_id": 1}},
+    ]),
+    "2": ({"id": 2, "original_filename": "security.txt"}, [
+        {"id": "2_0", "content": "security policy for password rotation", "metadata": {"document_id": 2}},
+        {"id": "2_1", "content": "backup and incident response runbook", "metadata": {"document_id": 2}},
+    ]),
+}
+
+def test_search_matches_docmgr_result_shape(tmp_path):
+    index = LocalVectorIndex(str(tmp_path), HashingEmbedder())
+    index.apply_changes(DOCUMENTS, [])
+
+    results = index.search("password security policy", n_results=2)
+    assert [result["id"] for result in results][0] == "2_0"
+    assert set(results[0]) == {"id", "content", "metadata", "distance"}
+    assert results[0]["metadata"]["original_filename"] == "security.txt"
+    assert results[0]["distance"] < results[1]["distance"]
+
+def test_index_is_reloaded_from_disk(tmp_path):
+    LocalVectorIndex(str(tmp_path), HashingEmbedder()).apply_changes(DOCUMENTS, [], "v1")
+
+    reloaded = LocalVectorIndex(str(tmp_path), HashingEmbedder())
+    assert reloaded.load()
+    assert reloaded.stats()["chunks"] == 3
+    assert reloaded.corpus_version == "v1"
+    assert reloaded.search("invoice amount", n_results=1)[0]["id"] == "1_0"
+    assert [chunk["id"] for chunk in reloaded.document_chunks(2)] == ["2_0", "2_1"]
+
+def test_changes_only_embed_changed_documents(tmp_path):
+    index = LocalVectorIndex(str(tmp_path), HashingEmbedder())
+    index.apply_changes(DOCUMENTS, [])
+
+    replacement = {"2": (DOCUMENTS["2"][0], [
+        {"id": "2_0", "content": "vacation schedule for the summer", "metadata": {"document_id": 2}},
+    ])}
+    index.apply_changes(replacement, ["1"])
+
+    assert index.stats()["last_update_embedded"] == 1
+    assert [result["id"] for result in index.search("invoice vacation", n_results=5)] == ["2_0"]
+    assert index.search("vacation schedule", n_results=1)[0]["content"] == "vacation schedule for the summer"
+    assert [chunk["id"] for chunk in index.document_chunks("2")] == ["2_0"]
+    assert index.document_chunks(1) == []
+
+def test_unloadable_model_falls_back_to_hashing(monkeypatch):
+    """A model download failing at startup leaves the server on the hashing embedder"""
+    def unreachable(model_name):
+        raise OSError(f"could not download {model_name}")
+
+    monkeypatch.setattr(local_index, "SentenceTransformerEmbedder", unreachable)
+    assert isinstance(load_embedder("all-MiniLM-L6-v2"), HashingEmbedder)
+    assert load_embedder().name == "hashing"
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for chat model routing, hedging and failover (no running services needed)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from model_router import ModelRouter, ModelTier, prime_stream, prime_stream_async
+
+def make_router(**kwargs):
+    return ModelRouter(ModelTier("fast", "small-model", 800, 400), ModelTier("large", "big-model", 1000, 500),
+                       **kwargs)
+
+def test_routes_by_prompt_size_and_tool_questions():
+    router = make_router(large_prompt_tokens=1000, fallback_models=["backup-model"])
+
+    route = router.route("Summarize the findings across these reports", 1500)
+    assert (route.tier.name, route.reason, route.models) == ("large", "large_prompt", ["big-model", "small-model", "backup-model"])
+    assert router.route("How many documents are there?", 1500).tier.name == "fast"
+    assert router.route("What is ERR-1042?", 200).reason == "small_prompt"
+    assert router.route("What is ERR-1042?", 200).starting_with("backup-model").models[0] == "backup-model"
+
+def test_failover_and_demotion_of_a_failing_model():
+    """Errors move on to the next model at once, and a model that keeps failing is tried last"""
+    router = make_router(min_samples=3)
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        if model == "small-model":
+            raise RuntimeError("over capacity")
+        return f"answer from {model}"
+
+    for _ in range(3):
+        route = router.route("What is ERR-1042?", 100)
+        assert router.run(route, attempt) == ("big-model", "answer from big-model")
+    assert calls == ["small-model", "big-model"] * 3
+
+    assert router.route("What is ERR-1042?", 100).models == ["big-model", "small-model"]
+    assert router.stats()["fallbacks"] == 3
+
+def test_slow_first_token_is_hedged_and_the_loser_closed():
+    router = make_router(hedge_after=0.05)
+    closed = []
+
+    class Stream:
+        def __init__(self, model, delay):
+            self.model = model
+            self.delay = delay
+
+        def __iter__(self):
+            time.sleep(self.delay)
+            yield f"{self.model}: first"
+            yield f"{self.model}: second"
+
+        def close(self):
+            closed.append(self.model)
+
+    def attempt(model):
+        return prime_stream(Stream(model, 0.5 if model == "small-model" else 0.0))
+
+    started = time.perf_counter()
+    model, stream = router.run(router.route("What is ERR-1042?", 100), attempt, discard=lambda s: s.close())
+    assert time.perf_counter() - started < 0.3
+    assert model == "big-model" and list(stream) == ["big-model: first", "big-model: second"]
+
+    time.sleep(0.6)
+    assert closed == ["small-model"]
+    assert router.stats()["hedges"] == 1
+
+def test_async_hedging_and_failover():
+    router = make_router(hedge_after=0.05, fallback_models=["backup-model"])
+
+    async def attempt(model):
+        if model == "big-model":
+            raise RuntimeError("over capacity")
+        await asyncio.sleep(1.0 if model == "small-model" else 0.01)
+        return model
+
+    async def run():
+        return await router.run_async(router.route("What is ERR-1042?", 100), attempt)
+
+    # small-model is slow, so it is hedged on the other tier, which fails over to backup-model
+    assert asyncio.run(run()) == ("backup-model", "backup-model")
+    assert (router.stats()["hedges"], router.stats()["fallbacks"]) == (1, 1)
+
+    async def failing(model):
+        raise RuntimeError(f"{model} down")
+
+    async def run_failing():
+        return await router.run_async(router.route("What is ERR-1042?", 100), failing)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_failing())
+
+def test_async_hedge_cancelled_before_its_first_chunk_is_closed():
+    router = make_router(hedge_after=0.05)
+    closed = []
+
+    class AsyncStream:
+        def __init__(self, model, delay):
+            self.model = model
+            self.delay = delay
+
+        async def __aiter__(self):
+            await asyncio.sleep(self.delay)
+            yield f"{self.model}: first"
+
+        async def close(self):
+            closed.append(self.model)
+
+    async def attempt(model):
+        return await prime_stream_async(AsyncStream(model, 1.0 if model == "small-model" else 0.0))
+
+    async def run():
+        return await router.run_async(router.route("What is ERR-1042?", 100), attempt,
+                                      discard=lambda stream: stream.close())
+
+    model, stream = asyncio.run(run())
+    assert model == "big-model" and stream.first == "big-model: first"
+    assert closed == ["small-model"]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for DocMgr circuit breakers, hedged calls and deadlines (no running services needed)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitOpen, DeadlineExceeded, DocMgrResilience, deadline_scope
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_then_lets_one_trial_through():
+    clock = FakeClock()
+    resilience = DocMgrResilience(failure_threshold=3, reset_timeout=10, clock=clock)
+    operation = "POST /api/search"
+
+    for _ in range(3):
+        resilience.admit(operation)
+        resilience.record(operation, 0.1, False)
+    with pytest.raises(CircuitOpen) as rejected:
+        resilience.admit(operation)
+    assert rejected.value.retry_after == 10
+    assert not resilience.healthy(operation)
+
+    # After the reset timeout one trial goes out; a failed trial reopens the breaker at once
+    clock.now = 10
+    resilience.admit(operation)
+    with pytest.raises(CircuitOpen):
+        resilience.admit(operation)
+    resilience.record(operation, 0.1, False)
+    with pytest.raises(CircuitOpen):
+        resilience.admit(operation)
+
+    clock.now = 20
+    resilience.admit(operation)
+    resilience.record(operation, 0.1, True)
+    assert resilience.healthy(operation)
+    assert resilience.stats()["breakers"][operation] == {
+        "state": "closed", "consecutive_failures": 0, "times_opened": 2, "rejected": 3}
+
+    # Breakers are per operation
+    resilience.admit("GET /api/documents")
+
+def test_deadline_scope_limits_and_then_stops_calls():
+    resilience = DocMgrResilience()
+    assert resilience.admit("GET /api/documents") is None
+
+    with deadline_scope(time.perf_counter() + 5):
+        assert 4 < resilience.admit("GET /api/documents") <= 5
+        with deadline_scope(time.perf_counter() - 1):
+            with pytest.raises(DeadlineExceeded):
+                resilience.admit("GET /api/documents")
+        assert resilience.admit("GET /api/documents") > 4
+    assert resilience.admit("GET /api/documents") is None
+    assert resilience.stats()["deadline_exceeded"] == 1
+
+def warmed_up(latency=0.01):
+    resilience = DocMgrResilience(hedge_min_samples=5)
+    for _ in range(5):
+        resilience.record("POST /api/search", latency, True)
+    return resilience
+
+def test_slow_call_is_hedged_past_the_recent_p95():
+    resilience = warmed_up()
+    delays = [0.5, 0.0]
+
+    def call():
+        delay = delays.pop(0)
+        time.sleep(delay)
+        return delay
+
+    started = time.perf_counter()
+    assert resilience.hedged("POST /api/search", call) == 0.0
+    assert time.perf_counter() - started < 0.3
+    assert (resilience.hedges, resilience.hedges_won) == (1, 1)
+
+    # A fast call is not duplicated
+    assert resilience.hedged("POST /api/search", lambda: "fast") == "fast"
+    assert resilience.hedges == 1
+
+    # Without enough samples there is no p95 to hedge at
+    assert DocMgrResilience().hedged("POST /api/search", lambda: "unhedged") == "unhedged"
+
+def test_async_hedge_and_the_deadline_reach_both_calls():
+    resilience = warmed_up()
+    delays = [1.0, 0.0]
+    deadlines = []
+
+    async def call():
+        deadlines.append(resilience.admit("POST /api/search"))
+        await asyncio.sleep(delays.pop(0))
+        return "answer"
+
+    async def run():
+        with deadline_scope(time.perf_counter() + 5):
+            return await resilience.hedged_async("POST /api/search", call)
+
+    assert asyncio.run(run()) == "answer"
+    assert len(deadlines) == 2 and all(0 < left <= 5 for left in deadlines)
+    assert resilience.hedges_won == 1
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for hybrid BM25 + vector retrieval (no running services needed)
+"""
+
+import threading
+import time
+
+from resilience import deadline_scope, time_left
+from retrieval import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+from tracing import RequestTrace
+
+def chunk(chunk_id, content, document_id=1):
+    return {"id": chunk_id, "content": content, "metadata": {"document_id": document_id}}
+
+def test_bm25_finds_exact_identifiers_and_updates_incrementally():
+    index = BM25Index()
+    index.add_document(1, [chunk("1_0", "Payment failed with error ERR-1042 during checkout"),
+                           chunk("1_1", "General notes about payments and checkout flows")])
+    index.add_document(2, [chunk("2_0", "Release v2.3.1 fixes the login timeout", 2)])
+
+    assert "err-1042" in tokenize("ERR-1042") and "1042" in tokenize("ERR-1042")
+    assert index.search("what does ERR-1042 mean", 1)[0][0]["id"] == "1_0"
+    assert index.search("v2.3.1", 1)[0][0]["id"] == "2_0"
+
+    index.remove_document(1)
+    assert index.search("ERR-1042", 5) == []
+    assert index.stats()["chunks"] == 1 and index.stats()["documents"] == 1
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    a, b, c = chunk("a", "a"), chunk("b", "b"), chunk("c", "c")
+    fused = reciprocal_rank_fusion([[a, b], [b, c]], k=60)
+    assert [item["id"] for item, _ in fused] == ["b", "a", "c"]
+
+def test_hybrid_search_falls_back_to_keywords_when_vector_search_is_slow():
+    index = BM25Index()
+    index.add_document(1, [chunk("1_0", "Error code E-77 means the disk is full")])
+
+    def slow_vector_search(query, n_results):
+        time.sleep(0.5)
+        return [chunk("9_0", "unrelated", 9)]
+
+    retriever = HybridRetriever(index, slow_vector_search, vector_budget=0.05)
+    started = time.perf_counter()
+    results = retriever.search("E-77", n_results=3)
+    assert time.perf_counter() - started < 0.3
+    assert [result["id"] for result in results] == ["1_0"]
+    assert results[0]["score"] == 1.0
+
+def test_vector_search_sees_the_request_deadline():
+    index = BM25Index()
+    seen = []
+
+    def vector_search(query, n_results):
+        seen.append(time_left())
+        return []
+
+    # The vector stage is cut off at its own budget, or sooner when the request's deadline is closer
+    retriever = HybridRetriever(index, vector_search, vector_budget=0.8)
+    retriever.search("E-77")
+    with deadline_scope(time.perf_counter() + 0.3):
+        retriever.search("E-77")
+    assert 0.7 < seen[0] <= 0.8 and 0.2 < seen[1] <= 0.3
+
+def test_vector_stage_is_skipped_while_every_worker_is_busy():
+    """Searches that outlived their budget never queue up behind each other"""
+    index = BM25Index()
+    index.add_document(1, [chunk("1_0", "Error code E-77 means the disk is full")])
+    release = threading.Event()
+    calls = []
+
+    def stuck_vector_search(query, n_results):
+        calls.append(query)
+        release.wait(2)
+        return []
+
+    retriever = HybridRetriever(index, stuck_vector_search, vector_budget=0.02, vector_workers=2)
+    trace = RequestTrace()
+    for _ in range(5):
+        assert [result["id"] for result in retriever.search("E-77", trace=trace)] == ["1_0"]
+    statuses = [span["status"] for span in trace.spans if span["name"] == "retrieval_vector"]
+    assert len(calls) == 2 and statuses == ["timeout", "timeout"] + ["saturated"] * 3
+
+    release.set()
+    time.sleep(0.05)
+    retriever.search("E-77")
+    assert len(calls) == 3
+
+def test_reranker_reorders_fused_head():
+    index = BM25Index()
+    index.add_document(1, [chunk("1_0", "backup schedule"), chunk("1_1", "backup restore steps")])
+
+    class ReverseReranker:
+        name = "reverse"
+
+        def score(self, query, chunks):
+            return [float(i) for i in range(len(chunks))]
+
+    retriever = HybridRetriever(index, lambda query, n: [], reranker=ReverseReranker())
+    fused_order = [result["id"] for result in HybridRetriever(index, lambda query, n: []).search("backup", 2)]
+    reranked = retriever.search("backup", 2)
+    assert [result["id"] for result in reranked] == fused_order[::-1]
+    assert reranked[0]["score"] > reranked[1]["score"]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test script for the DocMgr search result cache (no running services needed)
+"""
+
+import time
+
+from search_cache import SearchCache, corpus_fingerprint, normalize_query
+
+def test_normalized_queries_share_an_entry():
+    """Case, whitespace and trailing punctuation should not split the cache"""
+    cache = SearchCache()
+    cache.put("What documents do I have?", 3, [{"id": 1}])
+
+    assert normalize_query("  what   DOCUMENTS do i have ") == "what documents do i have"
+    assert cache.get("what documents do I have", 3) == [{"id": 1}]
+    assert cache.get("what documents do I have", 5) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_ttl_and_lru_eviction():
+    """Expired entries miss and the least recently used entry is evicted first"""
+    cache = SearchCache(ttl=0.05, max_entries=2)
+    cache.put("a", 3, [1])
+    cache.put("b", 3, [2])
+    cache.get("a", 3)
+    cache.put("c", 3, [3])
+
+    assert cache.get("b", 3) is None
+    assert cache.get("a", 3) == [1]
+    assert cache.stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert cache.get("c", 3) is None
+    assert cache.stats()["expirations"] == 1
+
+def test_corpus_change_invalidates_entries():
+    """A new corpus fingerprint clears the cache and rejects in-flight stale puts"""
+    cache = SearchCache()
+    cache.set_corpus_version(corpus_fingerprint({"total_chunks": 10}))
+    cache.put("a", 3, [1])
+    generation = cache.generation
+
+    cache.set_corpus_version(corpus_fingerprint({"total_chunks": 12}))
+    cache.put("b", 3, [2], generation)
+
+    assert cache.get("a", 3) is None
+    assert cache.get("b", 3) is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_expired_results_are_kept_for_stale_reads():
+    """Within stale_ttl an expired entry misses for get() but is still served by get_stale()"""
+    cache = SearchCache(ttl=0.05, stale_ttl=0.2)
+    cache.put("a", 3, [1])
+
+    time.sleep(0.06)
+    assert cache.get("a", 3) is None
+    assert cache.get_stale("a", 3) == [1]
+    assert cache.stats()["stale_hits"] == 1
+
+    time.sleep(0.2)
+    assert cache.get_stale("a", 3) is None
+    assert cache.get("a", 3) is None
+    assert cache.stats()["expirations"] == 1
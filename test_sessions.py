@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script for multi-turn conversation sessions (no running services needed)
+"""
+
+from context_builder import estimate_tokens
+from sessions import Session, SessionStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def chunk(document_id, index, content="text"):
+    return {"content": content, "metadata": {"document_id": document_id, "chunk_index": index}}
+
+def test_history_stays_within_its_token_budget():
+    """Old turns are folded into a summary, so history stops growing"""
+    session = Session("s", history_tokens=300)
+    answer = "The quarterly report lists revenue by region and product line. " * 8
+    sizes = []
+    for turn in range(20):
+        session.add_turn(f"What does report {turn} say about revenue?", answer)
+        messages = session.history_messages()
+        sizes.append(sum(estimate_tokens(message["content"]) for message in messages))
+
+    assert max(sizes) <= 300 + 20
+    assert sizes[-1] == sizes[-5]
+    assert messages[0]["role"] == "system" and "report 18" in messages[0]["content"]
+    assert [message["role"] for message in messages[1:]] == ["user", "assistant"]
+    assert "report 19" in messages[1]["content"]
+    assert session.stats()["turns"] == 20
+
+def test_earlier_chunks_and_tool_results_are_reused():
+    session = Session("s", max_chunks=3, reusable_tools=("get_document_by_id", "get_document_chunks"))
+    session.add_turn("first", "answer", [chunk(1, 0), chunk(1, 1)])
+    session.add_turn("second", "answer", [chunk(2, 0), chunk(1, 1)])
+
+    context = session.context_chunks([chunk(2, 0, "fresh"), chunk(3, 0)])
+    assert [c["metadata"]["document_id"] for c in context] == [2, 3, 1, 1]
+    assert context[0]["content"] == "fresh"
+
+    assert session.tool_result("get_document_by_id", {"document_id": 7}) == (False, None)
+    session.remember_tool_result("get_document_by_id", {"document_id": 7}, {"id": 7, "title": "Q3"})
+    session.remember_tool_result("get_vector_stats", {}, {"error": "DocMgr is down"})
+    assert session.tool_result("get_document_by_id", {"document_id": 7}) == (True, {"id": 7, "title": "Q3"})
+    assert session.tool_result("get_vector_stats", {}) == (False, None)
+
+def test_only_document_scoped_tool_results_are_reused_and_only_over_the_same_corpus():
+    session = Session("s", reusable_tools=("get_document_chunks",))
+    listing = {"items": [{"id": 1}], "offset": 0, "returned_items": 1, "next_offset": None}
+    session.remember_tool_result("get_all_documents", {}, listing, "v1")
+    assert session.tool_result("get_all_documents", {}, "v1") == (False, None)
+
+    # The whole result is kept, however large, not the copy cut down for one prompt
+    chunks = {"items": [{"id": f"7_{i}", "content": "word " * 400} for i in range(40)], "offset": 0}
+    session.remember_tool_result("get_document_chunks", {"document_id": 7}, chunks, "v1")
+    assert session.tool_result("get_document_chunks", {"document_id": 7}, "v1") == (True, chunks)
+
+    # After an upload the corpus version moves on and the call is made again
+    assert session.tool_result("get_document_chunks", {"document_id": 7}, "v2") == (False, None)
+    assert session.tool_result("get_document_chunks", {"document_id": 7}, "v1") == (False, None)
+
+def test_fresh_chunks_survive_eviction_across_turns():
+    """Each turn's own search results stay in the session; the oldest turns' chunks go first"""
+    session = Session("s", max_chunks=6)
+    for turn in range(1, 5):
+        fresh = [chunk(turn, index) for index in range(3)]
+        session.add_turn(f"question {turn}", "answer", session.context_chunks(fresh))
+        stored = [(c["metadata"]["document_id"], c["metadata"]["chunk_index"]) for c in session.context_chunks([])]
+        previous = [(turn - 1, index) for index in range(3)] if turn > 1 else []
+        assert stored == [(turn, index) for index in range(3)] + previous
+
+def test_store_resumes_evicts_and_expires_sessions():
+    clock = FakeClock()
+    store = SessionStore(max_sessions=2, ttl=60, clock=clock)
+    first = store.open()
+    assert store.open(first.session_id) is first
+    assert store.open("not-a-session").session_id != "not-a-session"
+
+    store.open()
+    assert store.open(first.session_id) is not first
+    assert store.stats()["evicted"] == 2
+
+    clock.now = 61
+    assert store.stats()["sessions"] == 0
+    assert store.stats()["expired"] == 2
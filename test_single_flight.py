@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for single-flight DocMgr call coalescing (no running services needed)
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from search_cache import SearchCache
+from single_flight import SingleFlight, coalesced
+
+class SlowAPI:
+    def __init__(self, single_flight=None):
+        self.single_flight = single_flight
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @coalesced(key=lambda query, n_results=5: SearchCache.make_key(query, n_results))
+    def search_documents(self, query, n_results=5):
+        with self._lock:
+            self.calls.append((query, n_results))
+        time.sleep(0.1)
+        return [{"id": len(self.calls)}]
+
+    @coalesced()
+    def get_document_by_id(self, document_id):
+        with self._lock:
+            self.calls.append(document_id)
+        time.sleep(0.1)
+        if document_id == "missing":
+            raise LookupError(document_id)
+        return {"id": document_id}
+
+def test_concurrent_identical_calls_share_one_request():
+    """Identical calls in flight together reach the upstream once; later calls start fresh"""
+    api = SlowAPI(SingleFlight())
+    queries = ["What is ERR-1042?", "what is err-1042", "What is ERR-1042?", "what is ERR-1042 ?"]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda query: api.search_documents(query, n_results=3), queries))
+
+    assert len(api.calls) == 1
+    assert all(result is results[0] for result in results)
+    assert api.single_flight.stats() == {"calls": 4, "executed": 1, "deduplicated": 3, "in_flight": 0}
+
+    api.search_documents("what is err-1042", 3)
+    assert len(api.calls) == 2
+
+def test_different_arguments_and_errors():
+    """Different arguments are not merged, and a failure reaches every waiter"""
+    api = SlowAPI(SingleFlight())
+
+    def lookup(document_id):
+        try:
+            return api.get_document_by_id(document_id)
+        except LookupError:
+            return "error"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lookup, [1, 2, "missing", "missing"]))
+
+    assert results == [{"id": 1}, {"id": 2}, "error", "error"]
+    assert sorted(map(str, api.calls)) == ["1", "2", "missing"]
+
+def test_without_single_flight_calls_go_straight_through():
+    api = SlowAPI()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(lambda _: api.get_document_by_id(1), range(3)))
+    assert len(api.calls) == 3
+
+def test_async_calls_share_one_task():
+    """Coroutine callers share one task, and cancelling one caller leaves the others served"""
+    calls = []
+
+    class AsyncAPI:
+        single_flight = SingleFlight()
+
+        @coalesced()
+        async def get_all_documents(self):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return [{"id": 1}]
+
+    async def run():
+        api = AsyncAPI()
+        tasks = [asyncio.ensure_future(api.get_all_documents()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        tasks[0].cancel()
+        results = await asyncio.gather(*tasks[1:])
+        return results, api.single_flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert calls == [1]
+    assert results == [[{"id": 1}]] * 4
+    assert stats["deduplicated"] == 4 and stats["in_flight"] == 0
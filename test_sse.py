@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test script for SSE event encoding and content coalescing (no running services needed)
+"""
+
+import json
+
+from sse import SSEWriter, encode_event
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def parse(text):
+    return [json.loads(line[6:]) for line in text.split("\n") if line.startswith("data: ")]
+
+def test_encoder_matches_json_dumps():
+    for event_type, content in (("content", 'quote " newline \n unicode é 😀'), ("start", ""), ("typing", "typing")):
+        expected = "data: " + json.dumps({"type": event_type, "content": content}) + "\n\n"
+        assert encode_event(event_type, content) == expected
+
+def test_content_is_coalesced_per_window():
+    """After the first token, deltas inside the window become one event"""
+    clock = FakeClock()
+    sse = SSEWriter(window=0.03, max_bytes=1024, clock=clock)
+
+    assert parse(sse.content("First")) == [{"type": "content", "content": "First"}]
+    assert sse.content("Hel") == ""
+    clock.now = 0.01
+    assert sse.content("lo") == ""
+    clock.now = 0.04
+    assert parse(sse.content(" world")) == [{"type": "content", "content": "Hello world"}]
+
+def test_control_events_flush_pending_content_first():
+    sse = SSEWriter(window=10, max_bytes=1024, clock=FakeClock())
+    sse.content("first")
+    sse.content("partial")
+    events = parse(sse.event("end", ""))
+    assert events == [{"type": "content", "content": "partial"}, {"type": "end", "content": ""}]
+
+def test_byte_limit_and_disabled_window():
+    sse = SSEWriter(window=10, max_bytes=5, clock=FakeClock())
+    sse.content("first")
+    assert sse.content("abc") == ""
+    assert parse(sse.content("def")) == [{"type": "content", "content": "abcdef"}]
+
+    unbatched = SSEWriter(window=0)
+    assert parse(unbatched.content("x")) == [{"type": "content", "content": "x"}]
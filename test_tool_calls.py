@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Test script for streamed tool-call assembly (no running services needed)
+"""
+
+from types import SimpleNamespace
+
+from tool_calls import ToolCallAccumulator
+
+def fragment(index, id=None, name=None, arguments=None):
+    """Build a fragment shaped like Groq's streamed `delta.tool_calls` entries"""
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+def test_fragments_are_merged_and_reported_once():
+    """A call is reported when its JSON closes, never on partial arguments"""
+    accumulator = ToolCallAccumulator()
+
+    assert accumulator.add([fragment(0, id="call_a", name="search_documents", arguments="")]) == []
+    assert accumulator.add([fragment(0, arguments='{"query": "inv')]) == []
+    ready = accumulator.add([fragment(0, arguments='oices", "n_results": 3}')])
+
+    assert len(ready) == 1
+    assert ready[0].id == "call_a"
+    assert ready[0].function.name == "search_documents"
+    assert ready[0].function.arguments == '{"query": "invoices", "n_results": 3}'
+    assert accumulator.finish() == []
+
+def test_new_index_closes_previous_call():
+    """Calls without arguments complete when the next index starts or the stream ends"""
+    accumulator = ToolCallAccumulator()
+
+    assert accumulator.add([fragment(0, id="call_a", name="get_all_documents")]) == []
+    ready = accumulator.add([fragment(1, id="call_b", name="get_vector_stats")])
+    assert [call.id for call in ready] == ["call_a"]
+
+    remaining = accumulator.finish()
+    assert [call.id for call in remaining] == ["call_b"]
+    assert [call.index for call in accumulator.calls] == [0, 1]
+
+def test_missing_id_gets_a_stable_fallback():
+    accumulator = ToolCallAccumulator()
+    accumulator.add([fragment(0, name="get_api_info", arguments="{}")])
+    assert accumulator.calls[0].id == "call_0"
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for running a model turn's tool calls and the follow-up completion (no running services needed)
+"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import app
+from resilience import DocMgrResilience
+from tracing import RequestTrace
+
+class FakeDocMgrAPI:
+    """Document lookups that take `delays[document_id]` seconds; vector stats always fail"""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.running = 0
+        self.peak_running = 0
+        self._lock = threading.Lock()
+
+    def get_document_by_id(self, document_id):
+        with self._lock:
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+        time.sleep(self.delays[document_id])
+        with self._lock:
+            self.running -= 1
+        return {"id": document_id, "title": f"Report {document_id}"}
+
+    def get_vector_stats(self):
+        raise RuntimeError("DocMgr is down")
+
+def tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+def completion(content="", tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+class FakeGroqClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append({**kwargs, "messages": list(kwargs["messages"])})
+        return self.responses.pop(0)
+
+def test_tool_calls_run_concurrently_and_keep_call_order(monkeypatch):
+    api = FakeDocMgrAPI({1: 0.3, 2: 0.1, 3: 0.2})
+    monkeypatch.setattr(app, "chatbot_api", api)
+    calls = [tool_call(f"call_{i}", "get_document_by_id", document_id=i) for i in (1, 2, 3)]
+
+    started = time.perf_counter()
+    results = app.execute_tool_calls(calls)
+    assert time.perf_counter() - started < 0.5
+    assert api.peak_running == 3
+    assert [result["id"] for result in results] == [1, 2, 3]
+
+def test_one_follow_up_completion_carries_every_result_including_a_failure(monkeypatch):
+    api = FakeDocMgrAPI({1: 0.1, 2: 0.1})
+    calls = [
+        tool_call("call_a", "get_document_by_id", document_id=1),
+        tool_call("call_b", "get_vector_stats"),
+        tool_call("call_c", "get_document_by_id", document_id=2),
+    ]
+    client = FakeGroqClient([completion(tool_calls=calls), completion("Reports 1 and 2; stats unavailable.")])
+    monkeypatch.setattr(app, "chatbot_api", api)
+    monkeypatch.setattr(app, "GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(app, "answer_cache", None)
+    monkeypatch.setattr(app, "semantic_cache", None)
+    monkeypatch.setattr(app.llm_clients, "get_client", lambda: client)
+
+    chunks = [{"id": "1_0", "content": "Q3 revenue grew", "metadata": {"document_id": 1}}]
+    answer = app.generate_chat_response("Compare reports 1 and 2", chunks)
+
+    assert answer == "Reports 1 and 2; stats unavailable."
+    assert len(client.requests) == 2
+    assert "tools" in client.requests[0] and "tools" not in client.requests[1]
+    tool_messages = [message for message in client.requests[1]["messages"] if message["role"] == "tool"]
+    assert [message["tool_call_id"] for message in tool_messages] == ["call_a", "call_b", "call_c"]
+    assert json.loads(tool_messages[0]["content"])["id"] == 1
+    assert "DocMgr is down" in json.loads(tool_messages[1]["content"])["error"]
+    assert json.loads(tool_messages[2]["content"])["id"] == 2
+
+def test_non_numeric_n_results_is_rejected_not_a_500(monkeypatch):
+    """A bad n_results is a 400 on /api/search and an error result for the tool"""
+    monkeypatch.setattr(app, "chatbot_api", FakeDocMgrAPI({}))
+    response = app.app.test_client().post("/api/search", json={"query": "revenue", "n_results": "abc"})
+    assert response.status_code == 400
+    assert "n_results" in response.get_json()["error"]
+    result = app.execute_function_call("search_documents", {"query": "revenue", "n_results": "abc"})
+    assert "n_results" in result["error"]
+
+def test_unregistered_tool_names_share_one_metric_label(monkeypatch):
+    """A tool name the model made up is traced as "unknown" rather than as a new series"""
+    monkeypatch.setattr(app, "chatbot_api", FakeDocMgrAPI({}))
+    trace = RequestTrace()
+    app.run_tool_call(tool_call("call-1", "delete_everything"), trace)
+    app.run_tool_call(tool_call("call-2", "get_vector_stats"), trace)
+    assert [span["tool"] for span in trace.spans if span["name"] == "tool"] == ["unknown", "get_vector_stats"]
+
+def test_pages_fit_each_calls_share_of_the_tool_budget(monkeypatch):
+    """Several listing calls in one turn get pages sized to their share, never cut mid-JSON"""
+    chunks = [{"id": f"7_{i}", "content": "word " * 200, "metadata": {"chunk_index": i}} for i in range(50)]
+    monkeypatch.setattr(app, "local_index", SimpleNamespace(document_chunks=lambda document_id: chunks))
+    monkeypatch.setattr(app, "TOOL_RESULT_TOKEN_BUDGET", 3000)
+    calls = [tool_call(f"call-{i}", "get_document_chunks", document_id=7, offset=i * 10) for i in range(3)]
+
+    messages = []
+    app.append_tool_results(messages, calls, app.execute_tool_calls(calls))
+    for message in messages[1:]:
+        page = json.loads(message["content"])
+        assert 0 < page["returned_items"] < 10 and page["next_offset"] is not None
+
+def test_open_breaker_is_reported_to_the_model_as_an_outage(monkeypatch):
+    """With DocMgr's breaker open, listings report the outage instead of an empty corpus"""
+    resilience = DocMgrResilience(failure_threshold=1)
+    for operation in ("GET /api/documents", "GET /api/vector/stats"):
+        resilience.record(operation, 0.1, False)
+    api = app.ChatbotAPI("http://127.0.0.1:9", resilience=resilience)
+    monkeypatch.setattr(app, "corpus_sync", None)
+
+    for name in ("get_all_documents", "get_vector_stats"):
+        assert app.execute_function_call(name, {}, api=api) == {"error": "Document service temporarily unavailable"}
+    assert api.refresh_corpus_version() is None
+
+def test_document_listing_is_live_once_the_sync_is_stale(monkeypatch):
+    """A recent sync answers get_all_documents with its time; an old one falls back to DocMgr"""
+    class LiveAPI:
+        def get_all_documents(self, listing, max_tokens=None):
+            return {"items": [{"id": 2}], "offset": 0, "returned_items": 1, "next_offset": None}
+
+    synced = SimpleNamespace(documents=lambda: [{"id": 1}], synced_at=time.time() - 10)
+    monkeypatch.setattr(app, "corpus_sync", synced)
+    monkeypatch.setattr(app, "CORPUS_LISTING_MAX_AGE", 60)
+    result = app.execute_function_call("get_all_documents", {}, api=LiveAPI())
+    assert result["items"] == [{"id": 1}] and result["synced_at"].endswith("Z")
+
+    synced.synced_at = time.time() - 600
+    assert app.execute_function_call("get_all_documents", {}, api=LiveAPI())["items"] == [{"id": 2}]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for request tracing and the Prometheus metrics output (no running services needed)
+"""
+
+from tracing import MetricsRegistry, RequestTrace
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_spans_are_recorded_in_breakdown():
+    clock = FakeClock()
+    trace = RequestTrace("req-1", clock=clock)
+
+    with trace.span("retrieval"):
+        clock.now = 0.05
+    with trace.span("tool", tool="get_all_documents"):
+        clock.now = 0.08
+    trace.record("llm_first", 0.02, 0.2)
+    clock.now = 0.3
+
+    breakdown = trace.breakdown()
+    assert breakdown["request_id"] == "req-1"
+    assert breakdown["total_ms"] == 300.0
+    assert [span["name"] for span in breakdown["spans"]] == ["retrieval", "llm_first", "tool"]
+    assert breakdown["spans"][2]["tool"] == "get_all_documents"
+    assert breakdown["spans"][2]["duration_ms"] == 30.0
+
+def test_failed_span_is_marked_as_error():
+    trace = RequestTrace()
+    try:
+        with trace.span("retrieval"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert trace.breakdown()["spans"][0]["status"] == "error"
+    assert len(trace.request_id) == 16
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo", ("phase",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, phase="retrieval")
+    histogram.observe(0.5, phase="retrieval")
+    registry.counter("demo_total", "Demo", ("status",)).inc(status="ok")
+
+    lines = registry.render().splitlines()
+    assert '# TYPE demo_seconds histogram' in lines
+    assert 'demo_seconds_bucket{phase="retrieval",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{phase="retrieval",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{phase="retrieval",le="+Inf"} 2' in lines
+    assert 'demo_seconds_count{phase="retrieval"} 2' in lines
+    assert 'demo_total{status="ok"} 1' in lines
@@ -0,0 +1,95 @@
+"""
+Assembly of streamed tool calls
+
+Groq streams a tool call as several `delta.tool_calls` fragments that share
+an index: the first usually carries the id and function name, the rest carry
+pieces of the JSON arguments. ToolCallAccumulator merges the fragments and
+reports each call exactly once, as soon as its arguments are complete, so it
+can be dispatched while the rest of the token stream is still arriving.
+"""
+
+import json
+
+class ToolCallFunction:
+    def __init__(self, name=None, arguments=""):
+        self.name = name
+        self.arguments = arguments
+
+class ToolCall:
+    """A fully assembled tool call, shaped like the Groq SDK's tool call objects"""
+
+    def __init__(self, index, id=None, name=None, arguments=""):
+        self.index = index
+        self.id = id
+        self.type = "function"
+        self.function = ToolCallFunction(name, arguments)
+        self.dispatched = False
+
+    def arguments_complete(self):
+        """True once the accumulated arguments form a JSON object"""
+        arguments = self.function.arguments.strip()
+        if not arguments:
+            return False
+        if not arguments.endswith("}"):
+            return False
+        try:
+            return isinstance(json.loads(arguments), dict)
+        except ValueError:
+            return False
+
+class ToolCallAccumulator:
+    """Merges streamed tool-call fragments by index"""
+
+    def __init__(self):
+        self._calls = {}
+
+    @property
+    def calls(self):
+        """Every call seen so far, in index order"""
+        return [self._calls[index] for index in sorted(self._calls)]
+
+    def add(self, fragments):
+        """Merge one chunk's `delta.tool_calls`; return calls that just became complete"""
+        ready = []
+        for fragment in fragments or []:
+            index = getattr(fragment, "index", None)
+            if index is None:
+                index = len(self._calls)
+
+            call = self._calls.get(index)
+            if call is None:
+                # Tool calls stream one after another, so a new index closes the previous ones
+                ready.extend(self._take_pending(before=index))
+                call = self._calls[index] = ToolCall(index)
+
+            if getattr(fragment, "id", None):
+                call.id = fragment.id
+            function = getattr(fragment, "function", None)
+            if function is not None:
+                if getattr(function, "name", None):
+                    call.function.name = function.name
+                if getattr(function, "arguments", None):
+                    call.function.arguments += function.arguments
+
+            if not call.dispatched and call.function.name and call.arguments_complete():
+                ready.append(self._dispatch(call))
+        return ready
+
+    def finish(self):
+        """Return every call that has not been reported yet (end of stream)"""
+        return self._take_pending()
+
+    def _take_pending(self, before=None):
+        pending = []
+        for call in self.calls:
+            if before is not None and call.index >= before:
+                continue
+            if not call.dispatched and call.function.name:
+                pending.append(self._dispatch(call))
+        return pending
+
+    def _dispatch(self, call):
+        call.dispatched = True
+        if not call.id:
+            call.id = f"call_{call.index}"
+        return call
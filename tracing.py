@@ -0,0 +1,205 @@
+"""
+Per-request tracing and Prometheus-style metrics
+
+A RequestTrace times the phases of one /api/chat request (retrieval, the
+first LLM completion, each tool call, the follow-up completion) as spans.
+Every finished span is also observed into a process-wide histogram, so
+/api/metrics can show where time goes across all requests while the
+per-request breakdown can be returned to the caller on request.
+"""
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-millisecond) up to slow LLM completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed set of label names"""
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = _format_labels(self.label_names, key)
+                for bound, count in zip(self.buckets, series["counts"]):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+                inf = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {series['count']}")
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+class Counter:
+    """Monotonic counter keyed by a fixed set of label names"""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Gauge:
+    """Current value (e.g. a queue depth) keyed by a fixed set of label names"""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, description, label_names, buckets)
+
+    def counter(self, name, description, label_names=()):
+        return self._get_or_create(Counter, name, description, label_names)
+
+    def gauge(self, name, description, label_names=()):
+        return self._get_or_create(Gauge, name, description, label_names)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+REQUEST_DURATION = metrics.histogram(
+    "chatbot_request_duration_seconds", "End-to-end request duration", ("endpoint", "stream"))
+PHASE_DURATION = metrics.histogram(
+    "chatbot_phase_duration_seconds", "Duration of each /api/chat phase", ("phase",))
+TOOL_DURATION = metrics.histogram(
+    "chatbot_tool_duration_seconds", "Duration of each tool call", ("tool",))
+UPSTREAM_DURATION = metrics.histogram(
+    "chatbot_upstream_request_duration_seconds", "Duration of calls to DocMgr and Groq", ("upstream", "operation", "status"))
+REQUESTS_TOTAL = metrics.counter(
+    "chatbot_requests_total", "Finished requests by outcome", ("endpoint", "status"))
+TIME_TO_FIRST_TOKEN = metrics.histogram(
+    "chatbot_llm_time_to_first_token_seconds", "Time from sending a completion to its first streamed chunk", ("turn",))
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+def observe_upstream(upstream, operation, status, seconds):
+    """Record one DocMgr or Groq call"""
+    UPSTREAM_DURATION.observe(seconds, upstream=upstream, operation=operation, status=status)
+
+class RequestTrace:
+    """Collects timed spans for one request; safe to use from tool worker threads"""
+
+    def __init__(self, request_id=None, clock=time.perf_counter):
+        self.request_id = request_id or new_request_id()
+        self.clock = clock
+        self.started = clock()
+        self.deadline = None  # clock() reading after which DocMgr calls are no longer sent
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time a block as a span; tool spans go to the per-tool histogram"""
+        started = self.clock()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(name, started, self.clock() - started, status=status, **labels)
+
+    def record(self, name, started, duration, status="ok", **labels):
+        """Add a span measured elsewhere (`started` is a clock() reading)"""
+        span = {"name": name, "start_ms": round((started - self.started) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2), "status": status}
+        span.update(labels)
+        with self._lock:
+            self.spans.append(span)
+        if name == "tool":
+            TOOL_DURATION.observe(duration, tool=labels.get("tool", ""))
+        else:
+            PHASE_DURATION.observe(duration, phase=name)
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def breakdown(self):
+        """Timing summary for the SSE `end` event / JSON response"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {"request_id": self.request_id, "total_ms": round(self.elapsed() * 1000, 2), "spans": spans}